@@ -10,7 +10,7 @@ class ConversionJobAdmin(admin.ModelAdmin):
     ]
     list_filter = ['conversion_type', 'status', 'created_at']
     search_fields = ['original_filename', 'converted_filename', 'id']
-    readonly_fields = ['id', 'created_at', 'completed_at', 'file_size_formatted']
+    readonly_fields = ['id', 'created_at', 'completed_at', 'file_size_formatted', 'conversion_details']
     ordering = ['-created_at']
     date_hierarchy = 'created_at'
     
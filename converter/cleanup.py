@@ -0,0 +1,188 @@
+# converter/cleanup.py - Expired job and file cleanup
+"""
+Removes conversion jobs older than a cutoff together with their uploads,
+converted files and any cached artifact no live job still shares.
+
+Each local media directory is listed once with ``os.scandir`` and grouped
+by the job id every stored file name starts with, so the cost is one
+directory pass plus one batch of queries per chunk of expired jobs, however
+many files the directories hold. Files on a remote storage backend are
+deleted by name through the storage API.
+
+Shared files are only deleted after their artifact row, which is locked
+and re-checked for live jobs first: a cache hit may link a new job to an
+artifact at any moment until then.
+"""
+import os
+import time
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ConversionArtifact, ConversionJob
+from .storage import OUTPUT_DIR, UPLOAD_DIR, get_input_storage, get_output_storage, local_path, output_name
+
+logger = logging.getLogger(__name__)
+
+JOB_ID_LENGTH = 36  # str(uuid.uuid4())
+
+
+def get_media_dirs():
+    """Local directory of uploads and converted files, None for each on a remote storage"""
+    return {
+        UPLOAD_DIR: local_path(get_input_storage(), UPLOAD_DIR),
+        OUTPUT_DIR: local_path(get_output_storage(), OUTPUT_DIR),
+    }
+
+
+def scan_job_files(directory):
+    """Map ``job_id -> [DirEntry, ...]`` for files named ``<job_id>_...`` in ``directory``"""
+    files = defaultdict(list)
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                name = entry.name
+                if len(name) > JOB_ID_LENGTH and name[JOB_ID_LENGTH] == '_' and entry.is_file(follow_symlinks=False):
+                    files[name[:JOB_ID_LENGTH]].append(entry)
+    except FileNotFoundError:
+        pass
+    return files
+
+
+def remove_file(path, report, dry_run):
+    """Delete one file, adding it to ``report``; returns False if it was already gone"""
+    try:
+        size = os.stat(path).st_size
+        if not dry_run:
+            os.remove(path)
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.warning(f"Failed to delete {path}: {str(e)}")
+        report['errors'] += 1
+        return False
+    report['files'] += 1
+    report['bytes'] += size
+    return True
+
+
+def remove_stored(storage, name, report, dry_run):
+    """``remove_file`` for a file on a remote storage"""
+    try:
+        if not storage.exists(name):
+            return False
+        size = storage.size(name)
+        if not dry_run:
+            storage.delete(name)
+    except Exception as e:
+        logger.warning(f"Failed to delete {name} from storage: {str(e)}")
+        report['errors'] += 1
+        return False
+    report['files'] += 1
+    report['bytes'] += size
+    return True
+
+
+def delete_unused_artifacts(artifacts, cutoff):
+    """
+    Delete the artifacts in ``{id: converted_filename}`` that still have no
+    job newer than ``cutoff``; returns the deleted ones in the same form.
+    """
+    with transaction.atomic():
+        locked = set(
+            ConversionArtifact.objects.select_for_update().filter(id__in=artifacts).values_list('id', flat=True)
+        )
+        live = set(
+            ConversionJob.objects.filter(artifact_id__in=locked, created_at__gte=cutoff)
+            .values_list('artifact_id', flat=True)
+        )
+        unused = locked - live
+        if unused:
+            ConversionArtifact.objects.filter(id__in=unused).delete()
+    return {artifact_id: artifacts[artifact_id] for artifact_id in unused}
+
+
+def cleanup_old_files(max_age=timedelta(hours=24), dry_run=False, time_budget=None, chunk_size=500):
+    """
+    Delete expired jobs and their files in chunks of ``chunk_size`` jobs.
+
+    Stops between chunks once ``time_budget`` seconds have passed. Returns a
+    report dict with the number of jobs, artifacts and files removed (or that
+    would be removed with ``dry_run``), the bytes freed, and whether the run
+    got through every expired job.
+    """
+    started = time.monotonic()
+    cutoff = timezone.now() - max_age
+    report = {'jobs': 0, 'artifacts': 0, 'files': 0, 'bytes': 0, 'errors': 0, 'complete': True}
+
+    input_storage, output_storage = get_input_storage(), get_output_storage()
+    media_dirs = get_media_dirs()
+    job_files = {name: scan_job_files(path) for name, path in media_dirs.items() if path}
+
+    expired = ConversionJob.objects.filter(created_at__lt=cutoff).order_by('pk')
+    last_pk = None
+    while True:
+        if time_budget is not None and time.monotonic() - started > time_budget:
+            report['complete'] = False
+            break
+
+        page = expired if last_pk is None else expired.filter(pk__gt=last_pk)
+        chunk = list(page.values_list('pk', 'input_path', 'input_paths', 'converted_filename', 'artifact_id')[:chunk_size])
+        if not chunk:
+            break
+        last_pk = chunk[-1][0]
+
+        # Artifacts still used by a job that is not expiring keep their file
+        artifact_ids = {job[-1] for job in chunk if job[-1]}
+        live_artifact_ids = set(
+            ConversionJob.objects.filter(artifact_id__in=artifact_ids, created_at__gte=cutoff)
+            .values_list('artifact_id', flat=True)
+        )
+        artifacts = dict(
+            ConversionArtifact.objects.filter(id__in=artifact_ids).values_list('id', 'converted_filename')
+        )
+        shared_files = set(artifacts.values())
+        dead_artifacts = {artifact_id: name for artifact_id, name in artifacts.items() if artifact_id not in live_artifact_ids}
+
+        for job_id, input_path, input_paths, converted_filename, artifact_id in chunk:
+            for name, files in job_files.items():
+                for entry in files.pop(str(job_id), ()):
+                    # Shared files go below, once their artifact is gone
+                    if name == OUTPUT_DIR and entry.name in shared_files:
+                        continue
+                    remove_file(entry.path, report, dry_run)
+
+            if media_dirs[UPLOAD_DIR] is None:
+                for name in input_paths or ([input_path] if input_path else []):
+                    remove_stored(input_storage, name, report, dry_run)
+            if media_dirs[OUTPUT_DIR] is None and converted_filename and converted_filename not in shared_files:
+                remove_stored(output_storage, output_name(converted_filename), report, dry_run)
+
+        if dead_artifacts and not dry_run:
+            # A cache hit may have linked a new job since live_artifact_ids was read
+            dead_artifacts = delete_unused_artifacts(dead_artifacts, cutoff)
+        report['artifacts'] += len(dead_artifacts)
+
+        # A shared file belongs to whichever job produced it, which may be long gone
+        for converted_filename in set(dead_artifacts.values()):
+            if media_dirs[OUTPUT_DIR] is None:
+                remove_stored(output_storage, output_name(converted_filename), report, dry_run)
+            else:
+                remove_file(os.path.join(media_dirs[OUTPUT_DIR], converted_filename), report, dry_run)
+
+        if dry_run:
+            report['jobs'] += len(chunk)
+            continue
+
+        _, deleted = ConversionJob.objects.filter(pk__in=[job[0] for job in chunk]).delete()
+        report['jobs'] += deleted.get(ConversionJob._meta.label, 0)
+
+    logger.info(
+        f"{'Would clean' if dry_run else 'Cleaned'} up {report['jobs']} old conversion jobs, "
+        f"{report['artifacts']} artifacts and {report['files']} files ({report['bytes']} bytes)"
+        f"{'' if report['complete'] else ', stopped at the time budget'}"
+    )
+    return report
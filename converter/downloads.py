@@ -0,0 +1,161 @@
+# converter/downloads.py - Streaming file delivery for converted files
+import os
+import re
+import logging
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Front-end server offload: header name for each DOWNLOAD_OFFLOAD mode
+OFFLOAD_HEADERS = {
+    'nginx': 'X-Accel-Redirect',
+    'sendfile': 'X-Sendfile',  # Apache mod_xsendfile, lighttpd
+}
+
+
+def file_etag(stat_result):
+    """Strong validator built from size and modification time, no file read needed"""
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """Parse a single ``bytes=`` range into (start, end); None if absent/unsupported, False if unsatisfiable"""
+    if not header:
+        return None
+
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Multiple ranges or other units: serve the whole file instead
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def if_range_matches(request, etag, last_modified):
+    """True when there is no If-Range header or it still matches the file"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(last_modified) <= since
+
+
+def iter_file_range(path, start, length, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """Yield ``length`` bytes of a file from ``start`` in fixed-size chunks"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, path, filename, content_type, as_attachment=True):
+    """
+    Send a file without loading it into memory.
+
+    HEAD requests are answered from ``os.stat`` alone, ``If-None-Match`` and
+    ``If-Modified-Since`` produce 304s, and a single ``Range`` yields a 206.
+    """
+    stat_result = os.stat(path)
+    size = stat_result.st_size
+    etag = file_etag(stat_result)
+    last_modified = stat_result.st_mtime
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if not_modified is not None:
+        if not_modified.status_code == 304:
+            not_modified['ETag'] = etag
+            not_modified['Last-Modified'] = http_date(last_modified)
+        return not_modified
+
+    byte_range = None
+    if request.method == 'GET' and if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = size
+    elif byte_range is not None:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_file_range(path, start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        # FileResponse streams in blocks and uses wsgi.file_wrapper (sendfile) when available
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['Content-Length'] = size
+
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def get_offload_mode():
+    """Return the configured offload mode, or None to stream from Django"""
+    mode = getattr(settings, 'DOWNLOAD_OFFLOAD', None)
+    if mode and mode not in OFFLOAD_HEADERS:
+        logger.warning(f"Unknown DOWNLOAD_OFFLOAD mode '{mode}', streaming from Django")
+        return None
+    return mode or None
+
+
+def offload_file(relative_path, filename, content_type, mode=None):
+    """
+    Let the front-end server send a media file.
+
+    ``relative_path`` is relative to MEDIA_ROOT. nginx receives an internal URI
+    under ``DOWNLOAD_OFFLOAD_URL_PREFIX``; X-Sendfile servers get the absolute
+    filesystem path. Range, HEAD and conditional requests are handled there.
+    """
+    mode = mode or get_offload_mode()
+    response = HttpResponse(content_type=content_type)
+
+    if mode == 'nginx':
+        prefix = getattr(settings, 'DOWNLOAD_OFFLOAD_URL_PREFIX', '/protected-media/')
+        response[OFFLOAD_HEADERS[mode]] = prefix.rstrip('/') + '/' + quote(relative_path.replace(os.sep, '/'))
+    else:
+        response[OFFLOAD_HEADERS[mode]] = os.path.join(str(settings.MEDIA_ROOT), relative_path)
+
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
@@ -0,0 +1,310 @@
+# converter/engine.py - Process-pool conversion engine
+"""
+CPU-bound converters (Pillow decode, ReportLab render) run in a bounded pool
+of warm worker processes so they never hold the web worker's GIL.
+
+Tasks are only handed to the pool when a worker is free, so the task
+timeout runs from when a task starts rather than while it waits. A task
+that times out fails only its own job: its pool is retired, new tasks go
+to a fresh pool, and the retired pool's workers are terminated once
+nothing healthy runs in it.
+
+- ``CONVERSION_ENGINE_WORKERS``: pool size (0 runs converters inline)
+- ``CONVERSION_ENGINE_MAX_QUEUE``: admitted jobs allowed to wait for a worker
+- ``CONVERSION_ENGINE_TASK_TIMEOUT``: seconds a running task gets before its job fails
+- ``CONVERSION_ENGINE_MAX_TASKS_PER_CHILD``: recycle workers to contain memory growth
+"""
+import os
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+
+from django.conf import settings
+
+from . import progress
+
+logger = logging.getLogger(__name__)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+class EngineSaturated(Exception):
+    """Every worker is busy and the wait queue is full"""
+
+
+class ConversionTimeout(Exception):
+    """A conversion task ran past its time limit"""
+
+
+def _init_worker(events=None, worker_pids=None):
+    """Set up Django in a freshly spawned worker so converters can be imported"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'file_converter.settings')
+    import django
+    django.setup()
+    # Progress reported by converters goes back to the parent over this queue
+    progress._sink = events
+    if worker_pids is not None:
+        # Lets the parent terminate this pool's workers if a task hangs
+        worker_pids.put(os.getpid())
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _call_converter(fn, args, kwargs):
+    """Run a converter in a worker and send its stats back with the result"""
+    stats = {}
+    result = fn(*args, stats=stats, **kwargs)
+    return result, stats
+
+
+class WorkerPool:
+    """One ProcessPoolExecutor with the tasks running in it and the pids of its workers"""
+
+    def __init__(self, executor, worker_pids):
+        self.executor = executor
+        self.worker_pids = worker_pids
+        self.pids = set()
+        self.tasks = set()
+        self.closed = False
+
+    def terminate(self):
+        """Stop the pool, terminating its workers; stuck tasks cannot be cancelled any other way"""
+        while True:
+            try:
+                self.pids.add(self.worker_pids.get_nowait())
+            except queue.Empty:
+                break
+        # Only processes that are still our unreaped children, so a recycled pid is never hit
+        for process in multiprocessing.active_children():
+            if process.pid in self.pids:
+                process.terminate()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ConversionEngine:
+    """Bounded ProcessPoolExecutor with admission control and per-task timeouts"""
+
+    def __init__(self, max_workers, max_queue=0, max_tasks_per_child=None, task_timeout=None):
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self.max_tasks_per_child = max_tasks_per_child
+        self.task_timeout = task_timeout
+        self._reserved = 0
+        self._slots_lock = threading.Lock()
+        self._events = None
+        # One slot per worker; held from submission until the task finishes
+        self._worker_slots = threading.Semaphore(max_workers)
+        # Guards the current pool, every pool's tasks and the timed-out tasks
+        self._pool_lock = threading.RLock()
+        self._pool = None
+        self._abandoned = set()
+
+    def _get_pool(self):
+        """The pool new tasks go to, started if needed; call with ``_pool_lock`` held"""
+        if self._pool is None:
+            # max_tasks_per_child needs a non-fork start method
+            context = multiprocessing.get_context('spawn')
+            if self._events is None:
+                self._events = context.Queue()
+                threading.Thread(target=self._relay_events, name='conversion-progress', daemon=True).start()
+            worker_pids = context.Queue()
+            executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._events, worker_pids),
+                max_tasks_per_child=self.max_tasks_per_child,
+            )
+            self._pool = WorkerPool(executor, worker_pids)
+        return self._pool
+
+    def _relay_events(self):
+        """Publish progress events from worker processes in this process"""
+        while True:
+            job_id, event, data = self._events.get()
+            try:
+                progress.publish(job_id, event, **data)
+            except Exception as e:
+                logger.warning(f"Could not relay progress for job {job_id}: {str(e)}")
+
+    def _retire(self, pool):
+        """Stop handing tasks to ``pool``; the next task starts a fresh one"""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+            self._close_if_idle(pool)
+
+    def _close_if_idle(self, pool):
+        """Shut down a retired pool once nothing healthy runs in it; call with ``_pool_lock`` held"""
+        if pool is None or pool is self._pool or pool.closed or not pool.tasks <= self._abandoned:
+            return
+        pool.closed = True
+        if pool.tasks:
+            logger.error("Only timed-out conversion tasks are left running in a retired pool, terminating it")
+            pool.terminate()
+        else:
+            pool.executor.shutdown(wait=False, cancel_futures=True)
+
+    def warm(self):
+        """Start the worker processes ahead of the first conversion"""
+        with self._pool_lock:
+            executor = self._get_pool().executor
+        for _ in range(self.max_workers):
+            executor.submit(_warm_up)
+
+    def reserve(self):
+        """Admit one job or raise EngineSaturated; pair with release()"""
+        with self._slots_lock:
+            if self._reserved >= self.capacity:
+                raise EngineSaturated(f"All {self.capacity} conversion slots are in use")
+            self._reserved += 1
+
+    def release(self):
+        with self._slots_lock:
+            self._reserved = max(self._reserved - 1, 0)
+
+    def has_capacity(self):
+        return self._reserved < self.capacity
+
+    def _submit(self, fn, args, kwargs, block=True):
+        """
+        Submit once a worker is free; returns ``(future, pool, started)``, or
+        None when ``block`` is False and no worker is free.
+        """
+        if not self._worker_slots.acquire(blocking=block):
+            return None
+        try:
+            # Registered in the same critical section, so a pool is never
+            # judged stuck while one of its tasks is untracked
+            with self._pool_lock:
+                pool = self._get_pool()
+                try:
+                    future = pool.executor.submit(_call_converter, fn, args, kwargs)
+                except BrokenProcessPool:
+                    # A worker died between tasks; start over with a fresh pool
+                    self._retire(pool)
+                    pool = self._get_pool()
+                    future = pool.executor.submit(_call_converter, fn, args, kwargs)
+                pool.tasks.add(future)
+        except Exception:
+            self._worker_slots.release()
+            raise
+        future.add_done_callback(partial(self._task_done, pool))
+        return future, pool, time.monotonic()
+
+    def _task_done(self, pool, future):
+        with self._pool_lock:
+            pool.tasks.discard(future)
+            self._abandoned.discard(future)
+            self._close_if_idle(pool)
+        # Only now, so a task waiting for this slot cannot land in a pool being terminated
+        self._worker_slots.release()
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Run ``fn(*args, stats=..., **kwargs)`` in a worker process and return
+        ``(result, stats)``, waiting for a free worker first.
+        """
+        return self._result(*self._submit(fn, args, kwargs), fn)
+
+    def run_many(self, fn, calls, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` for every ``args`` tuple in ``calls`` across
+        free workers, yielding ``(result, stats)`` in submission order.
+        """
+        calls = list(calls)
+        pending = deque()
+        submitted = 0
+        while pending or submitted < len(calls):
+            # Take every free worker, and wait for one only when none of ours is running;
+            # calls not yet submitted are simply dropped if the caller gives up
+            while submitted < len(calls):
+                task = self._submit(fn, calls[submitted], kwargs, block=not pending)
+                if task is None:
+                    break
+                pending.append(task)
+                submitted += 1
+            yield self._result(*pending.popleft(), fn)
+
+    def _result(self, future, pool, started, fn):
+        try:
+            if self.task_timeout is None:
+                return future.result()
+            return future.result(timeout=max(self.task_timeout - (time.monotonic() - started), 0))
+        except FuturesTimeoutError:
+            logger.error(f"Conversion task {fn.__name__} timed out after {self.task_timeout}s")
+            with self._pool_lock:
+                if future in pool.tasks:
+                    # Nothing new may queue up behind a hung worker
+                    self._abandoned.add(future)
+                    self._retire(pool)
+            raise ConversionTimeout(f"Conversion took longer than {self.task_timeout} seconds")
+        except BrokenProcessPool:
+            logger.error(f"Conversion worker died while running {fn.__name__}, restarting pool")
+            self._retire(pool)
+            raise Exception("Conversion worker stopped unexpectedly")
+
+    def shutdown(self):
+        with self._pool_lock:
+            pool = self._pool
+        self._retire(pool)
+
+
+def get_engine():
+    """Return the shared engine, or None when conversions run inline"""
+    global _engine
+    max_workers = getattr(settings, 'CONVERSION_ENGINE_WORKERS', 0)
+    if not max_workers:
+        return None
+
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = ConversionEngine(
+                    max_workers=max_workers,
+                    max_queue=getattr(settings, 'CONVERSION_ENGINE_MAX_QUEUE', 0),
+                    max_tasks_per_child=getattr(settings, 'CONVERSION_ENGINE_MAX_TASKS_PER_CHILD', None),
+                    task_timeout=getattr(settings, 'CONVERSION_ENGINE_TASK_TIMEOUT', None),
+                )
+                engine.warm()
+                _engine = engine
+    return _engine
+
+
+def run_converter(fn, *args, stats=None, **kwargs):
+    """Run a converter through the engine when enabled, otherwise inline"""
+    engine = get_engine()
+    if engine is None:
+        result = fn(*args, stats=stats, **kwargs)
+    else:
+        result, worker_stats = engine.run(fn, *args, **kwargs)
+        if stats is not None:
+            stats.update(worker_stats)
+
+    if stats and 'io_read_bytes' in stats:
+        logger.info(
+            f"{fn.__name__} read {stats['io_read_bytes']} bytes of input, buffered {stats['buffer_bytes']} "
+            f"and wrote {stats['io_write_bytes']} bytes of output"
+        )
+    return result
+
+
+def map_converter(fn, calls, **kwargs):
+    """Run ``fn(*args, **kwargs)`` per ``args`` tuple, in parallel when the engine is enabled; yields results in order"""
+    engine = get_engine()
+    if engine is None:
+        for args in calls:
+            yield fn(*args, **kwargs)
+        return
+
+    for result, _ in engine.run_many(fn, calls, **kwargs):
+        yield result
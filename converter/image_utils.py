@@ -0,0 +1,51 @@
+# converter/image_utils.py - Pixel helpers shared by the converters and previews
+"""
+Small, dependency-free steps every decode path needs: reduced-scale JPEG
+decoding and flattening transparency onto white for formats without alpha.
+EXIF orientation lives in ``orientation``.
+"""
+from PIL import Image
+
+
+def draft_scale(img_size, draw_size, target_dpi):
+    """Largest JPEG DCT reduction (1, 2, 4 or 8) that still gives ``target_dpi`` at the drawn size"""
+    needed_width = draw_size[0] / 72 * target_dpi
+    needed_height = draw_size[1] / 72 * target_dpi
+    scale = 1
+    while scale < 8 and img_size[0] / (scale * 2) >= needed_width and img_size[1] / (scale * 2) >= needed_height:
+        scale *= 2
+    return scale
+
+
+def draft_decode(img, scale):
+    """Have a not yet loaded JPEG decode at 1/``scale`` of its size (other formats are unaffected)"""
+    if scale > 1:
+        img.draft(img.mode, (img.size[0] // scale, img.size[1] // scale))
+    return img
+
+
+def flatten_to_rgb(img):
+    """
+    Return an RGB version of ``img`` with any transparency composited onto white.
+
+    RGBA/LA pixels are pasted straight onto the white background using the
+    image itself as the mask (Pillow reads its alpha band in place), so the
+    only new full-size buffer is the background; palette, colour-keyed or
+    premultiplied transparency costs one extra conversion.
+    """
+    if img.mode == 'RGB' and 'transparency' not in img.info:
+        return img
+
+    if img.mode in ('RGBa', 'La'):
+        # Premultiplied colours would have the alpha applied twice by paste()
+        img = img.convert(img.mode[:-1] + 'A')
+    elif img.mode == 'PA' or 'transparency' in img.info or (img.mode == 'P' and img.palette.mode == 'RGBA'):
+        # Palette alpha or colour-key transparency becomes a real alpha band
+        img = img.convert('RGBA')
+
+    if img.mode not in ('RGBA', 'LA'):
+        return img.convert('RGB')
+
+    background = Image.new('RGB', img.size, (255, 255, 255))
+    background.paste(img, mask=img)
+    return background
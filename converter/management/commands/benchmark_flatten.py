@@ -0,0 +1,78 @@
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from converter.views import flatten_to_rgb
+
+
+def legacy_flatten(img):
+    """The inline routine flatten_to_rgb() replaced, kept for comparison"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        if 'transparency' in img.info:
+            background.paste(img, mask=img.split()[-1])
+        else:
+            background.paste(img)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def sample_images(size):
+    rgba = Image.new('RGBA', size, (200, 30, 30, 128))
+    palette = rgba.convert('RGB').convert('P')
+    keyed = palette.copy()
+    keyed.info['transparency'] = 0
+    # The legacy routine only honoured alpha when a 'transparency' key was set
+    masked = rgba.copy()
+    masked.info['transparency'] = 0
+    return [
+        ('RGBA', rgba),
+        ('RGBA + key', masked),
+        ('LA', rgba.convert('LA')),
+        ('P + transparency', keyed),
+        ('P', palette),
+        ('RGB', rgba.convert('RGB')),
+    ]
+
+
+def count_allocations(fn, img):
+    """Number of full images Pillow allocates while running ``fn(img)``"""
+    original = Image.Image._new
+    calls = []
+
+    def counting_new(self, im):
+        calls.append(im.size)
+        return original(self, im)
+
+    # Image.new(), convert() and split() all allocate through Image._new()
+    with mock.patch.object(Image.Image, '_new', counting_new):
+        fn(img)
+    return len(calls)
+
+
+class Command(BaseCommand):
+    help = 'Compare allocations and time of the legacy and single-pass alpha flattening'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=2000, help='Edge length of the square test images')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per image')
+
+    def handle(self, *args, **options):
+        size = (options['size'], options['size'])
+        repeat = options['repeat']
+        self.stdout.write(f"{'mode':<18}{'routine':<10}{'allocs':>8}{'ms/image':>12}")
+
+        for label, img in sample_images(size):
+            for name, fn in (('legacy', legacy_flatten), ('single', flatten_to_rgb)):
+                allocations = count_allocations(fn, img)
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    fn(img)
+                elapsed = (time.perf_counter() - start) / repeat * 1000
+                self.stdout.write(f"{label:<18}{name:<10}{allocations:>8}{elapsed:>12.1f}")
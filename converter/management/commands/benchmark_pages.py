@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+PAGES = ('/robots.txt', '/privacy-policy/', '/terms-of-service/', '/contact-us/')
+
+
+class Command(BaseCommand):
+    help = 'Measure requests/sec for robots.txt and the legal pages with and without the page cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per page and mode')
+        parser.add_argument('--host', default='localhost', help='Host header to send')
+
+    def measure(self, client, path, count):
+        client.get(path)  # Warm templates, catalogs and the cache
+        start = time.perf_counter()
+        for _ in range(count):
+            client.get(path)
+        return count / (time.perf_counter() - start)
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        client = Client(HTTP_HOST=options['host'])
+        self.stdout.write(f"{'page':<22}{'uncached req/s':>16}{'cached req/s':>16}{'speedup':>10}")
+
+        for path in PAGES:
+            with override_settings(PAGE_CACHE_ENABLED=False):
+                uncached = self.measure(client, path, count)
+            cached = self.measure(client, path, count)
+            self.stdout.write(f"{path:<22}{uncached:>16.0f}{cached:>16.0f}{cached / uncached:>9.1f}x")
@@ -1,12 +1,34 @@
+from datetime import timedelta
+
 from django.core.management.base import BaseCommand
-from converter.views import cleanup_old_files
+from converter.cleanup import cleanup_old_files
 
 class Command(BaseCommand):
     help = 'Clean up old conversion files and jobs'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting it')
+        parser.add_argument('--max-age', type=float, default=24, help='Delete jobs older than this many hours')
+        parser.add_argument('--time-budget', type=float, help='Stop after this many seconds (the next run resumes)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Jobs deleted per batch')
+
     def handle(self, *args, **options):
         self.stdout.write('Starting cleanup...')
-        cleanup_old_files()
-        self.stdout.write(
-            self.style.SUCCESS('Successfully cleaned up old files')
-        )
\ No newline at end of file
+        report = cleanup_old_files(
+            max_age=timedelta(hours=options['max_age']),
+            dry_run=options['dry_run'],
+            time_budget=options['time_budget'],
+            chunk_size=options['chunk_size'],
+        )
+
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(f"{verb} {report['jobs']} jobs, {report['artifacts']} shared artifacts "
+                          f"and {report['files']} files ({report['bytes'] / (1024 * 1024):.1f} MB)")
+        if report['errors']:
+            self.stdout.write(self.style.WARNING(f"{report['errors']} files could not be deleted"))
+        if not report['complete']:
+            self.stdout.write(self.style.WARNING('Stopped at the time budget; run again to continue'))
+        else:
+            self.stdout.write(
+                self.style.SUCCESS('Successfully cleaned up old files')
+            )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from converter.result_cache import get_cache_stats
+
+class Command(BaseCommand):
+    help = 'Show conversion result cache hit-rate counters'
+
+    def handle(self, *args, **options):
+        stats = get_cache_stats()
+        self.stdout.write(f"Hits:      {stats['hits']}")
+        self.stdout.write(f"Misses:    {stats['misses']}")
+        self.stdout.write(f"Hit rate:  {stats['hit_rate']:.1%}")
+        self.stdout.write(f"Artifacts: {stats['artifacts']} ({stats['artifact_hits']} hits on those still stored)")
@@ -0,0 +1,41 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from converter.models import ConversionJob
+
+class Command(BaseCommand):
+    help = 'Compare output formats and presets by compression ratio and encode time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Only include jobs from the last N days')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        jobs = ConversionJob.objects.filter(
+            status='completed',
+            created_at__gte=since,
+            conversion_type__in=('resize_image', 'compress_image'),
+        ).values_list('conversion_type', 'conversion_details')
+
+        groups = defaultdict(lambda: {'jobs': 0, 'ratio': 0.0, 'seconds': 0.0})
+        for conversion_type, details in jobs.iterator(chunk_size=2000):
+            if not details or not details.get('compression_ratio'):
+                continue
+            group = groups[(conversion_type, details['output_format'], details['preset'])]
+            group['jobs'] += 1
+            group['ratio'] += details['compression_ratio']
+            group['seconds'] += details['encode_seconds']
+
+        if not groups:
+            self.stdout.write('No encoded jobs recorded in that period')
+            return
+
+        self.stdout.write(f"{'conversion':<16}{'format':<8}{'preset':<10}{'jobs':>7}{'avg ratio':>11}{'avg encode s':>14}")
+        for (conversion_type, output_format, preset), group in sorted(groups.items()):
+            self.stdout.write(
+                f"{conversion_type:<16}{output_format:<8}{preset:<10}{group['jobs']:>7}"
+                f"{group['ratio'] / group['jobs']:>11.2f}{group['seconds'] / group['jobs']:>14.3f}"
+            )
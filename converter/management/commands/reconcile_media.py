@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from converter.reconcile import reconcile_media
+
+class Command(BaseCommand):
+    help = 'Delete media files without a job and fail completed jobs whose file is missing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without changing it')
+        parser.add_argument('--grace', type=float, default=60,
+                            help='Leave files and jobs younger than this many minutes alone')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Files or rows checked per query')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Reconciling media files with conversion jobs...')
+        report = reconcile_media(
+            grace=timedelta(minutes=options['grace']),
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+        )
+
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(f"{verb} {report['files']} orphaned files, {report['partial_uploads']} of them "
+                          f"partial uploads ({report['bytes'] / (1024 * 1024):.1f} MB)")
+        self.stdout.write(f"Jobs with a missing converted file: {report['jobs_failed']}")
+        self.stdout.write(f"Cache entries with a missing file: {report['artifacts']}")
+        if report['errors']:
+            self.stdout.write(self.style.WARNING(f"{report['errors']} files could not be deleted"))
+        self.stdout.write(self.style.SUCCESS('Reconciliation completed'))
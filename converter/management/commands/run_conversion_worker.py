@@ -0,0 +1,41 @@
+import time
+from django.core.management.base import BaseCommand
+from converter.tasks import claim_next_job, run_conversion_job
+
+class Command(BaseCommand):
+    help = 'Process pending conversion jobs from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait between polls when the queue is empty',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is drained instead of polling forever',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Conversion worker started')
+        processed = 0
+
+        try:
+            while True:
+                job_id = claim_next_job()
+                if job_id is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                run_conversion_job(job_id, claimed=True)
+                processed += 1
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Conversion worker stopped after {processed} jobs')
+        )
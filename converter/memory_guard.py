@@ -0,0 +1,238 @@
+# converter/memory_guard.py - Memory admission for image conversions
+"""
+Before any pixels are decoded, each input's header is read to estimate the
+peak memory its conversion will need. Inputs over the per-job budget are
+decoded at a reduced JPEG DCT scale when possible and rejected otherwise,
+and a process-wide byte budget caps the memory held by concurrent
+conversions. PDF pages are sized from their MediaBox instead, and pages
+whose bitmap would not fit are rendered at a lower DPI.
+
+- ``CONVERSION_MAX_IMAGE_PIXELS``: hard pixel limit (Pillow decompression-bomb guard)
+- ``CONVERSION_JOB_MEMORY_BUDGET``: peak bytes allowed for one job
+- ``CONVERSION_TOTAL_MEMORY_BUDGET``: bytes allowed across concurrent jobs
+- ``CONVERSION_MEMORY_WAIT_TIMEOUT``: seconds a job waits for budget to free up
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from PIL import Image
+
+from .orientation import get_orientation
+from .pdf_render import page_pixels
+
+logger = logging.getLogger(__name__)
+
+# Pillow raises DecompressionBombError above twice this and warns above it;
+# admission treats anything above it as an error.
+Image.MAX_IMAGE_PIXELS = getattr(settings, 'CONVERSION_MAX_IMAGE_PIXELS', Image.MAX_IMAGE_PIXELS)
+
+ALPHA_MODES = ('RGBA', 'LA', 'P', 'PA')
+
+PDF_CONVERSIONS = ('jpg_to_pdf', 'png_to_pdf', 'images_to_pdf')
+
+# Re-encoded PDF pages are held as JPEG bytes next to the decoded bitmap
+ENCODED_BYTES_PER_PIXEL = 1
+
+# The renderer's 4-byte bitmap plus the Pillow RGB image it becomes
+PDF_RENDER_BYTES_PER_PIXEL = 8
+
+# Lowest resolution a PDF page is lowered to before it is rejected
+MIN_PDF_RENDER_DPI = 36
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+class ImageTooLarge(Exception):
+    """The input cannot be converted within the memory limits"""
+
+
+class MemoryBudgetExceeded(Exception):
+    """Not enough conversion memory freed up in time"""
+
+
+def pixel_bytes(mode):
+    """Bytes Pillow uses per pixel in memory for ``mode``"""
+    if mode in ('1', 'L', 'P'):
+        return 1
+    if mode.startswith('I;16'):
+        return 2
+    # Multi-band and 32-bit modes are stored as 4 bytes per pixel
+    return 4
+
+
+def peak_bytes_per_pixel(mode, conversion_type, orientation=1):
+    """Estimated peak bytes per decoded pixel for a conversion pipeline"""
+    decoded = pixel_bytes(mode)
+    if conversion_type == 'resize_image':
+        # thumbnail() works on the decoded image plus a much smaller result
+        return decoded + (4 if mode not in ('RGB', 'L') else 0)
+
+    if conversion_type in PDF_CONVERSIONS:
+        decoded += ENCODED_BYTES_PER_PIXEL
+    elif conversion_type == 'compress_image':
+        # One encode buffer per parallel quality probe
+        decoded += ENCODED_BYTES_PER_PIXEL * getattr(settings, 'COMPRESS_SEARCH_THREADS', 3)
+        if orientation != 1:
+            # The EXIF transpose holds a second full bitmap
+            decoded += pixel_bytes(mode)
+    if mode in ('RGBA', 'LA'):
+        # White RGB background, alpha read in place by flatten_to_rgb()
+        return decoded + 4
+    if mode in ALPHA_MODES:
+        # Palette transparency is expanded to RGBA before compositing
+        return decoded + 4 + 4
+    if mode != 'RGB':
+        return decoded + 4
+    return decoded
+
+
+def decode_scale(size, max_pixels, scale=1):
+    """Smallest JPEG DCT scale (up to 1/8) at or above ``scale`` that fits ``max_pixels``"""
+    if not max_pixels:
+        return scale
+    while scale < 8 and (size[0] // scale) * (size[1] // scale) > max_pixels:
+        scale *= 2
+    return scale
+
+
+def plan_conversion(sources, conversion_type):
+    """
+    Header-only admission check for one job.
+
+    ``sources`` are paths or file objects. Returns ``(peak_bytes, max_decode_pixels)``
+    where ``max_decode_pixels`` is None unless inputs must be decoded at reduced
+    scale. Raises ImageTooLarge when an input cannot fit the budget.
+    """
+    job_budget = getattr(settings, 'CONVERSION_JOB_MEMORY_BUDGET', None)
+    max_image_pixels = Image.MAX_IMAGE_PIXELS
+    peak = 0
+    max_decode_pixels = None
+
+    for source in sources:
+        try:
+            with Image.open(source) as img:
+                width, height = img.size
+                mode = img.mode
+                image_format = img.format
+                orientation = get_orientation(img)
+        except Image.DecompressionBombError:
+            raise ImageTooLarge("Image has too many pixels to convert")
+        except Exception:
+            # Not an image Pillow can read; the converter reports the real error
+            continue
+        finally:
+            if hasattr(source, 'seek'):
+                source.seek(0)
+
+        pixels = width * height
+        if max_image_pixels and pixels > max_image_pixels:
+            raise ImageTooLarge(f"Image is too large to convert ({width}x{height} pixels)")
+
+        per_pixel = peak_bytes_per_pixel(mode, conversion_type, orientation)
+        image_peak = pixels * per_pixel
+
+        if job_budget and image_peak > job_budget:
+            if image_format != 'JPEG':
+                raise ImageTooLarge(f"Image is too large to convert ({width}x{height} pixels)")
+
+            allowed_pixels = job_budget // per_pixel
+            scale = decode_scale((width, height), allowed_pixels)
+            scaled_pixels = (width // scale) * (height // scale)
+            if scaled_pixels > allowed_pixels:
+                raise ImageTooLarge(f"Image is too large to convert ({width}x{height} pixels)")
+
+            max_decode_pixels = min(max_decode_pixels or allowed_pixels, allowed_pixels)
+            image_peak = scaled_pixels * per_pixel
+
+        # Pages are converted one at a time, so the job peak is the largest page
+        peak = max(peak, image_peak)
+
+    return peak, max_decode_pixels
+
+
+def plan_pdf_render(page_sizes, dpi, concurrency=1):
+    """
+    Admission check for rasterizing PDF pages of ``page_sizes`` points at ``dpi``.
+
+    Returns ``(peak_bytes, max_pixels)``: pages over ``max_pixels`` must be
+    rendered at a lower DPI, and the peak covers ``concurrency`` of the
+    largest pages rendering at once. Raises ImageTooLarge when a page does
+    not fit even at MIN_PDF_RENDER_DPI.
+    """
+    job_budget = getattr(settings, 'CONVERSION_JOB_MEMORY_BUDGET', None)
+    limits = [limit for limit in (
+        Image.MAX_IMAGE_PIXELS,
+        job_budget // PDF_RENDER_BYTES_PER_PIXEL if job_budget else None,
+    ) if limit]
+    max_pixels = min(limits) if limits else None
+
+    largest = 0
+    for page_size in page_sizes:
+        pixels = page_pixels(page_size, dpi)
+        if max_pixels and pixels > max_pixels:
+            if page_pixels(page_size, MIN_PDF_RENDER_DPI) > max_pixels:
+                raise ImageTooLarge(
+                    f"PDF page is too large to render ({page_size[0]:.0f}x{page_size[1]:.0f} points)"
+                )
+            pixels = max_pixels
+        largest = max(largest, pixels)
+
+    return largest * PDF_RENDER_BYTES_PER_PIXEL * concurrency, max_pixels
+
+
+class MemoryBudget:
+    """Counting semaphore over bytes held by in-flight conversions"""
+
+    def __init__(self, total_bytes):
+        self.total_bytes = total_bytes
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, nbytes, timeout=None):
+        # A job within the per-job budget must always be able to run on its own
+        nbytes = min(nbytes, self.total_bytes)
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.in_flight + nbytes <= self.total_bytes, timeout):
+                raise MemoryBudgetExceeded("The server is busy, please try again shortly")
+            self.in_flight += nbytes
+        return nbytes
+
+    def release(self, nbytes):
+        with self._condition:
+            self.in_flight = max(self.in_flight - nbytes, 0)
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes, timeout=None):
+        held = self.acquire(nbytes, timeout)
+        try:
+            yield
+        finally:
+            self.release(held)
+
+
+def get_memory_budget():
+    """Return the process-wide budget, or None when unlimited"""
+    global _budget
+    total_bytes = getattr(settings, 'CONVERSION_TOTAL_MEMORY_BUDGET', None)
+    if not total_bytes:
+        return None
+    if _budget is None:
+        with _budget_lock:
+            if _budget is None:
+                _budget = MemoryBudget(total_bytes)
+    return _budget
+
+
+@contextmanager
+def reserve_memory(nbytes):
+    """Hold ``nbytes`` of the shared budget for the duration of a conversion"""
+    budget = get_memory_budget()
+    if budget is None or not nbytes:
+        yield
+        return
+    with budget.reserve(nbytes, timeout=getattr(settings, 'CONVERSION_MEMORY_WAIT_TIMEOUT', 60)):
+        yield
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversionjob',
+            name='input_path',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0002_conversionjob_input_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversionjob',
+            name='input_paths',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='conversionjob',
+            name='conversion_type',
+            field=models.CharField(choices=[('jpg_to_pdf', 'JPG to PDF'), ('png_to_pdf', 'PNG to PDF'), ('images_to_pdf', 'Images to PDF'), ('pdf_to_jpg', 'PDF to JPG'), ('resize_image', 'Resize Image'), ('compress_image', 'Compress Image')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0003_conversionjob_input_paths'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversionjob',
+            name='conversion_details',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
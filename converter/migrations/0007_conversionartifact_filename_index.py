@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0006_conversionjob_options'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversionartifact',
+            name='converted_filename',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
@@ -2,10 +2,35 @@ from django.db import models
 from django.utils import timezone
 import uuid
 
+class ConversionArtifact(models.Model):
+    """A converted file shared by every job whose input and options hash to the same key"""
+    cache_key = models.CharField(max_length=64, unique=True)
+    converted_filename = models.CharField(max_length=255, db_index=True)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.converted_filename} ({self.cache_key[:12]})"
+    
+    @property
+    def ref_count(self):
+        """Number of jobs still pointing at this file"""
+        return self.jobs.count()
+
+class CacheCounter(models.Model):
+    """A cumulative result-cache counter, shared by every web process"""
+    name = models.CharField(max_length=32, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
 class ConversionJob(models.Model):
     CONVERSION_TYPES = [
         ('jpg_to_pdf', 'JPG to PDF'),
         ('png_to_pdf', 'PNG to PDF'),
+        ('images_to_pdf', 'Images to PDF'),
         ('pdf_to_jpg', 'PDF to JPG'),
         ('resize_image', 'Resize Image'),
         ('compress_image', 'Compress Image'),
@@ -23,10 +48,18 @@ class ConversionJob(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     original_filename = models.CharField(max_length=255)
     converted_filename = models.CharField(max_length=255, blank=True)
+    input_path = models.CharField(max_length=255, blank=True)
+    input_paths = models.JSONField(default=list, blank=True)  # Ordered pages for batch jobs
+    options = models.JSONField(default=dict, blank=True)  # Conversion parameters chosen by the user
     file_size = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(default=timezone.now)
     completed_at = models.DateTimeField(null=True, blank=True)
     error_message = models.TextField(blank=True)
+    conversion_details = models.JSONField(default=dict, blank=True)  # How the conversion was carried out
+    cache_key = models.CharField(max_length=64, blank=True)
+    artifact = models.ForeignKey(
+        ConversionArtifact, null=True, blank=True, on_delete=models.SET_NULL, related_name='jobs'
+    )
     
     class Meta:
         ordering = ['-created_at']
@@ -38,6 +71,12 @@ class ConversionJob(models.Model):
     def __str__(self):
         return f"{self.conversion_type} - {self.original_filename}"
     
+    @property
+    def download_filename(self):
+        """Name sent to the browser; shared artifacts keep the name of the job that produced them"""
+        _, separator, suffix = self.converted_filename.partition('_')
+        return f"{self.id}_{suffix}" if separator else self.converted_filename
+    
     def get_status_display_with_icon(self):
         status_icons = {
             'pending': '⏳',
@@ -0,0 +1,83 @@
+# converter/orientation.py - EXIF orientation without extra pixel passes
+"""
+Phone cameras store pixels as the sensor read them and record the turn a
+viewer must apply in the EXIF Orientation tag (values 1 to 8).
+
+Image PDFs never transpose pixels: the page layout is planned from the
+displayed size, and ``page_matrix`` draws the stored image through a
+transform that rotates or mirrors it into place, so a JPEG can still be
+embedded as-is. Resizing scales the stored image to the swapped bounds and
+transposes only the small result, keeping a single resample pass. Plain
+compression has no resize to fold the transpose into and pays for one.
+"""
+from PIL import Image
+
+ORIENTATION_TAG = 0x0112
+
+# Orientations whose displayed width is the stored height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Orientation -> Pillow transpose turning stored pixels into displayed ones
+TRANSPOSE_METHODS = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# Orientation -> (a, b, c, d) of a PDF matrix that maps an image drawn in the
+# unit square onto its displayed box, in units of the box width (a, c) and
+# height (b, d); the origin shift (e, f) follows from the box corner
+UNIT_MATRICES = {
+    1: (1, 0, 0, 1),
+    2: (-1, 0, 0, 1),
+    3: (-1, 0, 0, -1),
+    4: (1, 0, 0, -1),
+    5: (0, -1, -1, 0),
+    6: (0, -1, 1, 0),
+    7: (0, 1, 1, 0),
+    8: (0, 1, -1, 0),
+}
+
+
+def get_orientation(img):
+    """EXIF orientation of an opened image (1 when missing or invalid), read without decoding pixels"""
+    try:
+        orientation = int(img.getexif().get(ORIENTATION_TAG, 1))
+    except Exception:
+        return 1
+    return orientation if orientation in UNIT_MATRICES else 1
+
+
+def displayed_size(size, orientation):
+    """``(width, height)`` of stored ``size`` once the orientation is applied"""
+    return (size[1], size[0]) if orientation in TRANSPOSED_ORIENTATIONS else tuple(size)
+
+
+def page_matrix(orientation, x, y, width, height):
+    """PDF transform drawing the unit-square image upright into box (x, y, width, height)"""
+    a, b, c, d = UNIT_MATRICES.get(orientation, UNIT_MATRICES[1])
+    # Unit corners with a negative coefficient start from the far edge of the box
+    e = x + width * (-min(a, 0) - min(c, 0))
+    f = y + height * (-min(b, 0) - min(d, 0))
+    return a * width, b * height, c * width, d * height, e, f
+
+
+def apply_orientation(img, orientation):
+    """Transpose ``img`` into its displayed orientation (a full copy unless it is already upright)"""
+    method = TRANSPOSE_METHODS.get(orientation)
+    return img.transpose(method) if method is not None else img
+
+
+def thumbnail_oriented(img, max_size, orientation, resample=Image.Resampling.LANCZOS):
+    """
+    ``img.thumbnail`` to ``max_size`` as displayed, then orient the result.
+
+    The stored image is scaled to the bounds swapped for transposed
+    orientations, so only the reduced image is transposed.
+    """
+    img.thumbnail(displayed_size(max_size, orientation), resample)
+    return apply_orientation(img, orientation)
@@ -0,0 +1,136 @@
+# converter/page_cache.py - Rendered-response cache for static pages
+"""
+The legal pages and robots.txt only vary by language, host and protocol
+(their templates use ``request.build_absolute_uri``, so the path is part of
+the key too). ``cached_page`` stores their rendered bytes in the configured
+cache and answers repeat requests with the stored body, a strong ``ETag``
+and ``Cache-Control``, or a 304 for a matching ``If-None-Match``.
+
+Pages that call ``get_token`` (a ``{% csrf_token %}`` form) are never
+stored: the token is tied to the visitor's CSRF cookie.
+
+Keys include a fingerprint of the template and ``.mo`` catalog files, so
+editing a template or compiling translations invalidates every entry.
+
+- ``PAGE_CACHE_ENABLED``: turn the cache off (e.g. to benchmark)
+- ``PAGE_CACHE_ALIAS``: which ``CACHES`` entry holds pages (bounded by its MAX_ENTRIES)
+- ``PAGE_CACHE_TIMEOUT``: seconds a rendered page is kept
+- ``PAGE_CACHE_MAX_AGE``: ``Cache-Control`` max-age sent to browsers and crawlers
+- ``PAGE_CACHE_CHECK_INTERVAL``: seconds between template/catalog fingerprint checks
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.template import engines
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.translation import get_language
+
+logger = logging.getLogger(__name__)
+
+_fingerprint = None
+_newest_mtime = 0
+_fingerprint_checked = 0
+_fingerprint_lock = threading.Lock()
+
+
+def watched_files():
+    """Template files of every Django template engine plus compiled catalogs"""
+    roots = []
+    for engine in engines.all():
+        roots.extend(getattr(engine, 'template_dirs', ()))
+    for root in roots:
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                yield os.path.join(dirpath, filename)
+
+    for locale_path in getattr(settings, 'LOCALE_PATHS', ()):
+        for dirpath, _, filenames in os.walk(locale_path):
+            for filename in filenames:
+                if filename.endswith('.mo'):
+                    yield os.path.join(dirpath, filename)
+
+
+def _check_watched_files():
+    """Refresh the fingerprint and newest mtime at most every PAGE_CACHE_CHECK_INTERVAL"""
+    global _fingerprint, _newest_mtime, _fingerprint_checked
+    interval = getattr(settings, 'PAGE_CACHE_CHECK_INTERVAL', 2 if settings.DEBUG else 60)
+    now = time.monotonic()
+    if _fingerprint is not None and now - _fingerprint_checked < interval:
+        return
+
+    with _fingerprint_lock:
+        hasher = hashlib.sha1()
+        newest = 0
+        for path in sorted(watched_files()):
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            hasher.update(f"{path}:{mtime_ns}".encode())
+            newest = max(newest, mtime_ns)
+        _fingerprint = hasher.hexdigest()[:12]
+        _newest_mtime = newest / 1e9
+        _fingerprint_checked = now
+
+
+def get_fingerprint():
+    """Short hash over watched file names and mtimes"""
+    _check_watched_files()
+    return _fingerprint
+
+
+def get_newest_mtime():
+    """Most recent mtime (seconds) of any template or compiled catalog"""
+    _check_watched_files()
+    return _newest_mtime
+
+
+def page_cache_key(request, name):
+    parts = f"{name}:{get_language()}:{request.scheme}:{request.get_host()}:{request.path}"
+    return f"page_cache:{get_fingerprint()}:{hashlib.md5(parts.encode()).hexdigest()}"
+
+
+def _build_response(request, content, content_type, etag):
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'PAGE_CACHE_MAX_AGE', 3600))
+    return response
+
+
+def cached_page(view):
+    """Cache a GET view whose output depends only on language, host, protocol and path"""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (not getattr(settings, 'PAGE_CACHE_ENABLED', True)
+                or request.method not in ('GET', 'HEAD') or request.GET):
+            return view(request, *args, **kwargs)
+
+        cache = caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+        key = page_cache_key(request, view.__name__)
+        entry = cache.get(key)
+        if entry is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming or response.cookies:
+                return response
+            if request.META.get('CSRF_COOKIE_NEEDS_UPDATE') or request.META.get('CSRF_COOKIE_USED'):
+                # Rendered a CSRF token: per-visitor, so neither cached here nor by proxies
+                logger.debug(f"Not caching {view.__name__}: it renders a CSRF token")
+                return response
+
+            content = response.content
+            entry = (content, response['Content-Type'], f'"{hashlib.md5(content).hexdigest()}"')
+            cache.set(key, entry, getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 60))
+
+        return _build_response(request, *entry)
+
+    return wrapper
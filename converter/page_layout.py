@@ -0,0 +1,171 @@
+# converter/page_layout.py - Page layout for image-to-PDF
+"""
+Plans every page of an image PDF from the image headers alone, so a
+document of hundreds of pages is laid out before any pixel is decoded.
+
+Images are sized from their DPI metadata (one pixel per point when they
+have none), turned upright by their EXIF orientation, and placed on a
+page of their own size or on A4/Letter paper with margins:
+
+- ``fit``: scaled to fill the printable area without cropping
+- ``fill``: scaled to cover the area, the overflow clipped
+- ``original``: printed at the size the DPI gives, only shrunk to fit
+
+N-up layouts put 2, 4, 6 or 9 images on each sheet in a grid. With
+``auto`` orientation each sheet is portrait or landscape, whichever lets
+its images be printed larger.
+
+- ``PDF_DEFAULT_PAGE_SIZE``: 'image', 'a4' or 'letter'
+- ``PDF_DEFAULT_FIT``: 'fit', 'fill' or 'original'
+- ``PDF_DEFAULT_MARGIN_MM``: margin (and gap between N-up cells) on paper sizes
+- ``PDF_DEFAULT_IMAGE_DPI``: resolution assumed for images without DPI metadata
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from PIL import Image
+from reportlab.lib.pagesizes import A4, letter
+from reportlab.lib.units import mm
+
+from .orientation import TRANSPOSED_ORIENTATIONS, get_orientation
+
+PAGE_SIZES = {'a4': A4, 'letter': letter}
+
+PAGE_SIZE_CHOICES = ('image',) + tuple(PAGE_SIZES)
+
+ORIENTATIONS = ('auto', 'portrait', 'landscape')
+
+FIT_MODES = ('fit', 'fill', 'original')
+
+# Images per sheet -> (columns, rows) on a portrait sheet; swapped for landscape
+NUP_GRIDS = {1: (1, 1), 2: (1, 2), 4: (2, 2), 6: (2, 3), 9: (3, 3)}
+
+MAX_MARGIN_MM = 50
+
+# DPI values below this are aspect-ratio placeholders rather than a resolution
+MIN_IMAGE_DPI = 10
+
+# Width, height and DPI as displayed, after the EXIF orientation
+ImageHeader = namedtuple('ImageHeader', 'path width height dpi orientation')
+
+# Rectangles are (x, y, width, height) in points from the bottom-left corner;
+# clip is the cell a ``fill`` image is cropped to
+Placement = namedtuple('Placement', 'path x y width height clip orientation')
+
+PagePlan = namedtuple('PagePlan', 'size placements')
+
+
+def get_default_dpi():
+    return getattr(settings, 'PDF_DEFAULT_IMAGE_DPI', 72)
+
+
+def read_header(path, default_dpi=None):
+    """Displayed pixel size, DPI and EXIF orientation of an image, read without decoding it"""
+    default_dpi = default_dpi or get_default_dpi()
+    with Image.open(path) as img:
+        width, height = img.size
+        dpi = img.info.get('dpi')
+        orientation = get_orientation(img)
+    try:
+        dpi = (float(dpi[0]), float(dpi[1]))
+    except (TypeError, ValueError, IndexError):
+        dpi = None
+    if not dpi or min(dpi) < MIN_IMAGE_DPI:
+        dpi = (default_dpi, default_dpi)
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        width, height, dpi = height, width, (dpi[1], dpi[0])
+    return ImageHeader(path, width, height, dpi, orientation)
+
+
+def natural_size(header):
+    """Size in points an image prints at by its DPI"""
+    return header.width * 72 / header.dpi[0], header.height * 72 / header.dpi[1]
+
+
+def place_image(header, box, fit):
+    """Placement of an image centred in ``box``"""
+    x, y, width, height = box
+    natural_width, natural_height = natural_size(header)
+    if fit == 'fill':
+        scale = max(width / natural_width, height / natural_height)
+    elif fit == 'original':
+        scale = min(width / natural_width, height / natural_height, 1.0)
+    else:
+        scale = min(width / natural_width, height / natural_height)
+    draw_width, draw_height = natural_width * scale, natural_height * scale
+    return Placement(
+        header.path, x + (width - draw_width) / 2, y + (height - draw_height) / 2,
+        draw_width, draw_height, box if fit == 'fill' else None, header.orientation,
+    )
+
+
+def image_page(header):
+    """A page the size of the image, shrunk to fit A4 (never enlarged)"""
+    natural_width, natural_height = natural_size(header)
+    scale = min(A4[0] / natural_width, A4[1] / natural_height, 1.0)
+    page_size = (natural_width * scale, natural_height * scale)
+    return PagePlan(page_size, [Placement(header.path, 0, 0, page_size[0], page_size[1], None, header.orientation)])
+
+
+def grid_cells(page_size, margin, columns, rows):
+    """Cell boxes in reading order, separated and surrounded by ``margin``"""
+    page_width, page_height = page_size
+    cell_width = max((page_width - margin * (columns + 1)) / columns, 1)
+    cell_height = max((page_height - margin * (rows + 1)) / rows, 1)
+    return [
+        (
+            margin + column * (cell_width + margin),
+            page_height - (row + 1) * (cell_height + margin),
+            cell_width,
+            cell_height,
+        )
+        for row in range(rows)
+        for column in range(columns)
+    ]
+
+
+def paper_page(headers, paper, orientation, fit, margin, per_page):
+    columns, rows = NUP_GRIDS[per_page]
+    layouts = {
+        'portrait': ((min(paper), max(paper)), columns, rows),
+        'landscape': ((max(paper), min(paper)), rows, columns),
+    }
+
+    if orientation == 'auto':
+        # Whichever orientation prints these images larger when fitted
+        def fitted_area(name):
+            page_size, page_columns, page_rows = layouts[name]
+            cells = grid_cells(page_size, margin, page_columns, page_rows)
+            return sum(
+                placement.width * placement.height
+                for placement in (place_image(header, cell, 'fit') for header, cell in zip(headers, cells))
+            )
+        orientation = 'landscape' if fitted_area('landscape') > fitted_area('portrait') else 'portrait'
+
+    page_size, page_columns, page_rows = layouts[orientation]
+    cells = grid_cells(page_size, margin, page_columns, page_rows)
+    return PagePlan(page_size, [place_image(header, cell, fit) for header, cell in zip(headers, cells)])
+
+
+def plan_layout(input_paths, page_size=None, orientation='auto', fit=None, margin_mm=None, per_page=1):
+    """
+    Lay out every page of the PDF for ``input_paths``, in order.
+
+    Only image headers are read. Returns a list of ``PagePlan``; with the
+    'image' page size every image gets its own page and ``fit``, margins
+    and N-up do not apply.
+    """
+    page_size = page_size or getattr(settings, 'PDF_DEFAULT_PAGE_SIZE', 'image')
+    fit = fit or getattr(settings, 'PDF_DEFAULT_FIT', 'fit')
+    if margin_mm is None:
+        margin_mm = getattr(settings, 'PDF_DEFAULT_MARGIN_MM', 10)
+    default_dpi = get_default_dpi()
+
+    headers = [read_header(path, default_dpi) for path in input_paths]
+    if page_size not in PAGE_SIZES:
+        return [image_page(header) for header in headers]
+
+    return [
+        paper_page(headers[start:start + per_page], PAGE_SIZES[page_size], orientation, fit, margin_mm * mm, per_page)
+        for start in range(0, len(headers), per_page)
+    ]
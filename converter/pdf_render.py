@@ -0,0 +1,165 @@
+# converter/pdf_render.py - PDF page rasterization
+"""
+Renders PDF pages to JPEG with whichever local renderer is installed:
+pypdfium2 is preferred, PyMuPDF is used otherwise. Each page is rendered by
+``render_page`` on its own so pages can be spread across the engine's
+worker processes.
+
+A page's bitmap size follows from its MediaBox, not from the file size, so
+every render is capped at a pixel count: pages too large for the requested
+DPI are rendered at the highest DPI that fits.
+"""
+import re
+import math
+import logging
+from contextlib import contextmanager
+
+from PIL import Image
+
+try:
+    import pypdfium2 as pdfium
+    HAS_PDFIUM = True
+except ImportError:
+    HAS_PDFIUM = False
+
+try:
+    import fitz
+    HAS_FITZ = True
+except ImportError:
+    HAS_FITZ = False
+
+HAS_PDF_RENDERER = HAS_PDFIUM or HAS_FITZ
+
+logger = logging.getLogger(__name__)
+
+PAGE_RANGE_RE = re.compile(r'^\s*(\d+)?\s*(-)?\s*(\d+)?\s*$')
+
+
+def parse_page_range(spec, page_count=None):
+    """
+    Turn a range such as ``"1-3,5,8-"`` into sorted 0-based page indexes.
+
+    Without ``page_count`` only the syntax is checked and open ranges are
+    left unresolved (an empty list is returned). Raises ValueError.
+    """
+    pages = set()
+    for part in spec.split(','):
+        match = PAGE_RANGE_RE.match(part)
+        if not match or not (match.group(1) or match.group(3)):
+            raise ValueError(f'Invalid page range "{spec}".')
+        first = int(match.group(1) or 1)
+        last = int(match.group(3) or 0) if match.group(2) else first
+        if first < 1 or (last and last < first):
+            raise ValueError(f'Invalid page range "{spec}".')
+        if page_count is None:
+            continue
+
+        last = last or page_count
+        if last > page_count:
+            raise ValueError(f'The PDF only has {page_count} page(s).')
+        pages.update(range(first - 1, last))
+    return sorted(pages)
+
+
+def get_page_count(path):
+    if HAS_PDFIUM:
+        pdf = pdfium.PdfDocument(path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    if HAS_FITZ:
+        with fitz.open(path) as doc:
+            return doc.page_count
+    raise RuntimeError("No PDF renderer is installed (pypdfium2 or PyMuPDF)")
+
+
+def get_page_sizes(path, page_indexes):
+    """``(width, height)`` in points of each page, read without rendering anything"""
+    if HAS_PDFIUM:
+        pdf = pdfium.PdfDocument(path)
+        try:
+            return [tuple(pdf.get_page_size(page_index)) for page_index in page_indexes]
+        finally:
+            pdf.close()
+    if HAS_FITZ:
+        with fitz.open(path) as doc:
+            return [(doc[page_index].rect.width, doc[page_index].rect.height) for page_index in page_indexes]
+    raise RuntimeError("No PDF renderer is installed (pypdfium2 or PyMuPDF)")
+
+
+@contextmanager
+def open_page(path, page_index):
+    """Yield a page's ``(size, render)``: its size in points and a function rendering it at a scale"""
+    if HAS_PDFIUM:
+        pdf = pdfium.PdfDocument(path)
+        try:
+            page = pdf[page_index]
+            try:
+                yield page.get_size(), lambda scale: page.render(scale=scale).to_pil()
+            finally:
+                page.close()
+        finally:
+            pdf.close()
+    elif HAS_FITZ:
+        with fitz.open(path) as doc:
+            page = doc.load_page(page_index)
+
+            def render(scale):
+                pixmap = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+                return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+            yield (page.rect.width, page.rect.height), render
+    else:
+        raise RuntimeError("No PDF renderer is installed (pypdfium2 or PyMuPDF)")
+
+
+def page_pixels(page_size, dpi):
+    """Pixels in the bitmap of a page of ``page_size`` points rendered at ``dpi``"""
+    # Rounded first so 792 points at 150 DPI is 1650 pixels, not 1651
+    return math.ceil(round(page_size[0] * dpi / 72, 6)) * math.ceil(round(page_size[1] * dpi / 72, 6))
+
+
+def cap_dpi(page_size, dpi, max_pixels):
+    """Highest resolution up to ``dpi`` at which a page renders to at most ``max_pixels``"""
+    if not max_pixels or page_pixels(page_size, dpi) <= max_pixels:
+        return dpi
+    dpi *= math.sqrt(max_pixels / page_pixels(page_size, dpi))
+    # Renderers round each side up, so step down until the rounded size fits
+    while page_pixels(page_size, dpi) > max_pixels:
+        dpi *= 0.99
+    return dpi
+
+
+def render_page_image(path, page_index, dpi=150, max_size=None, max_pixels=None):
+    """
+    Rasterize one page to an RGB image, at ``dpi`` or small enough to fit
+    ``max_size``, lowering the DPI so the bitmap stays within ``max_pixels``
+    (Pillow's decompression-bomb limit by default).
+    """
+    with open_page(path, page_index) as (page_size, render):
+        if max_size:
+            dpi = fit_dpi(page_size, max_size)
+        capped = cap_dpi(page_size, dpi, max_pixels or Image.MAX_IMAGE_PIXELS)
+        if capped < dpi:
+            logger.warning(
+                f"PDF page {page_index + 1} ({page_size[0]:.0f}x{page_size[1]:.0f} points) "
+                f"rendered at {capped:.0f} instead of {dpi:.0f} DPI to stay within the pixel limit"
+            )
+        img = render(capped / 72)
+
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def fit_dpi(page_size, max_size):
+    """Resolution at which a page of ``page_size`` points just fits ``max_size`` pixels"""
+    return 72 * min(max_size[0] / page_size[0], max_size[1] / page_size[1])
+
+
+def render_page(path, page_index, output_path, dpi=150, quality=90, max_pixels=None, stats=None):
+    """Rasterize one page to a JPEG file; only this page's bitmap is held in memory"""
+    img = render_page_image(path, page_index, dpi=dpi, max_pixels=max_pixels)
+    img.save(output_path, 'JPEG', quality=quality, optimize=True)
+    return output_path
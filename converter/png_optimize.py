@@ -0,0 +1,166 @@
+# converter/png_optimize.py - Smallest-of-several PNG encoding
+"""
+PNG size depends far more on the pixel representation than on zlib effort:
+a screenshot with a few hundred colours shrinks several times over as an
+8-bit (or 4/2/1-bit) palette image. ``optimize_png`` builds the lossless
+reductions that apply to an image (dropping an opaque alpha channel, RGB to
+grayscale, exact palettes for 256 colours or fewer; Pillow packs palettes of
+16 colours or fewer into fewer bits), encodes each with a few zlib level and
+strategy combinations in a thread pool, and keeps the smallest result
+finished within the time budget.
+
+Every reduction is checked to decode to exactly the original pixels. Only
+``lossy=True`` adds a quantized 256-colour candidate that is not.
+
+- ``PNG_OPTIMIZE_TIME_BUDGET``: seconds of trials before the best so far is kept
+- ``PNG_OPTIMIZE_THREADS``: trials encoded at once
+"""
+import time
+import logging
+from io import BytesIO
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from PIL import Image, ImageChops
+
+logger = logging.getLogger(__name__)
+
+# zlib strategies, passed to Pillow as compress_type
+Z_DEFAULT_STRATEGY = 0
+Z_FILTERED = 1
+Z_RLE = 3
+
+# (compress_level, compress_type) tried per candidate, most promising first
+TRIAL_SETTINGS = {
+    'balanced': [(6, Z_DEFAULT_STRATEGY), (6, Z_RLE), (6, Z_FILTERED)],
+    'max': [(9, Z_DEFAULT_STRATEGY), (9, Z_RLE), (9, Z_FILTERED), (6, Z_DEFAULT_STRATEGY)],
+}
+
+STRATEGY_NAMES = {Z_DEFAULT_STRATEGY: 'default', Z_FILTERED: 'filtered', Z_RLE: 'rle'}
+
+
+def identical(a, b):
+    """True when two images hold the same pixels, compared in ``b``'s mode"""
+    if a.mode != b.mode:
+        a = a.convert(b.mode)
+    return ImageChops.difference(a, b).getbbox(alpha_only=False) is None
+
+
+def exact_palette(img):
+    """Palette image with exactly the colours of an RGB or L image, or None above 256 colours"""
+    if img.getcolors(256) is None:
+        return None
+    # Median cut ends with one box per colour when there are no more colours
+    # than entries; quantizing to a given palette goes through a lossy colour
+    # cache, so it cannot be used here
+    candidate = img.convert('RGB').quantize(colors=256, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+    return candidate if identical(candidate, img) else None
+
+
+def reduce_alpha_palette(img):
+    """Palette image with per-entry alpha for an RGBA image of 256 colours or fewer, or None"""
+    if img.getcolors(256) is None:
+        return None
+    candidate = img.quantize(colors=256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+    return candidate if identical(candidate, img) else None
+
+
+def build_candidates(img, lossy=False):
+    """``(label, image)`` pairs to try, each decoding to ``img``'s pixels unless labelled lossy"""
+    if img.mode not in ('L', 'LA', 'P', 'RGB', 'RGBA'):
+        # 1-bit is already minimal; 16-bit modes would lose precision
+        return [(img.mode, img)]
+    if img.mode == 'P':
+        img = img.convert('RGBA' if img.palette.mode == 'RGBA' or 'transparency' in img.info else 'RGB')
+
+    candidates = [(img.mode, img)]
+    reduced = img
+
+    # An alpha channel that is opaque everywhere carries nothing
+    if img.mode in ('RGBA', 'LA') and img.getchannel('A').getextrema() == (255, 255):
+        reduced = img.convert(img.mode[:-1])
+        candidates.append((reduced.mode, reduced))
+
+    # Equal R, G and B everywhere is grayscale
+    if reduced.mode in ('RGB', 'RGBA'):
+        red, green, blue = reduced.getchannel('R'), reduced.getchannel('G'), reduced.getchannel('B')
+        if identical(red, green) and identical(green, blue):
+            reduced = reduced.convert('L' if reduced.mode == 'RGB' else 'LA')
+            candidates.append((reduced.mode, reduced))
+
+    palette = None
+    if reduced.mode in ('RGB', 'L'):
+        palette = exact_palette(reduced)
+    elif reduced.mode in ('RGBA', 'LA'):
+        palette = reduce_alpha_palette(reduced.convert('RGBA'))
+    if palette is not None:
+        candidates.append((f"P{len(palette.getpalette()) // 3}", palette))
+    elif lossy:
+        method = Image.Quantize.FASTOCTREE if 'A' in reduced.getbands() else Image.Quantize.MEDIANCUT
+        source = reduced.convert('RGBA' if 'A' in reduced.getbands() else 'RGB')
+        candidates.append(('P256-lossy', source.quantize(colors=256, method=method)))
+
+    # Smallest representation first so it is encoded before the budget runs out
+    candidates.reverse()
+    return candidates
+
+
+def encode_trial(img, compress_level, compress_type):
+    buffer = BytesIO()
+    # Pillow keeps encoder settings on the Image, so each trial gets its own object
+    img._new(img.im).save(buffer, 'PNG', compress_level=compress_level, compress_type=compress_type)
+    return buffer
+
+
+def optimize_png(img, output_path, preset='balanced', lossy=False, time_budget=None, stats=None):
+    """Write the smallest PNG found for ``img`` within ``time_budget`` seconds; returns its size"""
+    if time_budget is None:
+        time_budget = getattr(settings, 'PNG_OPTIMIZE_TIME_BUDGET', 2.0)
+    threads = max(1, getattr(settings, 'PNG_OPTIMIZE_THREADS', 2))
+    img.load()
+    started = time.perf_counter()
+
+    candidates = build_candidates(img, lossy)
+    trials = [
+        (label, candidate, level, strategy)
+        for label, candidate in candidates
+        for level, strategy in TRIAL_SETTINGS.get(preset, TRIAL_SETTINGS['balanced'])
+    ]
+
+    best = None
+    completed = 0
+    pool = ThreadPoolExecutor(max_workers=threads)
+    try:
+        pending = {
+            pool.submit(encode_trial, candidate, level, strategy): (label, level, strategy)
+            for label, candidate, level, strategy in trials
+        }
+        while pending:
+            remaining = time_budget - (time.perf_counter() - started)
+            # Always wait for at least one finished trial
+            done, _ = wait(pending, timeout=max(remaining, 0) if best else None, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                trial = pending.pop(future)
+                buffer = future.result()
+                completed += 1
+                if best is None or buffer.tell() < best[1].tell():
+                    best = (trial, buffer)
+    finally:
+        # Trials not yet started are dropped; running ones finish in the background
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    (label, level, strategy), buffer = best
+    with open(output_path, 'wb') as f:
+        f.write(buffer.getbuffer())
+
+    if stats is not None:
+        stats['png_strategy'] = f"{label} level {level} {STRATEGY_NAMES[strategy]}"
+        stats['png_trials'] = f"{completed}/{len(trials)}"
+        stats['png_lossy'] = label.endswith('-lossy')
+    logger.info(
+        f"Optimized PNG: {label}, level {level}, {STRATEGY_NAMES[strategy]} strategy, {buffer.tell()} bytes "
+        f"({completed} of {len(trials)} trials in {time.perf_counter() - started:.2f}s)"
+    )
+    return buffer.tell()
@@ -0,0 +1,183 @@
+# converter/previews.py - Small previews of uploads and converted files
+"""
+Previews are decoded at reduced size (JPEG DCT scaling, or rendering the
+PDF page straight to thumbnail resolution) and cached under
+``MEDIA_ROOT/previews``. Each file is named after its source file's path,
+size and mtime, so a shared cached artifact shares its preview. The cache
+is trimmed by least recent use once it grows past its byte cap.
+
+Previews are built inline in the request: they only decode a thumbnail's
+worth of pixels, and queueing them on the conversion engine would leave
+the request waiting behind full conversions.
+
+- ``PREVIEW_MAX_SIZE``: bounding box of a preview in pixels
+- ``PREVIEW_FORMAT``: 'WEBP' or 'JPEG'
+- ``PREVIEW_CACHE_MAX_BYTES``: disk space the preview cache may use
+"""
+import os
+import hashlib
+import logging
+import tempfile
+import zipfile
+
+from django.conf import settings
+from PIL import Image
+
+from .image_utils import flatten_to_rgb
+from .orientation import get_orientation, thumbnail_oriented
+from .pdf_render import HAS_PDF_RENDERER, render_page_image
+from .storage import get_input_storage, get_output_storage, local_path, output_name
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_SOURCES = ('upload', 'result')
+
+PREVIEW_CONTENT_TYPES = {
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+}
+
+
+def get_preview_dir():
+    return os.path.join(settings.MEDIA_ROOT, 'previews')
+
+
+def get_preview_format():
+    preview_format = getattr(settings, 'PREVIEW_FORMAT', 'WEBP').upper()
+    return preview_format if preview_format in PREVIEW_CONTENT_TYPES else 'JPEG'
+
+
+def resolve_source(job, source):
+    """Path of the file a job's preview is made from, or None when there is nothing to show"""
+    # Only files on a local storage are previewed
+    upload_paths = job.input_paths or ([job.input_path] if job.input_path else [])
+    first_upload = local_path(get_input_storage(), upload_paths[0]) if upload_paths else None
+    if first_upload and not os.path.exists(first_upload):
+        first_upload = None
+
+    if source == 'upload':
+        if first_upload and first_upload.lower().endswith('.pdf') and not HAS_PDF_RENDERER:
+            return None
+        return first_upload
+
+    if job.status != 'completed' or not job.converted_filename:
+        return None
+    result = local_path(get_output_storage(), output_name(job.converted_filename))
+    if not result or not os.path.exists(result):
+        return None
+    if result.endswith('.pdf') and not HAS_PDF_RENDERER:
+        # The first page of an image-to-PDF result is the first image as uploaded
+        if first_upload and not first_upload.lower().endswith('.pdf'):
+            return first_upload
+        return None
+    return result
+
+
+def preview_path(source_path, max_size, preview_format):
+    stat_result = os.stat(source_path)
+    key = f"{source_path}:{stat_result.st_size}:{stat_result.st_mtime_ns}:{max_size[0]}x{max_size[1]}"
+    extension = '.webp' if preview_format == 'WEBP' else '.jpg'
+    return os.path.join(get_preview_dir(), hashlib.sha256(key.encode()).hexdigest()[:32] + extension)
+
+
+def open_preview_image(source_path, max_size):
+    """Decode just enough of the source to fill ``max_size``"""
+    extension = os.path.splitext(source_path)[1].lower()
+    if extension == '.pdf':
+        return render_page_image(source_path, 0, max_size=max_size)
+
+    if extension == '.zip':
+        # Rendered PDF pages: preview the first one
+        with zipfile.ZipFile(source_path) as archive:
+            with archive.open(archive.namelist()[0]) as page:
+                with Image.open(page) as img:
+                    img.thumbnail(max_size)
+                    return img.copy()
+
+    with Image.open(source_path) as img:
+        # thumbnail() drafts JPEGs to the smallest DCT scale that still covers max_size,
+        # and only the reduced image is turned upright
+        oriented = thumbnail_oriented(img, max_size, get_orientation(img), Image.Resampling.BICUBIC)
+        # Detached from the file, which closes on return
+        return oriented.copy() if oriented is img else oriented
+
+
+def build_preview(source_path, output_path, max_size=(320, 320), preview_format='WEBP'):
+    """Write a preview of ``source_path`` to ``output_path``; returns None if it cannot be made"""
+    try:
+        img = flatten_to_rgb(open_preview_image(source_path, max_size))
+        # Unique per writer, as two requests may build the same preview at once
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(output_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                img.save(f, preview_format, quality=80)
+            os.replace(temp_path, output_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return output_path
+    except Exception as e:
+        logger.warning(f"Could not build preview for {source_path}: {str(e)}")
+        return None
+
+
+def enforce_cache_limit():
+    """Delete least recently used previews until the cache fits its byte cap"""
+    max_bytes = getattr(settings, 'PREVIEW_CACHE_MAX_BYTES', 100 * 1024 * 1024)
+    if not max_bytes:
+        return
+
+    entries = []
+    total = 0
+    with os.scandir(get_preview_dir()) as it:
+        for entry in it:
+            if entry.is_file():
+                stat_result = entry.stat()
+                entries.append((stat_result.st_mtime, stat_result.st_size, entry.path))
+                total += stat_result.st_size
+
+    if total <= max_bytes:
+        return
+    for _, size, path in sorted(entries):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        total -= size
+        if total <= max_bytes:
+            break
+
+
+def get_previews(jobs, source):
+    """
+    Return ``{job_id: preview path or None}``, building the missing previews
+    and touching cached ones for LRU eviction.
+    """
+    max_size = tuple(getattr(settings, 'PREVIEW_MAX_SIZE', (320, 320)))
+    preview_format = get_preview_format()
+    os.makedirs(get_preview_dir(), exist_ok=True)
+
+    previews = {}
+    missing = {}
+    for job in jobs:
+        source_path = resolve_source(job, source)
+        if source_path is None:
+            previews[job.id] = None
+            continue
+
+        path = preview_path(source_path, max_size, preview_format)
+        try:
+            # Cache hit; mtime doubles as the last-used time
+            os.utime(path)
+            previews[job.id] = path
+        except FileNotFoundError:
+            missing.setdefault((source_path, path), []).append(job.id)
+
+    if missing:
+        for (source_path, path), job_ids in missing.items():
+            built = build_preview(source_path, path, max_size=max_size, preview_format=preview_format)
+            for job_id in job_ids:
+                previews[job_id] = built
+        enforce_cache_limit()
+
+    return previews
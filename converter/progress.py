@@ -0,0 +1,183 @@
+# converter/progress.py - Job progress events
+"""
+Lightweight pub/sub for conversion progress. Events are published to an
+in-process broker that pushes them to the Server-Sent Events streams of
+this process, and are also written to the Django cache so streams served
+by another process (Celery or DB workers, several ASGI workers) can pick
+them up when the cache is shared. Neither path touches the database.
+
+Events are dicts with ``job_id``, ``event`` (queued, processing, page,
+encoding, completed or failed), ``seq`` and event-specific fields such as
+``page``/``pages``.
+
+Streams need the ASGI entry point (file_converter/asgi.py): WSGI servers
+buffer a streamed response until it ends, so under WSGI the events view
+answers 204 and the processing page polls /status/ instead.
+"""
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_EVENTS = ('completed', 'failed')
+
+# Event announced for a job whose progress was never published (e.g. a restart)
+STATUS_EVENTS = {
+    'pending': 'queued',
+    'processing': 'processing',
+    'completed': 'completed',
+    'failed': 'failed',
+}
+
+CACHE_KEY_PREFIX = 'conversion_progress:'
+CACHE_TIMEOUT = 60 * 60
+
+# Set in engine worker processes to relay events to the parent process
+_sink = None
+
+
+class ProgressBroker:
+    """Latest event per job plus asyncio subscribers, safe to publish to from any thread"""
+
+    def __init__(self, max_jobs=10000):
+        self.max_jobs = max_jobs
+        self._latest = OrderedDict()
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, event):
+        """Store and push ``event``; events older than the job's latest are dropped"""
+        job_id = event['job_id']
+        with self._lock:
+            latest = self._latest.get(job_id)
+            if latest is not None and latest['seq'] > event['seq']:
+                # Relayed from a worker process after the job had moved on
+                return False
+            self._latest[job_id] = event
+            self._latest.move_to_end(job_id)
+            while len(self._latest) > self.max_jobs:
+                self._latest.popitem(last=False)
+            subscribers = list(self._subscribers.get(job_id, ()))
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The stream's event loop is gone
+                self.unsubscribe(job_id, (loop, queue))
+        return True
+
+    def latest(self, job_id):
+        with self._lock:
+            return self._latest.get(job_id)
+
+    def subscribe(self, job_id):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.setdefault(job_id, []).append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, job_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(job_id, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+            if not subscribers:
+                self._subscribers.pop(job_id, None)
+
+
+broker = ProgressBroker()
+
+
+def publish(job_id, event, seq=None, **data):
+    """Record and push a progress event for ``job_id``"""
+    job_id = str(job_id)
+    payload = {'job_id': job_id, 'event': event, 'seq': seq or time.time_ns(), **data}
+    if not broker.publish(payload):
+        return None
+    try:
+        cache.set(f'{CACHE_KEY_PREFIX}{job_id}', payload, CACHE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Could not cache progress for job {job_id}: {str(e)}")
+    return payload
+
+
+def report_progress(job_id, event, **data):
+    """Publish from converter code, which may be running in an engine worker process"""
+    if _sink is not None:
+        # Stamp the event now so it sorts correctly however late it is relayed
+        _sink.put((str(job_id), event, {'seq': time.time_ns(), **data}))
+    else:
+        publish(job_id, event, **data)
+
+
+def latest_event(job_id):
+    """Newest known event for a job from this process or the shared cache, or None"""
+    job_id = str(job_id)
+    local = broker.latest(job_id)
+    try:
+        shared = cache.get(f'{CACHE_KEY_PREFIX}{job_id}')
+    except Exception:
+        shared = None
+    if local is None or (shared is not None and shared['seq'] > local['seq']):
+        return shared
+    return local
+
+
+def event_from_job(job):
+    """Starting event for a job nothing has been published about, built from its row"""
+    event = {'job_id': str(job.id), 'event': STATUS_EVENTS.get(job.status, job.status), 'seq': 0}
+    if job.status == 'completed':
+        event.update(download_url=f'/download/{job.id}/', redirect_url=f'/download-page/{job.id}/')
+    elif job.status == 'failed':
+        event['error'] = job.error_message
+    return event
+
+
+def format_event(event):
+    return f"id: {event['seq']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def stream_events(job_id, initial):
+    """
+    Async generator of Server-Sent Events for one job, ending after a
+    terminal event or ``PROGRESS_STREAM_TIMEOUT`` seconds (the browser
+    reconnects on its own). Events from this process are pushed as they
+    happen; the shared cache is checked every ``PROGRESS_POLL_INTERVAL``
+    seconds for events published elsewhere.
+    """
+    job_id = str(job_id)
+    poll_interval = getattr(settings, 'PROGRESS_POLL_INTERVAL', 2)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + getattr(settings, 'PROGRESS_STREAM_TIMEOUT', 300)
+
+    subscriber = broker.subscribe(job_id)
+    try:
+        # Anything published between the caller's lookup and subscribing
+        latest = await sync_to_async(latest_event)(job_id)
+        last = latest if latest is not None and latest['seq'] > initial['seq'] else initial
+        yield f"retry: {int(poll_interval * 1000)}\n" + format_event(last)
+
+        while last['event'] not in TERMINAL_EVENTS and loop.time() < deadline:
+            try:
+                event = await asyncio.wait_for(subscriber[1].get(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                event = await sync_to_async(latest_event)(job_id)
+                if event is None or event['seq'] <= last['seq']:
+                    yield ': keep-alive\n\n'
+                    continue
+
+            if event['seq'] <= last['seq']:
+                continue
+            last = event
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(job_id, subscriber)
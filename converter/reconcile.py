@@ -0,0 +1,160 @@
+# converter/reconcile.py - Reconcile media files with ConversionJob rows
+"""
+Finds what cleanup_old_files cannot see: files on disk whose job row is
+gone, abandoned ``.part`` uploads, and completed jobs whose converted file
+has disappeared.
+
+Directory listings are streamed with ``os.scandir`` and checked against
+the database one batch of job ids at a time, and jobs and artifacts are
+walked in pk-ordered chunks, so memory stays bounded however many files or
+rows there are. Files younger than the grace period are never touched, as
+a live upload may not have its row committed yet. Orphaned files are only
+looked for in local storage directories; remote buckets are better served
+by their own lifecycle rules.
+"""
+import os
+import time
+import uuid
+import logging
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .cleanup import JOB_ID_LENGTH, get_media_dirs, remove_file
+from .models import ConversionArtifact, ConversionJob
+from .storage import OUTPUT_DIR, UPLOAD_DIR, output_exists
+
+logger = logging.getLogger(__name__)
+
+MISSING_FILE_ERROR = 'The converted file is no longer available'
+
+
+def iter_batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_media_files(directory):
+    """Yield ``(job_id, DirEntry)`` for files in ``directory``; job_id is None when the name has none"""
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                name = entry.name
+                job_id = None
+                if len(name) > JOB_ID_LENGTH and name[JOB_ID_LENGTH] == '_':
+                    try:
+                        job_id = str(uuid.UUID(name[:JOB_ID_LENGTH]))
+                    except ValueError:
+                        pass
+                yield job_id, entry
+    except FileNotFoundError:
+        return
+
+
+def is_settled(entry, cutoff):
+    try:
+        return entry.stat(follow_symlinks=False).st_mtime < cutoff
+    except FileNotFoundError:
+        return False
+
+
+def remove_orphaned_files(name, directory, report, cutoff, dry_run, batch_size):
+    """Delete settled files in ``directory`` that no job or artifact refers to"""
+    for batch in iter_batches(iter_media_files(directory), batch_size):
+        job_ids = {job_id for job_id, _ in batch if job_id}
+        known = {str(pk) for pk in ConversionJob.objects.filter(pk__in=job_ids).values_list('pk', flat=True)}
+        shared = set()
+        if name == OUTPUT_DIR:
+            # Artifacts outlive the job that produced their file
+            shared = set(
+                ConversionArtifact.objects.filter(converted_filename__in=[entry.name for _, entry in batch])
+                .values_list('converted_filename', flat=True)
+            )
+
+        for job_id, entry in batch:
+            if job_id is None:
+                # Spooled uploads are renamed into place once their job exists
+                if name == UPLOAD_DIR and entry.name.endswith('.part') and is_settled(entry, cutoff):
+                    if remove_file(entry.path, report, dry_run):
+                        report['partial_uploads'] += 1
+                continue
+            if job_id in known or entry.name in shared or not is_settled(entry, cutoff):
+                continue
+            remove_file(entry.path, report, dry_run)
+
+
+def fail_jobs_missing_files(report, cutoff, dry_run, chunk_size):
+    """Mark completed jobs whose converted file is gone as failed"""
+    completed = ConversionJob.objects.filter(status='completed', created_at__lt=cutoff).order_by('pk')
+    last_pk = None
+    while True:
+        page = completed if last_pk is None else completed.filter(pk__gt=last_pk)
+        chunk = list(page.values_list('pk', 'converted_filename')[:chunk_size])
+        if not chunk:
+            break
+        last_pk = chunk[-1][0]
+
+        missing = [pk for pk, filename in chunk if not filename or not output_exists(filename)]
+        if missing and not dry_run:
+            # Only jobs still marked completed, in case a worker touched them meanwhile
+            missing_count = ConversionJob.objects.filter(pk__in=missing, status='completed').update(
+                status='failed', error_message=MISSING_FILE_ERROR, artifact=None,
+            )
+        else:
+            missing_count = len(missing)
+        report['jobs_failed'] += missing_count
+
+
+def drop_missing_artifacts(report, dry_run, chunk_size):
+    """Delete cache entries whose shared file is gone"""
+    artifacts = ConversionArtifact.objects.order_by('pk')
+    last_pk = 0
+    while True:
+        chunk = list(artifacts.filter(pk__gt=last_pk).values_list('pk', 'converted_filename')[:chunk_size])
+        if not chunk:
+            break
+        last_pk = chunk[-1][0]
+
+        missing = [pk for pk, filename in chunk if not output_exists(filename)]
+        if missing and not dry_run:
+            _, deleted = ConversionArtifact.objects.filter(pk__in=missing).delete()
+            report['artifacts'] += deleted.get(ConversionArtifact._meta.label, 0)
+        else:
+            report['artifacts'] += len(missing)
+
+
+def reconcile_media(grace=timedelta(hours=1), dry_run=False, batch_size=1000):
+    """
+    Delete orphaned media files, drop cache entries and fail completed jobs
+    whose converted file is missing.
+
+    Returns a report dict with the files (and ``.part`` uploads among them)
+    and bytes reclaimed, the jobs marked failed and the artifacts dropped;
+    with ``dry_run`` the counts are what would change.
+    """
+    started = time.monotonic()
+    report = {'files': 0, 'bytes': 0, 'partial_uploads': 0, 'jobs_failed': 0, 'artifacts': 0, 'errors': 0}
+    cutoff = timezone.now() - grace
+
+    drop_missing_artifacts(report, dry_run, batch_size)
+    fail_jobs_missing_files(report, cutoff, dry_run, batch_size)
+    for name, directory in get_media_dirs().items():
+        if directory is None:
+            logger.info(f"Skipping orphan scan of {name}: not on a local storage")
+            continue
+        remove_orphaned_files(name, directory, report, cutoff.timestamp(), dry_run, batch_size)
+
+    logger.info(
+        f"{'Would reconcile' if dry_run else 'Reconciled'} media in {time.monotonic() - started:.1f}s: "
+        f"{report['files']} orphaned files ({report['bytes']} bytes, {report['partial_uploads']} partial uploads), "
+        f"{report['jobs_failed']} jobs with missing files, {report['artifacts']} missing artifacts"
+    )
+    return report
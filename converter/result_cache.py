@@ -0,0 +1,115 @@
+# converter/result_cache.py - Content-addressed cache of converted files
+"""
+Identical uploads converted with identical options produce identical output,
+so the first converted file is kept as a ConversionArtifact and later jobs
+point at it instead of converting again. An artifact's reference count is
+the number of jobs linked to it; cleanup only removes the file once that
+count drops to zero.
+
+Hit and miss counts are kept in the database (CacheCounter) rather than
+in Django's cache, which is per process with the local-memory backend.
+"""
+import json
+import hashlib
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import CacheCounter, ConversionArtifact
+from .storage import output_exists
+
+logger = logging.getLogger(__name__)
+
+HITS = 'hits'
+MISSES = 'misses'
+
+
+def is_enabled():
+    return getattr(settings, 'CONVERSION_CACHE_ENABLED', True)
+
+
+def build_cache_key(content_digests, conversion_type, options=None):
+    """Key over the ordered input digests, the conversion type and its options"""
+    hasher = hashlib.sha256()
+    for digest in content_digests:
+        hasher.update(digest.encode())
+        hasher.update(b'\0')
+    hasher.update(conversion_type.encode())
+    hasher.update(json.dumps(options or {}, sort_keys=True).encode())
+    return hasher.hexdigest()
+
+
+def _incr(name):
+    if CacheCounter.objects.filter(name=name).update(value=F('value') + 1):
+        return
+    try:
+        with transaction.atomic():
+            CacheCounter.objects.create(name=name, value=1)
+    except IntegrityError:
+        # Another process created the row first
+        CacheCounter.objects.filter(name=name).update(value=F('value') + 1)
+
+
+def lookup_artifact(cache_key):
+    """
+    Return the artifact for ``cache_key`` if its file is still stored, counting the hit or miss.
+    
+    Called inside a transaction, the hit's row update locks the artifact until
+    it commits, so cleanup cannot delete it before a job links to it.
+    """
+    artifact = ConversionArtifact.objects.filter(cache_key=cache_key).first()
+    if artifact is not None:
+        if output_exists(artifact.converted_filename):
+            updated = ConversionArtifact.objects.filter(pk=artifact.pk).update(
+                hit_count=F('hit_count') + 1, last_used_at=timezone.now()
+            )
+            if updated:
+                _incr(HITS)
+                return artifact
+            # Deleted by cleanup since it was read
+            _incr(MISSES)
+            return None
+
+        # The file went away underneath us; forget the entry
+        logger.warning(f"Cached artifact {artifact.converted_filename} is missing, dropping cache entry")
+        artifact.delete()
+
+    _incr(MISSES)
+    return None
+
+
+def store_artifact(job):
+    """Publish a freshly converted job's file as the artifact for its cache key"""
+    if not job.cache_key or not job.converted_filename:
+        return None
+    try:
+        with transaction.atomic():
+            artifact = ConversionArtifact.objects.create(
+                cache_key=job.cache_key,
+                converted_filename=job.converted_filename,
+            )
+    except IntegrityError:
+        # An identical upload finished first; keep this job's own file
+        return None
+    job.artifact = artifact
+    job.save(update_fields=['artifact'])
+    return artifact
+
+
+def get_cache_stats():
+    """Hit/miss counters plus the shared artifacts and the hits on those still stored"""
+    counters = dict(CacheCounter.objects.filter(name__in=(HITS, MISSES)).values_list('name', 'value'))
+    hits = counters.get(HITS, 0)
+    misses = counters.get(MISSES, 0)
+    lookups = hits + misses
+    artifacts = ConversionArtifact.objects.aggregate(count=Count('pk'), hits=Sum('hit_count'))
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / lookups if lookups else 0.0,
+        'artifacts': artifacts['count'],
+        'artifact_hits': artifacts['hits'] or 0,
+    }
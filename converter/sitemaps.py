@@ -1,32 +1,62 @@
 # converter/sitemaps.py
+"""
+Sitemap for the public pages, with hreflang alternates for every language
+in ``settings.LANGUAGES``. lastmod comes from the page's template, the base
+template and the compiled catalogs, so it only moves when the page does.
+
+The XML is rendered once into ``SITEMAP_ROOT`` (plain and gzipped) by
+``manage.py update_sitemap`` or on the first request after a template or
+catalog changes, and served from there.
+"""
+import os
+import gzip
+import datetime
+import tempfile
+from types import SimpleNamespace
+
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.template import loader
 from django.urls import reverse
-from django.utils import timezone
-from datetime import datetime, timedelta
+
+from .page_cache import get_newest_mtime, watched_files
+
+BASE_TEMPLATE = 'base.html'
+
+
+def template_mtime(template_name):
+    return os.stat(loader.get_template(template_name).origin.name).st_mtime
+
+
+def catalogs_mtime():
+    """Newest compiled translation catalog, or 0 without any"""
+    mtimes = [os.stat(path).st_mtime for path in watched_files() if path.endswith('.mo')]
+    return max(mtimes, default=0)
 
 
 class StaticViewSitemap(Sitemap):
     """Sitemap for static pages"""
-    priority = 0.8
-    changefreq = 'weekly'
-    protocol = 'https'
+    i18n = True
+    alternates = True
+    x_default = True
+
+    templates = {
+        'converter:home': 'converter/home.html',
+        'converter:privacy_policy': 'converter/privacy_policy.html',
+        'converter:terms_of_service': 'converter/terms_of_service.html',
+        'converter:contact_us': 'converter/contact_us.html',
+    }
 
     def items(self):
-        return [
-            'converter:home',
-            'converter:privacy_policy', 
-            'converter:terms_of_service',
-            'converter:contact_us'
-        ]
+        return list(self.templates)
 
     def location(self, item):
         return reverse(item)
 
     def lastmod(self, item):
-        # Return last modified date - you can customize this
-        if item == 'converter:home':
-            return timezone.now().date()
-        return timezone.now().date() - timedelta(days=7)
+        # A page changes when its template, the base layout or its translations do
+        mtime = max(template_mtime(self.templates[item]), template_mtime(BASE_TEMPLATE), catalogs_mtime())
+        return datetime.datetime.fromtimestamp(mtime, tz=datetime.timezone.utc)
 
     def priority(self, item):
         # Set priority based on page importance
@@ -43,43 +73,70 @@ class StaticViewSitemap(Sitemap):
         frequencies = {
             'converter:home': 'daily',
             'converter:privacy_policy': 'monthly',
-            'converter:terms_of_service': 'monthly', 
+            'converter:terms_of_service': 'monthly',
             'converter:contact_us': 'monthly'
         }
         return frequencies.get(item, 'weekly')
 
 
-class ToolsSitemap(Sitemap):
-    """Sitemap for conversion tools/services"""
-    priority = 0.9
-    changefreq = 'weekly'
-    protocol = 'https'
+# Register sitemaps
+sitemaps = {
+    'static': StaticViewSitemap,
+}
+
+
+def get_sitemap_protocol():
+    return 'https' if getattr(settings, 'SITEMAP_USE_HTTPS', True) else 'http'
 
-    def items(self):
-        return [
-            'jpg-to-pdf',
-            'png-to-pdf',
-            'gif-to-pdf',
-            'image-to-pdf',
-            'batch-convert-jpg-to-pdf'
-        ]
 
-    def location(self, item):
-        # All tools currently go to home page with fragments
-        return reverse('converter:home')
+def render_sitemap(domain, protocol=None):
+    """Render sitemap.xml for ``domain`` as bytes"""
+    protocol = protocol or get_sitemap_protocol()
+    site = SimpleNamespace(domain=domain, name=domain)
+    urls = []
+    for sitemap_class in sitemaps.values():
+        sitemap = sitemap_class()
+        for page in sitemap.paginator.page_range:
+            urls.extend(sitemap.get_urls(page=page, site=site, protocol=protocol))
+    return loader.render_to_string('sitemap.xml', {'urlset': urls}).encode()
 
-    def lastmod(self, item):
-        return timezone.now().date()
 
-    def priority(self, item):
-        # JPG to PDF is main service
-        if item == 'jpg-to-pdf':
-            return 1.0
-        return 0.8
+def get_sitemap_paths(domain):
+    """Plain and gzipped artifact paths for ``domain``"""
+    root = getattr(settings, 'SITEMAP_ROOT', os.path.join(settings.MEDIA_ROOT, 'sitemap'))
+    name = ''.join(char if char.isalnum() or char in '.-' else '_' for char in domain)
+    path = os.path.join(root, f'sitemap-{name}.xml')
+    return path, f'{path}.gz'
 
 
-# Register sitemaps
-sitemaps = {
-    'static': StaticViewSitemap,
-    'tools': ToolsSitemap,
-}
\ No newline at end of file
+def write_sitemap(domain, protocol=None):
+    """Render and atomically write both artifacts; returns their paths"""
+    path, gz_path = get_sitemap_paths(domain)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    content = render_sitemap(domain, protocol)
+
+    for target, data in ((path, content), (gz_path, gzip.compress(content, compresslevel=9, mtime=0))):
+        # A unique temp file per writer: concurrent requests may rebuild at the same time
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=f'{os.path.basename(target)}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    return path, gz_path
+
+
+def get_sitemap(domain):
+    """Artifact paths for ``domain``, rebuilt when missing or older than a template or catalog"""
+    path, gz_path = get_sitemap_paths(domain)
+    try:
+        fresh = os.stat(gz_path).st_mtime >= get_newest_mtime() and os.path.exists(path)
+    except FileNotFoundError:
+        fresh = False
+    if not fresh:
+        write_sitemap(domain)
+    return path, gz_path
@@ -0,0 +1,122 @@
+# converter/storage.py - Storage backends for conversion inputs and outputs
+"""
+Uploads live in ``default_storage`` under ``uploads/``; converted files go
+to the storage named by ``CONVERSION_STORAGE`` (an alias in ``STORAGES``,
+'default' unless configured) under ``converted/``. Either may be a local
+``FileSystemStorage`` or a remote backend such as an S3-compatible bucket.
+
+Converters work on local paths: inputs from a storage without ``path()``
+are streamed into the scratch directory first, and outputs are written
+there and then handed to the output storage, which streams them in chunks
+(multipart for S3 backends). With a local output storage and no scratch
+directory configured, converters write straight into its ``converted/``
+directory and nothing is copied.
+
+- ``CONVERSION_STORAGE``: ``STORAGES`` alias for converted files
+- ``CONVERSION_SCRATCH_DIR``: local directory for in-flight files, e.g. on tmpfs
+"""
+import os
+import shutil
+import tempfile
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage, storages
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = 'uploads'
+OUTPUT_DIR = 'converted'
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+class ScratchFile(File):
+    """A finished scratch file; local storages move it into place instead of copying"""
+
+    def temporary_file_path(self):
+        return self.name
+
+
+def get_input_storage():
+    return default_storage
+
+
+def get_output_storage():
+    return storages[getattr(settings, 'CONVERSION_STORAGE', 'default')]
+
+
+def local_path(storage, name):
+    """Filesystem path of ``name`` in ``storage``, or None for remote backends"""
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        return None
+
+
+def output_name(filename):
+    return f"{OUTPUT_DIR}/{filename}"
+
+
+def get_scratch_dir():
+    """Directory converters write into, created on demand"""
+    scratch_dir = getattr(settings, 'CONVERSION_SCRATCH_DIR', None)
+    if not scratch_dir:
+        scratch_dir = local_path(get_output_storage(), OUTPUT_DIR)
+    if not scratch_dir:
+        scratch_dir = os.path.join(tempfile.gettempdir(), 'conversion-scratch')
+    os.makedirs(scratch_dir, exist_ok=True)
+    return scratch_dir
+
+
+@contextmanager
+def local_inputs(names):
+    """Yield local paths for input storage ``names``, streaming remote ones into scratch files"""
+    storage = get_input_storage()
+    fetched = []
+    try:
+        paths = []
+        for name in names:
+            path = local_path(storage, name)
+            if path is None:
+                # Keep the basename: converters look at the extension
+                path = os.path.join(get_scratch_dir(), f"input-{os.path.basename(name)}")
+                fetched.append(path)
+                with storage.open(name, 'rb') as source, open(path, 'wb') as target:
+                    shutil.copyfileobj(source, target, STREAM_CHUNK_SIZE)
+            paths.append(path)
+        yield paths
+    finally:
+        for path in fetched:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def publish_output(path):
+    """Store a converted scratch file in the output storage; returns its storage name"""
+    storage = get_output_storage()
+    name = output_name(os.path.basename(path))
+    if local_path(storage, name) == path:
+        return name
+
+    try:
+        with open(path, 'rb') as f:
+            name = storage.save(name, ScratchFile(f, name=path))
+    finally:
+        # Local storages moved it already
+        if os.path.exists(path):
+            os.remove(path)
+    logger.info(f"Stored converted file as {name}")
+    return name
+
+
+def output_exists(filename):
+    return get_output_storage().exists(output_name(filename))
+
+
+def delete_output(filename):
+    get_output_storage().delete(output_name(filename))
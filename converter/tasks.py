@@ -0,0 +1,261 @@
+# converter/tasks.py - Background conversion queue
+"""
+Conversion jobs are created by the upload views and handed to a queue
+backend selected with ``settings.CONVERSION_QUEUE_BACKEND``:
+
+- ``celery``: dispatch to Celery workers (uses the ``CELERY_*`` settings)
+- ``thread``: run in an in-process thread pool (local fallback)
+- ``db``: leave the row pending for ``manage.py run_conversion_worker``
+- ``sync``: run inline in the request (useful for tests)
+
+The thread backend loses its queue when the process stops, so when it
+starts it requeues pending jobs and fails processing ones older than
+``CONVERSION_STALE_JOB_AGE`` seconds; younger jobs may belong to another
+live process.
+"""
+import os
+import logging
+import weakref
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .engine import get_engine
+from .models import ConversionJob
+from .progress import publish
+from .result_cache import store_artifact
+
+try:
+    from celery import shared_task
+    HAS_CELERY = True
+except ImportError:
+    HAS_CELERY = False
+
+logger = logging.getLogger(__name__)
+
+QUEUE_BACKENDS = ('celery', 'thread', 'db', 'sync')
+
+# Backends that convert inside this process and so share its conversion engine
+IN_PROCESS_BACKENDS = ('thread', 'sync')
+
+STALE_JOB_ERROR = 'The conversion was interrupted by a server restart, please upload the file again'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_queue_backend():
+    """Return the configured queue backend, falling back when unavailable"""
+    backend = getattr(settings, 'CONVERSION_QUEUE_BACKEND', 'thread')
+    if backend not in QUEUE_BACKENDS:
+        logger.warning(f"Unknown conversion queue backend '{backend}', using 'thread'")
+        return 'thread'
+    if backend == 'celery' and not HAS_CELERY:
+        logger.warning("Celery is not installed, using 'thread' conversion queue")
+        return 'thread'
+    return backend
+
+
+def _get_executor():
+    """Lazily create the in-process worker pool, picking up jobs a previous process left behind"""
+    global _executor
+    started = False
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = getattr(settings, 'CONVERSION_QUEUE_WORKERS', 2)
+                engine = get_engine()
+                if engine is not None:
+                    # Threads only wait on the process pool, one per admitted job
+                    max_workers = max(max_workers, engine.capacity)
+                _executor = ThreadPoolExecutor(
+                    max_workers=max_workers,
+                    thread_name_prefix='conversion',
+                )
+                started = True
+    if started:
+        try:
+            reclaim_stale_jobs()
+        except Exception as e:
+            logger.error(f"Could not reclaim stale conversion jobs: {str(e)}")
+    return _executor
+
+
+def reclaim_stale_jobs(max_age=None):
+    """
+    Requeue pending jobs and fail processing ones that no process has
+    touched for ``max_age``; returns ``(requeued, failed)``.
+
+    A processing job is not retried, as whatever stopped the process may
+    have been the conversion itself.
+    """
+    if max_age is None:
+        max_age = timedelta(seconds=getattr(settings, 'CONVERSION_STALE_JOB_AGE', 1800))
+    stale = ConversionJob.objects.filter(created_at__lt=timezone.now() - max_age)
+
+    failed = 0
+    for job_id in list(stale.filter(status='processing').values_list('id', flat=True)):
+        if ConversionJob.objects.filter(id=job_id, status='processing').update(
+                status='failed', error_message=STALE_JOB_ERROR):
+            publish(job_id, 'failed', error=STALE_JOB_ERROR)
+            failed += 1
+
+    requeued = 0
+    for job_id in list(stale.filter(status='pending').exclude(input_path='').values_list('id', flat=True)):
+        # Claimed here so that two starting processes never both run it; no engine
+        # slot is reserved, the job simply waits for a free worker
+        if claim_job(job_id):
+            _get_executor().submit(_run_in_thread, str(job_id), claimed=True)
+            requeued += 1
+
+    if requeued or failed:
+        logger.warning(f"Requeued {requeued} and failed {failed} conversion jobs left over by a stopped process")
+    return requeued, failed
+
+
+def accepting_conversions():
+    """False when this process converts jobs itself and its engine is full"""
+    if get_queue_backend() not in IN_PROCESS_BACKENDS:
+        return True
+    engine = get_engine()
+    return engine is None or engine.has_capacity()
+
+
+def enqueue_conversion(job):
+    """
+    Hand a pending job to the queue backend once the row is committed.
+
+    In-process backends reserve a conversion engine slot first and raise
+    EngineSaturated when none is free. The slot is handed on to the job, or
+    returned if the transaction rolls back and the job is never dispatched.
+    """
+    backend = get_queue_backend()
+    job_id = str(job.id)
+
+    engine = get_engine() if backend in IN_PROCESS_BACKENDS else None
+    if engine is not None:
+        engine.reserve()
+    state = {'dispatched': False}
+
+    def dispatch():
+        state['dispatched'] = True
+        publish(job_id, 'queued')
+        if backend == 'celery':
+            convert_job_task.delay(job_id)
+        elif backend == 'thread':
+            try:
+                _get_executor().submit(_run_in_thread, job_id, engine)
+            except Exception:
+                if engine is not None:
+                    engine.release()
+                raise
+        elif backend == 'sync':
+            try:
+                run_conversion_job(job_id)
+            finally:
+                if engine is not None:
+                    engine.release()
+        # 'db': the row stays pending until a worker claims it
+
+    if engine is not None:
+        # Django drops the on_commit callbacks of a rolled-back transaction
+        # without running them, which is when this fires
+        weakref.finalize(dispatch, _release_undispatched, engine, state, job_id)
+    transaction.on_commit(dispatch)
+    logger.info(f"Queued conversion job {job_id} on '{backend}' backend")
+
+
+def _release_undispatched(engine, state, job_id):
+    if not state['dispatched']:
+        logger.info(f"Conversion job {job_id} was rolled back, releasing its engine slot")
+        engine.release()
+
+
+def claim_job(job_id):
+    """Atomically move a job from pending to processing; False if already taken"""
+    return ConversionJob.objects.filter(id=job_id, status='pending').update(status='processing') == 1
+
+
+def claim_next_job(batch_size=10):
+    """Claim the oldest pending job for a DB-backed worker, or return None"""
+    candidates = (
+        ConversionJob.objects.filter(status='pending')
+        .exclude(input_path='')
+        .order_by('created_at')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    for job_id in candidates:
+        if claim_job(job_id):
+            return job_id
+    return None
+
+
+def run_conversion_job(job_id, claimed=False):
+    """Run the conversion for a queued job and record the outcome"""
+    from .views import process_conversion
+
+    if not claimed and not claim_job(job_id):
+        logger.info(f"Conversion job {job_id} already claimed, skipping")
+        return False
+
+    job = ConversionJob.objects.get(id=job_id)
+    publish(job.id, 'processing')
+
+    try:
+        stats = {}
+        result_path = process_conversion(
+            job.input_path, job.conversion_type, job.id,
+            input_paths=job.input_paths, stats=stats, options=job.options
+        )
+
+        job.converted_filename = os.path.basename(result_path)
+        job.status = 'completed'
+        job.completed_at = timezone.now()
+        job.conversion_details = stats
+        job.save(update_fields=['converted_filename', 'status', 'completed_at', 'conversion_details'])
+
+        if job.cache_key:
+            store_artifact(job)
+
+        publish(job.id, 'completed', download_url=f'/download/{job.id}/', redirect_url=f'/download-page/{job.id}/')
+        logger.info(f"Conversion completed for job {job.id}")
+        return True
+
+    except Exception as e:
+        logger.error(f"Conversion failed for job {job.id}: {str(e)}")
+        job.status = 'failed'
+        job.error_message = str(e)
+        job.save(update_fields=['status', 'error_message'])
+        publish(job.id, 'failed', error=job.error_message)
+
+        # Clean up uploaded files
+        for input_path in job.input_paths or [job.input_path]:
+            try:
+                if default_storage.exists(input_path):
+                    default_storage.delete(input_path)
+            except Exception:
+                pass
+
+        return False
+
+
+def _run_in_thread(job_id, engine=None, claimed=False):
+    """Thread-pool entry point that keeps DB connections and engine slots tidy"""
+    close_old_connections()
+    try:
+        run_conversion_job(job_id, claimed=claimed)
+    except Exception as e:
+        logger.error(f"Conversion worker crashed on job {job_id}: {str(e)}")
+    finally:
+        if engine is not None:
+            engine.release()
+        close_old_connections()
+
+
+if HAS_CELERY:
+    convert_job_task = shared_task(name='converter.run_conversion_job', ignore_result=True)(run_conversion_job)
@@ -1,3 +1,1067 @@
-from django.test import TestCase
+import os
+import re
+import json
+import math
+import time
+import uuid
+import asyncio
+import hashlib
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.db import transaction
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+
+from . import cleanup, pdf_render, png_optimize, progress, result_cache, tasks, views
+from .cleanup import delete_unused_artifacts
+from .compression import probe_qualities
+from .downloads import if_range_matches, parse_range
+from .engine import ConversionEngine, run_converter
+from .image_utils import flatten_to_rgb
+from .memory_guard import PDF_RENDER_BYTES_PER_PIXEL, ImageTooLarge, plan_pdf_render
+from .models import CacheCounter, ConversionArtifact, ConversionJob
+from .orientation import ORIENTATION_TAG, TRANSPOSED_ORIENTATIONS, apply_orientation, page_matrix
+from .page_cache import cached_page
+from .page_layout import plan_layout
+from .progress import ProgressBroker, latest_event, publish, stream_events
+from .reconcile import MISSING_FILE_ERROR, reconcile_media
+from .tasks import enqueue_conversion
+from .uploadhandlers import get_upload_digests, get_upload_error, sniff_mime_type
+from .views import compress_image, convert_images_to_pdf
+
+
+class DownloadOffloadTests(TestCase):
+    """Check the headers handed to nginx/Apache without running a front-end server"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.job = ConversionJob.objects.create(
+            conversion_type='jpg_to_pdf',
+            original_filename='photo.jpg',
+            status='completed',
+        )
+        self.job.converted_filename = f'{self.job.id}_converted.pdf'
+        self.job.save()
+        self.url = f'/download/{self.job.id}/'
+
+    def test_nginx_accel_redirect(self):
+        with override_settings(MEDIA_ROOT=self.media_root, DOWNLOAD_OFFLOAD='nginx',
+                               DOWNLOAD_OFFLOAD_URL_PREFIX='/protected-media/'):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/converted/{self.job.converted_filename}')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn(self.job.converted_filename, response['Content-Disposition'])
+        self.assertEqual(response.content, b'')
+
+    def test_x_sendfile(self):
+        with override_settings(MEDIA_ROOT=self.media_root, DOWNLOAD_OFFLOAD='sendfile'):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['X-Sendfile'],
+            os.path.join(self.media_root, 'converted', self.job.converted_filename),
+        )
+        self.assertEqual(response.content, b'')
+
+    def test_offload_still_checks_job_status(self):
+        self.job.status = 'processing'
+        self.job.save()
+
+        with override_settings(MEDIA_ROOT=self.media_root, DOWNLOAD_OFFLOAD='nginx'):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('X-Accel-Redirect'))
+
+    def test_streams_from_django_without_offload(self):
+        os.makedirs(os.path.join(self.media_root, 'converted'))
+        with open(os.path.join(self.media_root, 'converted', self.job.converted_filename), 'wb') as f:
+            f.write(b'%PDF-1.4 test')
+
+        with override_settings(MEDIA_ROOT=self.media_root, DOWNLOAD_OFFLOAD=None):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Accel-Redirect'))
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 test')
+
+
+class RangeRequestTests(TestCase):
+    """Byte ranges and conditional requests served by Django itself"""
+
+    content = b'%PDF-1.4 0123456789'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media_override = override_settings(MEDIA_ROOT=self.media_root, DOWNLOAD_OFFLOAD=None)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.job = ConversionJob.objects.create(
+            conversion_type='jpg_to_pdf', original_filename='photo.jpg', status='completed',
+        )
+        self.job.converted_filename = f'{self.job.id}_converted.pdf'
+        self.job.save()
+        self.path = os.path.join(self.media_root, 'converted', self.job.converted_filename)
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+        self.url = f'/download/{self.job.id}/'
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=2-5', 10), (2, 5))
+        self.assertEqual(parse_range('bytes=4-', 10), (4, 9))
+        self.assertEqual(parse_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(parse_range('bytes=-30', 10), (0, 9))
+        self.assertEqual(parse_range('bytes=8-20', 10), (8, 9))
+
+    def test_parse_range_unsatisfiable(self):
+        self.assertIs(parse_range('bytes=10-', 10), False)
+        self.assertIs(parse_range('bytes=5-2', 10), False)
+        self.assertIs(parse_range('bytes=-0', 10), False)
+
+    def test_parse_range_unsupported(self):
+        self.assertIsNone(parse_range(None, 10))
+        self.assertIsNone(parse_range('bytes=-', 10))
+        self.assertIsNone(parse_range('bytes=0-1,4-5', 10))
+        self.assertIsNone(parse_range('items=0-1', 10))
+
+    def test_if_range_matches(self):
+        factory = RequestFactory()
+        modified = 1_700_000_000
+
+        self.assertTrue(if_range_matches(factory.get('/'), '"abc"', modified))
+        self.assertTrue(if_range_matches(factory.get('/', HTTP_IF_RANGE='"abc"'), '"abc"', modified))
+        self.assertFalse(if_range_matches(factory.get('/', HTTP_IF_RANGE='"old"'), '"abc"', modified))
+        self.assertTrue(if_range_matches(factory.get('/', HTTP_IF_RANGE=http_date(modified)), '"abc"', modified))
+        self.assertFalse(if_range_matches(factory.get('/', HTTP_IF_RANGE=http_date(modified - 60)), '"abc"', modified))
+        self.assertFalse(if_range_matches(factory.get('/', HTTP_IF_RANGE='not a date'), '"abc"', modified))
+
+    def test_range_returns_partial_content(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes {len(self.content) - 4}-{len(self.content) - 1}/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '4')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-4:])
+
+    def test_open_ended_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=9-')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[9:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_stale_if_range_sends_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"stale"')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_matching_if_range_sends_range(self):
+        etag = self.client.head(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=etag)
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[:4])
+
+    def test_if_none_match_wins_over_range(self):
+        etag = self.client.head(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_if_modified_since(self):
+        modified = self.client.head(self.url)['Last-Modified']
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=modified).status_code, 304)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=http_date(os.stat(self.path).st_mtime - 60)).status_code,
+            200,
+        )
+
+
+class CachedPageCsrfTests(TestCase):
+    """Pages with a CSRF form must not be shared between visitors"""
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def get_form_token(self, client):
+        response = client.get('/contact-us/')
+        self.assertEqual(response.status_code, 200)
+        match = re.search(rb'name="csrfmiddlewaretoken" value="([^"]+)"', response.content)
+        self.assertIsNotNone(match)
+        return response, match.group(1)
+
+    def test_contact_form_token_per_visitor(self):
+        first, first_token = self.get_form_token(Client())
+        second, second_token = self.get_form_token(Client())
+
+        self.assertNotEqual(first_token, second_token)
+        self.assertIn(settings.CSRF_COOKIE_NAME, second.cookies)
+        self.assertNotIn('public', second.get('Cache-Control', ''))
+
+    def test_wrapper_skips_views_that_render_a_token(self):
+        @cached_page
+        def form_view(request):
+            return HttpResponse(get_token(request))
+
+        first = form_view(RequestFactory().get('/form/'))
+        second = form_view(RequestFactory().get('/form/'))
+
+        self.assertNotEqual(first.content, second.content)
+        self.assertFalse(first.has_header('ETag'))
+
+
+class ResultCacheStatsTests(TestCase):
+    """Hit/miss counters must be visible to other processes, so they live in the database"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        os.makedirs(os.path.join(self.media_root, 'converted'))
+        with open(os.path.join(self.media_root, 'converted', 'shared_converted.pdf'), 'wb') as f:
+            f.write(b'%PDF-1.4 test')
+        ConversionArtifact.objects.create(cache_key='a' * 64, converted_filename='shared_converted.pdf')
+
+    def test_counts_hits_and_misses(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            self.assertIsNotNone(result_cache.lookup_artifact('a' * 64))
+            self.assertIsNotNone(result_cache.lookup_artifact('a' * 64))
+            self.assertIsNone(result_cache.lookup_artifact('b' * 64))
+
+        stats = result_cache.get_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        self.assertAlmostEqual(stats['hit_rate'], 2 / 3)
+        self.assertEqual(stats['artifact_hits'], 2)
+        self.assertEqual(CacheCounter.objects.get(name=result_cache.HITS).value, 2)
+
+
+class CleanupArtifactRaceTests(TestCase):
+    """A cache hit landing during cleanup must keep the shared file"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.converted_dir = os.path.join(self.media_root, 'converted')
+        os.makedirs(self.converted_dir)
+
+        old = timezone.now() - timedelta(days=2)
+        self.producer = ConversionJob.objects.create(
+            conversion_type='jpg_to_pdf', original_filename='photo.jpg', status='completed', created_at=old,
+        )
+        self.producer.converted_filename = f'{self.producer.id}_converted.pdf'
+        self.artifact = ConversionArtifact.objects.create(
+            cache_key='c' * 64, converted_filename=self.producer.converted_filename,
+        )
+        self.producer.artifact = self.artifact
+        self.producer.save()
+        self.shared_path = os.path.join(self.converted_dir, self.producer.converted_filename)
+        with open(self.shared_path, 'wb') as f:
+            f.write(b'%PDF-1.4 shared')
+
+    def link_new_job(self):
+        return ConversionJob.objects.create(
+            conversion_type='jpg_to_pdf', original_filename='again.jpg', status='completed',
+            converted_filename=self.artifact.converted_filename, artifact=self.artifact,
+        )
+
+    def test_recheck_keeps_artifact_linked_after_scan(self):
+        self.link_new_job()
+        deleted = delete_unused_artifacts({self.artifact.id: self.artifact.converted_filename}, timezone.now() - timedelta(days=1))
+
+        self.assertEqual(deleted, {})
+        self.assertTrue(ConversionArtifact.objects.filter(pk=self.artifact.pk).exists())
+
+    def test_hit_between_scan_and_delete_keeps_file(self):
+        original = cleanup.delete_unused_artifacts
+
+        def hit_first(artifacts, cutoff):
+            # The hit commits after live_artifact_ids was read, before the delete
+            self.link_new_job()
+            return original(artifacts, cutoff)
+
+        with override_settings(MEDIA_ROOT=self.media_root), \
+                mock.patch.object(cleanup, 'delete_unused_artifacts', hit_first):
+            report = cleanup.cleanup_old_files(max_age=timedelta(days=1))
+
+        self.assertEqual(report['jobs'], 1)
+        self.assertEqual(report['artifacts'], 0)
+        self.assertTrue(os.path.exists(self.shared_path))
+        self.assertTrue(ConversionArtifact.objects.filter(pk=self.artifact.pk).exists())
+
+
+class CleanupSharedArtifactTests(TestCase):
+    """Expired jobs go, but never a converted file another job still downloads"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        for name in ('uploads', 'converted'):
+            os.makedirs(os.path.join(self.media_root, name))
+
+        self.old = timezone.now() - timedelta(days=2)
+        self.producer = self.create_job('photo.jpg', self.old)
+        self.artifact = ConversionArtifact.objects.create(
+            cache_key='d' * 64, converted_filename=self.producer.converted_filename,
+        )
+        self.producer.artifact = self.artifact
+        self.producer.save()
+        self.shared_path = self.media_path('converted', self.producer.converted_filename)
+        self.upload_path = self.media_path('uploads', f'{self.producer.id}_photo.jpg')
+
+    def media_path(self, directory, name):
+        path = os.path.join(self.media_root, directory, name)
+        with open(path, 'ab') as f:
+            f.write(b'data')
+        return path
+
+    def create_job(self, filename, created_at, artifact=None):
+        job = ConversionJob.objects.create(
+            conversion_type='jpg_to_pdf', original_filename=filename, status='completed',
+            created_at=created_at, artifact=artifact,
+        )
+        job.converted_filename = artifact.converted_filename if artifact else f'{job.id}_converted.pdf'
+        job.save()
+        return job
+
+    def test_live_sharer_keeps_file_and_artifact(self):
+        sharer = self.create_job('again.jpg', timezone.now(), self.artifact)
+
+        report = cleanup.cleanup_old_files(max_age=timedelta(days=1))
+
+        self.assertEqual((report['jobs'], report['artifacts'], report['files']), (1, 0, 1))
+        self.assertFalse(os.path.exists(self.upload_path))
+        self.assertTrue(os.path.exists(self.shared_path))
+        self.assertTrue(ConversionArtifact.objects.filter(pk=self.artifact.pk).exists())
+        self.assertEqual(list(ConversionJob.objects.values_list('pk', flat=True)), [sharer.pk])
+
+    def test_expired_sharers_release_file_and_artifact(self):
+        self.create_job('again.jpg', self.old, self.artifact)
+
+        report = cleanup.cleanup_old_files(max_age=timedelta(days=1))
+
+        self.assertEqual((report['jobs'], report['artifacts'], report['files']), (2, 1, 2))
+        self.assertFalse(os.path.exists(self.shared_path))
+        self.assertFalse(ConversionArtifact.objects.exists())
+        self.assertFalse(ConversionJob.objects.exists())
+
+    def test_file_shared_across_chunks_is_removed_once(self):
+        self.create_job('again.jpg', self.old, self.artifact)
+
+        report = cleanup.cleanup_old_files(max_age=timedelta(days=1), chunk_size=1)
+
+        self.assertEqual((report['jobs'], report['artifacts'], report['files'], report['errors']), (2, 1, 2, 0))
+        self.assertFalse(os.path.exists(self.shared_path))
+
+    def test_dry_run_deletes_nothing(self):
+        report = cleanup.cleanup_old_files(max_age=timedelta(days=1), dry_run=True)
+
+        self.assertEqual((report['jobs'], report['artifacts'], report['files']), (1, 1, 2))
+        self.assertTrue(os.path.exists(self.upload_path))
+        self.assertTrue(os.path.exists(self.shared_path))
+        self.assertTrue(ConversionArtifact.objects.filter(pk=self.artifact.pk).exists())
+        self.assertTrue(ConversionJob.objects.filter(pk=self.producer.pk).exists())
+
+    def test_recent_jobs_are_untouched(self):
+        recent = self.create_job('new.jpg', timezone.now())
+        recent_path = self.media_path('converted', recent.converted_filename)
+
+        cleanup.cleanup_old_files(max_age=timedelta(days=1))
+
+        self.assertTrue(os.path.exists(recent_path))
+        self.assertTrue(ConversionJob.objects.filter(pk=recent.pk).exists())
+
+
+class QualitySearchTests(TestCase):
+    """The size-target search returns the highest quality that fits"""
+
+    def setUp(self):
+        self.img = Image.effect_noise((96, 96), 60).convert('RGB')
+        self.img.load()
+
+    def encoded_size(self, quality):
+        buffer = BytesIO()
+        self.img.save(buffer, 'JPEG', quality=quality)
+        return buffer.tell()
+
+    def test_highest_fitting_quality(self):
+        for threads in (1, 3, 4):
+            for target_quality in (12, 50, 90):
+                target = self.encoded_size(target_quality)
+                with self.subTest(threads=threads, target=target), \
+                        override_settings(COMPRESS_SEARCH_THREADS=threads):
+                    quality, data, probes = probe_qualities(self.img, target, 'JPEG')
+
+                self.assertLessEqual(len(data), target)
+                self.assertEqual(len(data), self.encoded_size(quality))
+                self.assertGreaterEqual(quality, target_quality)
+                if quality < settings.COMPRESS_MAX_QUALITY:
+                    self.assertGreater(self.encoded_size(quality + 1), target)
+                self.assertLess(probes, settings.COMPRESS_MAX_QUALITY - settings.COMPRESS_MIN_QUALITY)
+
+    def test_generous_target_uses_max_quality(self):
+        quality, data, _ = probe_qualities(self.img, 10 * 1024 * 1024, 'JPEG')
+        self.assertEqual(quality, settings.COMPRESS_MAX_QUALITY)
+
+    def test_impossible_target_returns_smallest(self):
+        quality, data, _ = probe_qualities(self.img, 100, 'JPEG')
+        self.assertEqual(quality, settings.COMPRESS_MIN_QUALITY)
+        self.assertEqual(len(data), self.encoded_size(settings.COMPRESS_MIN_QUALITY))
+
+    def test_compress_reports_missed_target(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        input_path = os.path.join(work_dir, 'noise.png')
+        self.img.save(input_path)
+        stats = {}
+
+        output_path = compress_image(
+            input_path, work_dir, 'job', target_size=100, output_format='jpeg', stats=stats,
+        )
+
+        self.assertIs(stats['target_met'], False)
+        self.assertEqual(stats['quality'], settings.COMPRESS_MIN_QUALITY)
+        self.assertGreater(os.path.getsize(output_path), 100)
+
+
+class OrientationLayoutTests(TestCase):
+    """Every EXIF orientation is laid out and drawn upright without transposing pixels"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+
+    def write_image(self, orientation, size=(40, 20)):
+        path = os.path.join(self.work_dir, f'photo{orientation}.jpg')
+        exif = Image.Exif()
+        exif[ORIENTATION_TAG] = orientation
+        Image.new('RGB', size, 'red').save(path, 'JPEG', exif=exif.tobytes())
+        return path
+
+    def test_image_pages_use_displayed_size(self):
+        for orientation in range(1, 9):
+            with self.subTest(orientation=orientation):
+                [page] = plan_layout([self.write_image(orientation)], page_size='image')
+                [placement] = page.placements
+
+                expected = (20, 40) if orientation in TRANSPOSED_ORIENTATIONS else (40, 20)
+                self.assertEqual(page.size, expected)
+                self.assertEqual((placement.width, placement.height), expected)
+                self.assertEqual(placement.orientation, orientation)
+
+    def test_auto_paper_orientation_follows_displayed_shape(self):
+        for orientation in range(1, 9):
+            with self.subTest(orientation=orientation):
+                [page] = plan_layout([self.write_image(orientation)], page_size='a4', orientation='auto', fit='fit')
+                [placement] = page.placements
+
+                portrait = orientation in TRANSPOSED_ORIENTATIONS
+                self.assertEqual(page.size[0] < page.size[1], portrait)
+                self.assertEqual(placement.width < placement.height, portrait)
+                self.assertAlmostEqual(max(placement.width, placement.height), 2 * min(placement.width, placement.height))
+                self.assertEqual(placement.orientation, orientation)
+
+    def test_page_matrix_draws_displayed_pixels(self):
+        # Every stored pixel distinct, so any wrong turn or flip shows
+        stored = Image.new('RGB', (3, 2))
+        stored.putdata([(i, 0, 0) for i in range(6)])
+        box = (100, 50, 30, 60)
+
+        for orientation in range(1, 9):
+            with self.subTest(orientation=orientation):
+                displayed = apply_orientation(stored, orientation)
+                a, b, c, d, e, f = page_matrix(orientation, *box)
+                x, y, width, height = box
+                for column in range(stored.width):
+                    for row in range(stored.height):
+                        # drawImage puts the first row at the top of the unit square
+                        u, v = (column + 0.5) / stored.width, 1 - (row + 0.5) / stored.height
+                        page_x, page_y = a * u + c * v + e, b * u + d * v + f
+                        self.assertTrue(x < page_x < x + width and y < page_y < y + height)
+                        shown = (
+                            int((page_x - x) / width * displayed.width),
+                            int((y + height - page_y) / height * displayed.height),
+                        )
+                        self.assertEqual(displayed.getpixel(shown), stored.getpixel((column, row)))
+
+
+class PdfIoStatsTests(TestCase):
+    """Reported I/O is the conversion's own input and output, not process-wide traffic"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+
+    @override_settings(CONVERSION_ENGINE_WORKERS=0)
+    def test_counts_input_buffers_and_output(self):
+        jpeg_path = os.path.join(self.work_dir, 'photo.jpg')
+        png_path = os.path.join(self.work_dir, 'chart.png')
+        Image.effect_noise((64, 48), 40).convert('RGB').save(jpeg_path, 'JPEG')
+        Image.new('RGBA', (32, 32), (0, 128, 255, 128)).save(png_path)
+        stats = {}
+
+        output_path = run_converter(convert_images_to_pdf, [jpeg_path, png_path], self.work_dir, 'job', stats=stats)
+
+        self.assertEqual(stats['io_read_bytes'], os.path.getsize(jpeg_path) + os.path.getsize(png_path))
+        self.assertEqual(stats['io_write_bytes'], os.path.getsize(output_path))
+        # The passthrough JPEG is buffered byte for byte, the PNG re-encoded
+        self.assertEqual((stats['passthrough_pages'], stats['reencoded_pages']), (1, 1))
+        self.assertGreater(stats['buffer_bytes'], os.path.getsize(jpeg_path))
+        self.assertLess(stats['buffer_bytes'], stats['io_write_bytes'])
+
+
+class PdfPageLimitTests(TestCase):
+    """PDF pages are held to the pixel and memory limits, sized from their MediaBox"""
+
+    # 41 inches square: 156 megapixels at 300 DPI, 2.25 at 36 DPI
+    huge_page = (3000, 3000)
+
+    def stub_renderer(self, page_size, draw=True):
+        scales = []
+
+        @contextmanager
+        def open_page(path, page_index):
+            def render(scale):
+                scales.append(scale)
+                size = (math.ceil(round(page_size[0] * scale, 6)), math.ceil(round(page_size[1] * scale, 6)))
+                if not draw:
+                    size = (1, 1)
+                return Image.new('RGB', size, 'white')
+            yield page_size, render
+
+        return mock.patch.object(pdf_render, 'open_page', open_page), scales
+
+    def test_render_lowers_dpi_to_pixel_limit(self):
+        patch, scales = self.stub_renderer(self.huge_page)
+        with patch:
+            img = pdf_render.render_page_image('doc.pdf', 0, dpi=300, max_pixels=1_000_000)
+
+        self.assertLessEqual(img.width * img.height, 1_000_000)
+        self.assertGreater(img.width * img.height, 950_000)
+
+    def test_render_never_exceeds_bomb_limit(self):
+        patch, scales = self.stub_renderer(self.huge_page, draw=False)
+        with patch:
+            pdf_render.render_page_image('doc.pdf', 0, dpi=300)
+
+        self.assertLessEqual(pdf_render.page_pixels(self.huge_page, scales[0] * 72), Image.MAX_IMAGE_PIXELS)
+
+    def test_small_page_keeps_requested_dpi(self):
+        patch, scales = self.stub_renderer((612, 792))
+        with patch:
+            img = pdf_render.render_page_image('doc.pdf', 0, dpi=150, max_pixels=1_000_000_000)
+
+        self.assertEqual(scales, [150 / 72])
+        self.assertEqual(img.size, (1275, 1650))
+
+    @override_settings(CONVERSION_JOB_MEMORY_BUDGET=24_000_000)
+    def test_plan_reserves_capped_pages(self):
+        peak, max_pixels = plan_pdf_render([(612, 792), self.huge_page], 300, concurrency=2)
+
+        self.assertEqual(max_pixels, 3_000_000)
+        self.assertEqual(peak, max_pixels * PDF_RENDER_BYTES_PER_PIXEL * 2)
+
+    @override_settings(CONVERSION_JOB_MEMORY_BUDGET=24_000_000)
+    def test_plan_rejects_page_too_large_at_any_dpi(self):
+        with self.assertRaises(ImageTooLarge):
+            plan_pdf_render([(612, 792), (14400, 14400)], 150)
+
+    @override_settings(CONVERSION_JOB_MEMORY_BUDGET=24_000_000, CONVERSION_ENGINE_WORKERS=0)
+    def test_conversion_renders_within_budget(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        patch, scales = self.stub_renderer(self.huge_page)
+
+        with patch, mock.patch.object(views, 'get_page_count', return_value=1), \
+                mock.patch.object(views, 'get_page_sizes', return_value=[self.huge_page]):
+            peak, max_pixels = views.plan_pdf_to_jpg('doc.pdf', dpi=300)
+            output_path = views.convert_pdf_to_jpg('doc.pdf', work_dir, 'job', dpi=300, max_page_pixels=max_pixels)
+
+        with Image.open(output_path) as img:
+            self.assertLessEqual(img.width * img.height, max_pixels)
+        self.assertEqual(peak, max_pixels * PDF_RENDER_BYTES_PER_PIXEL)
+
+
+class FlattenToRgbTests(TestCase):
+    """Every kind of transparency is composited onto white"""
+
+    def test_rgba(self):
+        img = Image.new('RGBA', (1, 1), (255, 0, 0, 0))
+        img.putpixel((0, 0), (0, 0, 255, 128))
+        self.assertEqual(flatten_to_rgb(img).getpixel((0, 0)), (127, 127, 255))
+        self.assertEqual(flatten_to_rgb(Image.new('RGBA', (1, 1), (255, 0, 0, 0))).getpixel((0, 0)), (255, 255, 255))
+
+    def test_palette_with_rgba_palette(self):
+        img = Image.new('P', (2, 1))
+        img.putpalette([255, 0, 0, 0, 0, 255, 0, 255], rawmode='RGBA')
+        img.putpixel((1, 0), 1)
+        self.assertNotIn('transparency', img.info)
+
+        flat = flatten_to_rgb(img)
+        self.assertEqual(flat.mode, 'RGB')
+        self.assertEqual([flat.getpixel((0, 0)), flat.getpixel((1, 0))], [(255, 255, 255), (0, 255, 0)])
+
+    def test_palette_with_transparency_index(self):
+        img = Image.new('P', (2, 1))
+        img.putpalette([255, 0, 0, 0, 0, 255])
+        img.putpixel((1, 0), 1)
+        img.info['transparency'] = 0
+
+        flat = flatten_to_rgb(img)
+        self.assertEqual([flat.getpixel((0, 0)), flat.getpixel((1, 0))], [(255, 255, 255), (0, 0, 255)])
+
+    def test_grayscale_alpha(self):
+        img = Image.new('LA', (2, 1), (0, 0))
+        img.putpixel((1, 0), (0, 255))
+        for mode in ('LA', 'La'):
+            with self.subTest(mode=mode):
+                flat = flatten_to_rgb(img.convert(mode))
+                self.assertEqual([flat.getpixel((0, 0)), flat.getpixel((1, 0))], [(255, 255, 255), (0, 0, 0)])
+
+    def test_premultiplied_rgba(self):
+        img = Image.new('RGBA', (1, 1), (0, 0, 255, 128)).convert('RGBa')
+        self.assertEqual(flatten_to_rgb(img).getpixel((0, 0)), (127, 127, 255))
+
+    def test_opaque_rgb_is_returned_as_is(self):
+        img = Image.new('RGB', (1, 1), (1, 2, 3))
+        self.assertIs(flatten_to_rgb(img), img)
+
+
+class ThreadBackendRecoveryTests(TestCase):
+    """The in-process queue recovers from restarts and rolled-back uploads"""
+
+    def create_job(self, status, age, input_path='uploads/photo.jpg'):
+        return ConversionJob.objects.create(
+            conversion_type='jpg_to_pdf', original_filename='photo.jpg', status=status,
+            input_path=input_path, created_at=timezone.now() - age,
+        )
+
+    def test_start_reclaims_jobs_of_a_stopped_process(self):
+        stale_pending = self.create_job('pending', timedelta(hours=1))
+        stale_processing = self.create_job('processing', timedelta(hours=1))
+        never_saved = self.create_job('pending', timedelta(hours=1), input_path='')
+        recent = self.create_job('processing', timedelta(minutes=1))
+        executor = mock.Mock()
+
+        with override_settings(CONVERSION_STALE_JOB_AGE=1800), mock.patch.object(tasks, '_executor', None), \
+                mock.patch.object(tasks, 'ThreadPoolExecutor', return_value=executor):
+            self.assertIs(tasks._get_executor(), executor)
+
+        executor.submit.assert_called_once_with(tasks._run_in_thread, str(stale_pending.id), claimed=True)
+        statuses = dict(ConversionJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[stale_pending.id], 'processing')
+        self.assertEqual(statuses[stale_processing.id], 'failed')
+        self.assertEqual(statuses[never_saved.id], 'pending')
+        self.assertEqual(statuses[recent.id], 'processing')
+        self.assertEqual(ConversionJob.objects.get(id=stale_processing.id).error_message, tasks.STALE_JOB_ERROR)
+
+    @override_settings(CONVERSION_QUEUE_BACKEND='thread')
+    def test_rollback_releases_engine_slot(self):
+        engine = ConversionEngine(max_workers=1)
+        job = self.create_job('pending', timedelta(0))
+
+        with mock.patch.object(tasks, 'get_engine', return_value=engine):
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    enqueue_conversion(job)
+                    self.assertFalse(engine.has_capacity())
+                    raise RuntimeError('upload failed after the job was queued')
+
+        self.assertTrue(engine.has_capacity())
+
+    @override_settings(CONVERSION_QUEUE_BACKEND='thread')
+    def test_dispatched_job_keeps_engine_slot(self):
+        engine = ConversionEngine(max_workers=1)
+        job = self.create_job('pending', timedelta(0))
+        executor = mock.Mock()
+
+        with mock.patch.object(tasks, 'get_engine', return_value=engine), \
+                mock.patch.object(tasks, '_get_executor', return_value=executor), \
+                self.captureOnCommitCallbacks(execute=True):
+            enqueue_conversion(job)
+
+        executor.submit.assert_called_once_with(tasks._run_in_thread, str(job.id), engine)
+        # Released by the worker thread once the job has run
+        self.assertFalse(engine.has_capacity())
+
+
+class ProgressBrokerTests(TestCase):
+    """Events reach streams in order, from this process or through the shared cache"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.job_id = str(uuid.uuid4())
+
+    def test_late_relayed_events_are_dropped(self):
+        broker = ProgressBroker()
+        self.assertTrue(broker.publish({'job_id': 'a', 'event': 'page', 'seq': 2}))
+        self.assertFalse(broker.publish({'job_id': 'a', 'event': 'processing', 'seq': 1}))
+        self.assertEqual(broker.latest('a')['event'], 'page')
+
+    def test_oldest_jobs_are_evicted(self):
+        broker = ProgressBroker(max_jobs=2)
+        for seq, job_id in enumerate(('a', 'b', 'a', 'c')):
+            broker.publish({'job_id': job_id, 'event': 'page', 'seq': seq})
+        self.assertIsNone(broker.latest('b'))
+        self.assertIsNotNone(broker.latest('a'))
+
+    def test_latest_event_prefers_newer_shared_event(self):
+        publish(self.job_id, 'page', page=1, pages=3)
+        elsewhere = {'job_id': self.job_id, 'event': 'page', 'page': 2, 'pages': 3, 'seq': time.time_ns() + 10}
+        caches['default'].set(f'{progress.CACHE_KEY_PREFIX}{self.job_id}', elsewhere)
+
+        self.assertEqual(latest_event(self.job_id)['page'], 2)
+
+    def events(self, chunk):
+        return [json.loads(line[len('data: '):]) for line in chunk.splitlines() if line.startswith('data: ')]
+
+    async def test_stream_pushes_events_until_terminal(self):
+        initial = {'job_id': self.job_id, 'event': 'queued', 'seq': 0}
+        stream = stream_events(self.job_id, initial)
+
+        # Subscribed once the first event is out
+        self.assertEqual(self.events(await stream.__anext__())[0]['event'], 'queued')
+
+        # Published from a worker thread, as the conversion queue does
+        await asyncio.to_thread(publish, self.job_id, 'page', page=1, pages=2)
+        self.assertEqual(self.events(await asyncio.wait_for(stream.__anext__(), 5))[0]['page'], 1)
+
+        await asyncio.to_thread(publish, self.job_id, 'completed', download_url='/download/x/')
+        self.assertEqual(self.events(await asyncio.wait_for(stream.__anext__(), 5))[0]['event'], 'completed')
+
+        with self.assertRaises(StopAsyncIteration):
+            await stream.__anext__()
+        self.assertNotIn(self.job_id, progress.broker._subscribers)
+
+    @override_settings(PROGRESS_POLL_INTERVAL=0.05)
+    async def test_stream_picks_up_events_from_other_processes(self):
+        stream = stream_events(self.job_id, {'job_id': self.job_id, 'event': 'processing', 'seq': 1})
+        await stream.__anext__()
+
+        # Written to the shared cache only, as another process would
+        failed = {'job_id': self.job_id, 'event': 'failed', 'error': 'boom', 'seq': time.time_ns()}
+        await asyncio.to_thread(caches['default'].set, f'{progress.CACHE_KEY_PREFIX}{self.job_id}', failed)
+
+        chunks = [chunk async for chunk in stream]
+        events = [event for chunk in chunks for event in self.events(chunk)]
+        self.assertEqual(events, [failed])
+
+
+class PngOptimizeTests(TestCase):
+    """Lossless reductions decode to the original pixels, and only lossy=True gives that up"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+
+    def screenshot(self, mode='RGBA'):
+        # Few colours in flat blocks, opaque throughout
+        img = Image.new(mode, (120, 80), (255, 255, 255, 255)[:len(mode)])
+        for i, colour in enumerate(((200, 30, 30), (30, 120, 200), (20, 20, 20), (240, 200, 0))):
+            img.paste(colour + (255,) * (len(mode) - 3), (i * 30, 0, i * 30 + 30, 80))
+        return img
+
+    def test_reductions(self):
+        labels = [label for label, _ in png_optimize.build_candidates(self.screenshot())]
+        self.assertEqual(labels[-2:], ['RGB', 'RGBA'])
+        self.assertTrue(labels[0].startswith('P'))
+
+        gray = Image.new('RGB', (16, 16), (90, 90, 90))
+        self.assertIn('L', [label for label, _ in png_optimize.build_candidates(gray)])
+
+    def test_candidates_are_lossless(self):
+        noisy = Image.effect_noise((64, 64), 50).convert('RGB')
+        for source in (self.screenshot(), self.screenshot('RGB'), noisy):
+            for label, candidate in png_optimize.build_candidates(source):
+                with self.subTest(mode=source.mode, label=label):
+                    self.assertTrue(png_optimize.identical(candidate, source))
+
+    def test_output_matches_and_beats_plain_save(self):
+        img = self.screenshot()
+        output_path = os.path.join(self.work_dir, 'out.png')
+        plain = BytesIO()
+        img.save(plain, 'PNG', compress_level=6)
+        stats = {}
+
+        size = png_optimize.optimize_png(img, output_path, time_budget=30, stats=stats)
+
+        self.assertEqual(size, os.path.getsize(output_path))
+        self.assertLess(size, plain.tell())
+        self.assertIs(stats['png_lossy'], False)
+        with Image.open(output_path) as result:
+            self.assertTrue(png_optimize.identical(result, img))
+
+    def test_lossy_only_when_asked(self):
+        noisy = Image.merge('RGB', [Image.effect_noise((64, 64), sigma) for sigma in (40, 60, 80)])
+        self.assertNotIn('P256-lossy', [label for label, _ in png_optimize.build_candidates(noisy)])
+        self.assertIn('P256-lossy', [label for label, _ in png_optimize.build_candidates(noisy, lossy=True)])
+
+
+class StreamingUploadTests(TestCase):
+    """Uploads are spooled, hashed and sniffed in one pass, and rejects leave nothing behind"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.upload_dir = os.path.join(self.media_root, 'uploads')
+
+    def png_bytes(self, size=(64, 64)):
+        buffer = BytesIO()
+        Image.effect_noise(size, 50).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def parse(self, *files):
+        request = RequestFactory().post('/upload/', {'file': [SimpleUploadedFile(*f) for f in files]})
+        return request, request.FILES.getlist('file')
+
+    def spooled(self):
+        return os.listdir(self.upload_dir) if os.path.isdir(self.upload_dir) else []
+
+    def test_spools_hashes_and_sniffs(self):
+        data = self.png_bytes()
+        # The name claims JPEG; the bytes decide
+        request, [upload] = self.parse(('photo.jpg', data, 'image/jpeg'))
+
+        self.assertEqual(upload.sniffed_type, 'image/png')
+        self.assertEqual(upload.content_hash, hashlib.sha256(data).hexdigest())
+        self.assertEqual(get_upload_digests(request, 'file'), [upload.content_hash])
+        self.assertEqual(upload.size, len(data))
+        self.assertTrue(upload.temporary_file_path().endswith('.part'))
+        with open(upload.temporary_file_path(), 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+        upload.close()
+        self.assertEqual(self.spooled(), [])
+
+    def test_digests_in_upload_order(self):
+        first, second = self.png_bytes((8, 8)), self.png_bytes((9, 9))
+        request, uploads = self.parse(('a.png', first, 'image/png'), ('b.png', second, 'image/png'))
+
+        self.assertEqual(
+            get_upload_digests(request, 'file'),
+            [hashlib.sha256(first).hexdigest(), hashlib.sha256(second).hexdigest()],
+        )
+        for upload in uploads:
+            upload.close()
+
+    def test_unsupported_content_is_rejected(self):
+        request, uploads = self.parse(('photo.jpg', b'<html>not an image</html>', 'image/jpeg'))
+
+        self.assertEqual(uploads, [])
+        self.assertIn('not a supported file type', get_upload_error(request))
+        self.assertEqual(self.spooled(), [])
+
+    @override_settings(MAX_UPLOAD_SIZE=1024)
+    def test_oversized_upload_is_stopped(self):
+        request, uploads = self.parse(('big.png', self.png_bytes((128, 128)), 'image/png'))
+
+        self.assertEqual(uploads, [])
+        self.assertIn('too large', get_upload_error(request))
+        self.assertEqual(self.spooled(), [])
+
+    def test_sniff_signatures(self):
+        self.assertEqual(sniff_mime_type(b'RIFF\x00\x00\x00\x00WEBPVP8 '), 'image/webp')
+        self.assertEqual(sniff_mime_type(b'%PDF-1.7\n'), 'application/pdf')
+        self.assertEqual(sniff_mime_type(b'\xff\xd8\xff\xe0'), 'image/jpeg')
+        self.assertIsNone(sniff_mime_type(b'PK\x03\x04'))
+
+
+class ReconcileMediaTests(TestCase):
+    """Reconciling removes only settled orphans and fails jobs whose output is gone"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.upload_dir = os.path.join(self.media_root, 'uploads')
+        self.converted_dir = os.path.join(self.media_root, 'converted')
+        os.makedirs(self.upload_dir)
+        os.makedirs(self.converted_dir)
+        self.old = timezone.now() - timedelta(days=2)
+
+    def make_file(self, directory, name, settled=True):
+        path = os.path.join(directory, name)
+        with open(path, 'wb') as f:
+            f.write(b'data')
+        if settled:
+            stamp = self.old.timestamp()
+            os.utime(path, (stamp, stamp))
+        return path
+
+    def make_job(self, converted=True, **fields):
+        job = ConversionJob.objects.create(
+            conversion_type='jpg_to_pdf', original_filename='photo.jpg', status='completed',
+            created_at=self.old, **fields,
+        )
+        job.converted_filename = f'{job.id}_converted.pdf'
+        job.save()
+        if converted:
+            self.make_file(self.converted_dir, job.converted_filename)
+        return job
+
+    def test_orphans_removed_after_grace_period(self):
+        settled = self.make_file(self.upload_dir, f'{uuid.uuid4()}_photo.jpg')
+        young = self.make_file(self.upload_dir, f'{uuid.uuid4()}_photo.jpg', settled=False)
+        job = self.make_job()
+        owned = self.make_file(self.upload_dir, f'{job.id}_photo.jpg')
+
+        report = reconcile_media()
+
+        self.assertFalse(os.path.exists(settled))
+        self.assertTrue(os.path.exists(young))
+        self.assertTrue(os.path.exists(owned))
+        self.assertTrue(os.path.exists(os.path.join(self.converted_dir, job.converted_filename)))
+        self.assertEqual(report['files'], 1)
+        self.assertEqual(report['bytes'], 4)
+
+    def test_shared_artifact_file_is_kept(self):
+        # The producing job is gone, but the cache entry still serves the file
+        filename = f'{uuid.uuid4()}_converted.pdf'
+        shared = self.make_file(self.converted_dir, filename)
+        artifact = ConversionArtifact.objects.create(cache_key='r' * 64, converted_filename=filename)
+
+        report = reconcile_media()
+
+        self.assertTrue(os.path.exists(shared))
+        self.assertTrue(ConversionArtifact.objects.filter(pk=artifact.pk).exists())
+        self.assertEqual(report['files'], 0)
+
+    def test_partial_uploads_removed_after_grace_period(self):
+        settled = self.make_file(self.upload_dir, f'{uuid.uuid4().hex}.part')
+        young = self.make_file(self.upload_dir, f'{uuid.uuid4().hex}.part', settled=False)
+
+        report = reconcile_media()
+
+        self.assertFalse(os.path.exists(settled))
+        self.assertTrue(os.path.exists(young))
+        self.assertEqual(report['partial_uploads'], 1)
+
+    def test_completed_jobs_missing_output_are_failed(self):
+        missing = self.make_job(converted=False)
+        present = self.make_job()
+        young = self.make_job(converted=False)
+        ConversionJob.objects.filter(pk=young.pk).update(created_at=timezone.now())
+
+        report = reconcile_media()
+
+        missing.refresh_from_db()
+        self.assertEqual(missing.status, 'failed')
+        self.assertEqual(missing.error_message, MISSING_FILE_ERROR)
+        self.assertIsNone(missing.artifact)
+        self.assertEqual(ConversionJob.objects.get(pk=present.pk).status, 'completed')
+        self.assertEqual(ConversionJob.objects.get(pk=young.pk).status, 'completed')
+        self.assertEqual(report['jobs_failed'], 1)
+
+    def test_missing_artifact_is_dropped(self):
+        artifact = ConversionArtifact.objects.create(cache_key='m' * 64, converted_filename='gone_converted.pdf')
+        job = self.make_job(converted=False, artifact=artifact)
+
+        report = reconcile_media()
+
+        self.assertFalse(ConversionArtifact.objects.filter(pk=artifact.pk).exists())
+        self.assertEqual(report['artifacts'], 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNone(job.artifact)
+
+    def test_dry_run_changes_nothing(self):
+        orphan = self.make_file(self.upload_dir, f'{uuid.uuid4()}_photo.jpg')
+        partial = self.make_file(self.upload_dir, f'{uuid.uuid4().hex}.part')
+        job = self.make_job(converted=False)
+        ConversionArtifact.objects.create(cache_key='d' * 64, converted_filename='gone_converted.pdf')
+
+        report = reconcile_media(dry_run=True)
+
+        self.assertEqual(
+            {key: report[key] for key in ('files', 'partial_uploads', 'jobs_failed', 'artifacts')},
+            {'files': 2, 'partial_uploads': 1, 'jobs_failed': 1, 'artifacts': 1},
+        )
+        self.assertTrue(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(partial))
+        self.assertEqual(ConversionJob.objects.get(pk=job.pk).status, 'completed')
+        self.assertEqual(ConversionArtifact.objects.count(), 1)
+
+
+class BatchUploadLimitTests(TestCase):
+    """Too many files is a client error, whichever limit catches it"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+    def post_files(self, count):
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'JPEG')
+        files = [SimpleUploadedFile(f'page{i}.jpg', buffer.getvalue(), content_type='image/jpeg') for i in range(count)]
+        return self.client.post('/upload/batch/', {'files': files})
+
+    @override_settings(MAX_BATCH_FILES=3, DATA_UPLOAD_MAX_NUMBER_FILES=5)
+    def test_over_batch_limit(self):
+        response = self.post_files(4)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Maximum is 3', response.json()['error'])
+
+    @override_settings(MAX_BATCH_FILES=3, DATA_UPLOAD_MAX_NUMBER_FILES=5)
+    def test_over_django_file_limit(self):
+        response = self.post_files(6)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Maximum is 3', response.json()['error'])
+
+
+class ProgressStreamTests(TestCase):
+    """Server-Sent Events are only offered when the server can actually stream them"""
+
+    def setUp(self):
+        self.job = ConversionJob.objects.create(
+            conversion_type='jpg_to_pdf', original_filename='photo.jpg', status='processing',
+        )
+
+    def test_wsgi_refuses_event_stream(self):
+        response = self.client.get(f'/events/{self.job.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+
+    def test_wsgi_processing_page_polls(self):
+        response = self.client.get(f'/download-page/{self.job.id}/')
+        self.assertContains(response, 'const useEventStream = false;')
+
+    async def test_asgi_processing_page_uses_events(self):
+        response = await self.async_client.get(f'/download-page/{self.job.id}/')
+        self.assertContains(response, 'const useEventStream = true;')
@@ -0,0 +1,167 @@
+# converter/uploadhandlers.py - Upload handlers for the conversion endpoints
+"""
+Uploads are streamed chunk by chunk into ``MEDIA_ROOT/uploads`` while the
+same pass hashes them for the result cache and sniffs their magic bytes, so
+a request never holds more than one chunk of a file in memory and the views
+never read the upload back before saving it.
+
+- ``MAX_UPLOAD_SIZE``: bytes allowed per uploaded file; larger uploads are aborted
+"""
+import os
+import uuid
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.exceptions import TooManyFilesSent
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+try:
+    import magic
+    HAS_MAGIC = True
+except ImportError:
+    HAS_MAGIC = False
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_MIME_TYPES = (
+    'image/jpeg', 'image/png', 'image/gif',
+    'image/bmp', 'image/webp', 'application/pdf',
+)
+
+# Bytes of each upload kept for content sniffing
+SNIFF_BYTES = 2048
+
+# Leading bytes of the accepted formats, used when python-magic is missing
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+    (b'%PDF-', 'application/pdf'),
+)
+
+
+def sniff_mime_type(header):
+    """MIME type from the first bytes of a file, or None when unrecognised"""
+    if HAS_MAGIC:
+        try:
+            return magic.from_buffer(header, mime=True)
+        except Exception as e:
+            logger.warning(f"MIME type detection failed: {str(e)}")
+
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, mime_type in SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    return None
+
+
+class SpooledUpload(UploadedFile):
+    """
+    An upload written straight into the uploads directory.
+
+    ``temporary_file_path()`` lets ``default_storage.save()`` rename it into
+    place instead of copying it. Closing an upload that was never saved
+    removes the partial file.
+    """
+
+    def __init__(self, name, content_type, charset, content_type_extra=None):
+        upload_dir = os.path.join(settings.MEDIA_ROOT, 'uploads')
+        os.makedirs(upload_dir, exist_ok=True)
+        self.spool_path = os.path.join(upload_dir, f"{uuid.uuid4().hex}.part")
+        super().__init__(open(self.spool_path, 'w+b'), name, content_type, 0, charset, content_type_extra)
+        self.content_hash = None
+        self.sniffed_type = None
+
+    def temporary_file_path(self):
+        return self.spool_path
+
+    def close(self):
+        self.file.close()
+        try:
+            os.remove(self.spool_path)
+        except FileNotFoundError:
+            # Already moved into place by the storage
+            pass
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """
+    Spool, hash and sniff each uploaded file in a single streaming pass.
+
+    Digests are collected on ``request.upload_digests`` as
+    ``{field_name: [hexdigest, ...]}`` in upload order. An upload that is too
+    large or is not a supported format stops the whole request; the reason
+    is left on ``request.upload_error`` for the view to report.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request.upload_digests = {}
+        self.request.upload_error = None
+        self.max_size = getattr(settings, 'MAX_UPLOAD_SIZE', 50 * 1024 * 1024)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = SpooledUpload(self.file_name, self.content_type, self.charset, self.content_type_extra)
+        self.hasher = hashlib.sha256()
+        self.header = b''
+
+    def reject(self, message):
+        logger.warning(f"Rejected upload {self.file_name}: {message}")
+        self.request.upload_error = message
+        # Skip the rest of the body without storing it so the view can still answer
+        raise StopUpload(connection_reset=False)
+
+    def sniff(self):
+        self.file.sniffed_type = sniff_mime_type(self.header)
+        if self.file.sniffed_type not in ALLOWED_MIME_TYPES:
+            self.reject(f'{self.file_name} is not a supported file type.')
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            self.reject(f'{self.file_name} is too large. Maximum size is {self.max_size // (1024 * 1024)}MB.')
+
+        if self.file.sniffed_type is None:
+            self.header += raw_data[:SNIFF_BYTES - len(self.header)]
+            if len(self.header) >= SNIFF_BYTES:
+                self.sniff()
+
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+        # The file is complete on disk; no later handler needs the data
+        return None
+
+    def file_complete(self, file_size):
+        if self.file.sniffed_type is None:
+            self.sniff()
+
+        self.file.flush()
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.content_hash = self.hasher.hexdigest()
+        self.request.upload_digests.setdefault(self.field_name, []).append(self.file.content_hash)
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+
+
+def get_upload_digests(request, field_name):
+    """Digests for the files uploaded under ``field_name``; empty if the handler is not installed"""
+    return getattr(request, 'upload_digests', {}).get(field_name, [])
+
+
+def get_upload_error(request):
+    """Why the upload handler stopped the request, or None"""
+    # Reading FILES parses the body, which runs the handlers
+    try:
+        request.FILES
+    except TooManyFilesSent:
+        # Over DATA_UPLOAD_MAX_NUMBER_FILES, which Django checks before any handler runs
+        return f"Too many files. Maximum is {getattr(settings, 'MAX_BATCH_FILES', 100)} images per PDF."
+    return getattr(request, 'upload_error', None)
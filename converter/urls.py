@@ -8,9 +8,13 @@ urlpatterns = [
     # Main application URLs
     path('', views.home, name='home'),
     path('upload/', views.upload_file, name='upload_file'),
+    path('upload/batch/', views.upload_batch, name='upload_batch'),
     path('download/<uuid:job_id>/', views.download_file, name='download_file'),
     path('status/<uuid:job_id>/', views.job_status, name='job_status'),
+    path('events/<uuid:job_id>/', views.job_events, name='job_events'),
     path('download-page/<uuid:job_id>/', views.download_page, name='download_page'),
+    path('preview/<uuid:job_id>/', views.preview, name='preview'),
+    path('previews/', views.preview_batch, name='preview_batch'),
 
     # Static pages
     path('privacy-policy/', views.privacy_policy, name='privacy_policy'),
@@ -1,35 +1,133 @@
 # converter/views.py - COMPLETE VERSION WITH DOWNLOAD PAGE
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse, HttpResponse, Http404
+from django.http import FileResponse, JsonResponse, HttpResponse, Http404, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
 from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from asgiref.sync import sync_to_async
 import json
+import hashlib
 import os
+import time
 import uuid
-import tempfile
+import zipfile
 import logging
 from PIL import Image
+from reportlab import rl_config
 from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfutils import readJPEGInfo
 from io import BytesIO
 from django.contrib import messages
 from django.core.mail import send_mail
 
-try:
-    import magic
-    HAS_MAGIC = True
-except ImportError:
-    HAS_MAGIC = False
-    
 from .models import ConversionJob
+from .downloads import get_offload_mode, offload_file, serve_file
+from .engine import EngineSaturated, get_engine, map_converter, run_converter
+from .cleanup import cleanup_old_files
+from .compression import (
+    ALPHA_FORMATS, LOSSY_FORMATS, OUTPUT_FORMATS, PRESETS, SUBSAMPLING_CHOICES, SUBSAMPLING_FORMATS,
+    available_formats, convert_for_alpha_format, encode_image, encoder_params, get_default_preset,
+    probe_qualities, record_encoding,
+)
+from .page_cache import cached_page
+from .image_utils import draft_decode, draft_scale, flatten_to_rgb
+from .memory_guard import ImageTooLarge, decode_scale, plan_conversion, plan_pdf_render, reserve_memory
+from .orientation import apply_orientation, displayed_size, get_orientation, page_matrix, thumbnail_oriented
+from .page_layout import FIT_MODES, MAX_MARGIN_MM, NUP_GRIDS, ORIENTATIONS, PAGE_SIZE_CHOICES, plan_layout
+from .png_optimize import optimize_png
+from .pdf_render import HAS_PDF_RENDERER, get_page_count, get_page_sizes, parse_page_range, render_page
+from .sitemaps import get_sitemap
+from .storage import get_output_storage, get_scratch_dir, local_inputs, local_path, output_name, publish_output
+from .previews import PREVIEW_CONTENT_TYPES, PREVIEW_SOURCES, get_preview_format, get_previews
+from .progress import event_from_job, latest_event, report_progress, stream_events
+from .tasks import accepting_conversions, enqueue_conversion
+from .uploadhandlers import ALLOWED_MIME_TYPES, get_upload_digests, get_upload_error, sniff_mime_type
+from . import result_cache
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Write binary PDF streams so passthrough JPEGs are embedded byte-for-byte
+# instead of being ASCII85-expanded by ReportLab
+rl_config.useA85 = 0
+
+ROBOTS_TXT = """# robots.txt for jpg2pdf.link
+# JPG to PDF Converter Website
+
+User-agent: *
+Allow: /
+
+# Allow all major search engines
+User-agent: Googlebot
+Allow: /
+
+User-agent: Bingbot
+Allow: /
+
+User-agent: Slurp
+Allow: /
+
+User-agent: DuckDuckBot
+Allow: /
+
+User-agent: Baiduspider
+Allow: /
+
+User-agent: YandexBot
+Allow: /
+
+User-agent: facebookexternalhit
+Allow: /
+
+# Disallow admin and sensitive areas
+Disallow: /admin/
+Disallow: /static/admin/
+Disallow: /media/uploads/
+Disallow: /media/converted/
+Disallow: /download/
+Disallow: /upload/
+Disallow: /status/
+
+# Disallow common technical files
+Disallow: /*.json$
+Disallow: /api/
+Disallow: /ajax/
+
+# Allow important pages and directories
+Allow: /static/css/
+Allow: /static/js/
+Allow: /static/images/
+Allow: /favicon.ico
+Allow: /apple-touch-icon.png
+Allow: /site.webmanifest
+
+# Security - Block sensitive file types
+Disallow: /*.sql$
+Disallow: /*.log$
+Disallow: /*.bak$
+Disallow: /*.conf$
+Disallow: /*.ini$
+
+# Block common attack vectors
+Disallow: /wp-admin/
+Disallow: /wp-login.php
+Disallow: /phpMyAdmin/
+Disallow: /.env
+Disallow: /.git/
+
+# Sitemap location
+Sitemap: {protocol}://{domain}/sitemap.xml
+
+# Crawl delay for polite crawling
+Crawl-delay: 1"""
+
 def home(request):
     """Main homepage with conversion options"""
     return render(request, 'converter/home.html')
@@ -37,8 +135,13 @@ def home(request):
 @csrf_exempt
 @require_http_methods(["POST"])
 def upload_file(request):
-    """Handle file upload and initiate conversion"""
+    """Handle file upload and queue the conversion"""
     try:
+        # Uploads the streaming handler stopped early (too large, wrong type)
+        upload_error = get_upload_error(request)
+        if upload_error:
+            return JsonResponse({'success': False, 'error': upload_error}, status=400)
+        
         # Check if file is in request
         if 'file' not in request.FILES:
             return JsonResponse({'success': False, 'error': 'No file uploaded'}, status=400)
@@ -46,8 +149,13 @@ def upload_file(request):
         uploaded_file = request.FILES['file']
         conversion_type = request.POST.get('conversion_type', 'jpg_to_pdf')
         
+        try:
+            options = parse_conversion_options(request.POST, conversion_type)
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        
         # Validate file size
-        if uploaded_file.size > 50 * 1024 * 1024:  # 50MB limit
+        if uploaded_file.size > getattr(settings, 'MAX_UPLOAD_SIZE', 50 * 1024 * 1024):
             return JsonResponse({
                 'success': False, 
                 'error': 'File too large. Maximum size is 50MB.'
@@ -60,12 +168,46 @@ def upload_file(request):
                 'error': 'Unsupported file type. Please upload JPG, PNG, GIF, or PDF files.'
             }, status=400)
         
+        # Fail PDF uploads before storing anything when they cannot be rasterized
+        if conversion_type == 'pdf_to_jpg':
+            if not HAS_PDF_RENDERER:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'PDF to JPG conversion is not available on this server.'
+                }, status=400)
+            if os.path.splitext(uploaded_file.name)[1].lower() != '.pdf':
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Please upload a PDF file to convert to JPG.'
+                }, status=400)
+        
+        # Reject images that could never be decoded within the memory limits
+        try:
+            plan_conversion([uploaded_file], conversion_type)
+        except ImageTooLarge as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        
+        # Reuse an earlier conversion of the same bytes with the same options
+        cache_key = ''
+        digests = get_upload_digests(request, 'file')
+        if digests and result_cache.is_enabled():
+            cache_key = result_cache.build_cache_key(digests, conversion_type, options)
+            job = create_cached_job(conversion_type, uploaded_file.name, uploaded_file.size, cache_key, options)
+            if job is not None:
+                return cached_job_response(job)
+        
+        # Turn work away before saving anything when the converters are full
+        if not accepting_conversions():
+            return server_busy_response()
+        
         # Create conversion job
         job = ConversionJob.objects.create(
             conversion_type=conversion_type,
             original_filename=uploaded_file.name,
             file_size=uploaded_file.size,
-            status='pending'
+            status='pending',
+            options=options,
+            cache_key=cache_key
         )
         
         logger.info(f"Created conversion job {job.id} for file {uploaded_file.name}")
@@ -90,54 +232,361 @@ def upload_file(request):
                 'error': 'Failed to save uploaded file'
             }, status=500)
         
-        # Process conversion
+        # Hand the job to the conversion queue and answer right away
+        job.input_path = saved_path
+        job.save(update_fields=['input_path'])
         try:
-            job.status = 'processing'
-            job.save()
-            
-            result_path = process_conversion(saved_path, conversion_type, job.id)
-            
-            job.converted_filename = os.path.basename(result_path)
-            job.status = 'completed'
-            job.completed_at = timezone.now()
-            job.save()
-            
-            logger.info(f"Conversion completed for job {job.id}")
+            enqueue_conversion(job)
+        except EngineSaturated:
+            default_storage.delete(saved_path)
+            job.delete()
+            return server_busy_response()
+        
+        return JsonResponse({
+            'success': True,
+            'job_id': str(job.id),
+            'status': job.status,
+            'status_url': f'/status/{job.id}/',
+            'redirect_url': f'/download-page/{job.id}/',
+            'download_url': f'/download/{job.id}/',
+            'original_filename': job.original_filename
+        }, status=202)
             
+    except Exception as e:
+        logger.error(f"Upload failed: {str(e)}")
+        return JsonResponse({
+            'success': False, 
+            'error': f'Upload failed: {str(e)}'
+        }, status=500)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def upload_batch(request):
+    """Handle a multi-image upload and queue one merged PDF conversion"""
+    try:
+        upload_error = get_upload_error(request)
+        if upload_error:
+            return JsonResponse({'success': False, 'error': upload_error}, status=400)
+        
+        uploaded_files = request.FILES.getlist('files')
+        if not uploaded_files:
+            return JsonResponse({'success': False, 'error': 'No files uploaded'}, status=400)
+        digests = get_upload_digests(request, 'files')
+        
+        try:
+            options = parse_conversion_options(request.POST, 'images_to_pdf')
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        
+        max_files = getattr(settings, 'MAX_BATCH_FILES', 100)
+        if len(uploaded_files) > max_files:
             return JsonResponse({
-                'success': True,
-                'job_id': str(job.id),
-                'redirect_url': f'/download-page/{job.id}/',  # NEW: Redirect to download page
-                'download_url': f'/download/{job.id}/',
-                'original_filename': job.original_filename,
-                'converted_filename': job.converted_filename
-            })
+                'success': False,
+                'error': f'Too many files. Maximum is {max_files} images per PDF.'
+            }, status=400)
+        
+        # Optional page order as comma-separated indexes into the uploaded list
+        order = request.POST.get('order', '')
+        if order:
+            try:
+                page_order = [int(index) for index in order.split(',')]
+            except ValueError:
+                page_order = []
+            if sorted(page_order) != list(range(len(uploaded_files))):
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Invalid page order.'
+                }, status=400)
+            uploaded_files = [uploaded_files[index] for index in page_order]
+            if len(digests) == len(page_order):
+                digests = [digests[index] for index in page_order]
+        
+        for uploaded_file in uploaded_files:
+            # Validate file size
+            if uploaded_file.size > getattr(settings, 'MAX_UPLOAD_SIZE', 50 * 1024 * 1024):
+                return JsonResponse({
+                    'success': False,
+                    'error': f'{uploaded_file.name} is too large. Maximum size is 50MB.'
+                }, status=400)
             
+            # Validate file type (images only, PDFs cannot be merged as pages)
+            file_extension = os.path.splitext(uploaded_file.name)[1].lower()
+            if file_extension == '.pdf' or not validate_file_type(uploaded_file):
+                return JsonResponse({
+                    'success': False,
+                    'error': f'{uploaded_file.name} is not a supported image. Please upload JPG, PNG, GIF, BMP or WebP files.'
+                }, status=400)
+        
+        # Reject images that could never be decoded within the memory limits
+        try:
+            plan_conversion(uploaded_files, 'images_to_pdf')
+        except ImageTooLarge as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        
+        first_name = uploaded_files[0].name
+        if len(uploaded_files) > 1:
+            original_filename = f"{first_name} (+{len(uploaded_files) - 1} more)"
+        else:
+            original_filename = first_name
+        
+        file_size = sum(uploaded_file.size for uploaded_file in uploaded_files)
+        
+        # Reuse an earlier conversion of the same pages in the same order
+        cache_key = ''
+        if len(digests) == len(uploaded_files) and result_cache.is_enabled():
+            cache_key = result_cache.build_cache_key(digests, 'images_to_pdf', options)
+            job = create_cached_job('images_to_pdf', original_filename[:255], file_size, cache_key, options)
+            if job is not None:
+                return cached_job_response(job, page_count=len(uploaded_files))
+        
+        # Turn work away before saving anything when the converters are full
+        if not accepting_conversions():
+            return server_busy_response()
+        
+        # Create a single conversion job for the whole document
+        job = ConversionJob.objects.create(
+            conversion_type='images_to_pdf',
+            original_filename=original_filename[:255],
+            file_size=file_size,
+            status='pending',
+            options=options,
+            cache_key=cache_key
+        )
+        
+        logger.info(f"Created batch conversion job {job.id} for {len(uploaded_files)} files")
+        
+        upload_dir = os.path.join(settings.MEDIA_ROOT, 'uploads')
+        os.makedirs(upload_dir, exist_ok=True)
+        
+        # Save pages with their position in the name so they stay in order on disk too
+        saved_paths = []
+        try:
+            for position, uploaded_file in enumerate(uploaded_files, start=1):
+                file_extension = os.path.splitext(uploaded_file.name)[1].lower()
+                unique_filename = f"{job.id}_{position:04d}_{uuid.uuid4().hex[:8]}{file_extension}"
+                saved_paths.append(default_storage.save(os.path.join('uploads', unique_filename), uploaded_file))
         except Exception as e:
-            logger.error(f"Conversion failed for job {job.id}: {str(e)}")
-            job.status = 'failed'
-            job.error_message = str(e)
-            job.save()
-            
-            # Clean up uploaded file
-            try:
-                if default_storage.exists(saved_path):
+            logger.error(f"Failed to save batch files: {str(e)}")
+            for saved_path in saved_paths:
+                try:
                     default_storage.delete(saved_path)
-            except:
-                pass
-                
+                except Exception:
+                    pass
+            job.delete()
             return JsonResponse({
-                'success': False, 
-                'error': f'Conversion failed: {str(e)}'
+                'success': False,
+                'error': 'Failed to save uploaded files'
             }, status=500)
-            
+        
+        job.input_path = saved_paths[0]
+        job.input_paths = saved_paths
+        job.save(update_fields=['input_path', 'input_paths'])
+        try:
+            enqueue_conversion(job)
+        except EngineSaturated:
+            for saved_path in saved_paths:
+                default_storage.delete(saved_path)
+            job.delete()
+            return server_busy_response()
+        
+        return JsonResponse({
+            'success': True,
+            'job_id': str(job.id),
+            'status': job.status,
+            'page_count': len(saved_paths),
+            'status_url': f'/status/{job.id}/',
+            'redirect_url': f'/download-page/{job.id}/',
+            'download_url': f'/download/{job.id}/',
+            'original_filename': job.original_filename
+        }, status=202)
+    
     except Exception as e:
-        logger.error(f"Upload failed: {str(e)}")
+        logger.error(f"Batch upload failed: {str(e)}")
         return JsonResponse({
-            'success': False, 
+            'success': False,
             'error': f'Upload failed: {str(e)}'
         }, status=500)
 
+def parse_conversion_options(data, conversion_type):
+    """Validate the optional conversion parameters posted with an upload"""
+    options = {}
+    
+    if conversion_type in ('jpg_to_pdf', 'png_to_pdf', 'images_to_pdf'):
+        target_dpi = data.get('target_dpi') or getattr(settings, 'PDF_DEFAULT_TARGET_DPI', None)
+        if target_dpi:
+            try:
+                target_dpi = int(target_dpi)
+            except (TypeError, ValueError):
+                raise ValueError('Target DPI must be a whole number.')
+            if not 72 <= target_dpi <= 600:
+                raise ValueError('Target DPI must be between 72 and 600.')
+            options['target_dpi'] = target_dpi
+        
+        page_size = data.get('page_size', '').strip().lower() or getattr(settings, 'PDF_DEFAULT_PAGE_SIZE', 'image')
+        if page_size not in PAGE_SIZE_CHOICES:
+            raise ValueError(f"Page size must be one of {', '.join(PAGE_SIZE_CHOICES)}.")
+        options['page_size'] = page_size
+        
+        orientation = data.get('orientation', '').strip().lower()
+        if orientation:
+            if orientation not in ORIENTATIONS:
+                raise ValueError(f"Orientation must be one of {', '.join(ORIENTATIONS)}.")
+            options['orientation'] = orientation
+        
+        fit = data.get('fit', '').strip().lower() or getattr(settings, 'PDF_DEFAULT_FIT', 'fit')
+        if fit not in FIT_MODES:
+            raise ValueError(f"Fit must be one of {', '.join(FIT_MODES)}.")
+        options['fit'] = fit
+        
+        margin_mm = data.get('margin_mm')
+        if margin_mm not in (None, ''):
+            try:
+                margin_mm = float(margin_mm)
+            except (TypeError, ValueError):
+                raise ValueError('Margin must be a number of millimetres.')
+            if not 0 <= margin_mm <= MAX_MARGIN_MM:
+                raise ValueError(f'Margin must be between 0 and {MAX_MARGIN_MM} mm.')
+            options['margin_mm'] = margin_mm
+        
+        per_page = data.get('per_page')
+        if per_page:
+            try:
+                per_page = int(per_page)
+            except (TypeError, ValueError):
+                raise ValueError('Images per page must be a whole number.')
+            if per_page not in NUP_GRIDS:
+                raise ValueError(f"Images per page must be one of {', '.join(map(str, NUP_GRIDS))}.")
+            if per_page > 1 and page_size == 'image':
+                raise ValueError('Several images per page need a paper size (A4 or Letter).')
+            options['per_page'] = per_page
+        
+        if (orientation or margin_mm not in (None, '')) and page_size == 'image':
+            raise ValueError('Orientation and margins need a paper size (A4 or Letter).')
+
+    if conversion_type in ('resize_image', 'compress_image'):
+        output_format = data.get('output_format', '').strip().lower()
+        if output_format:
+            formats = available_formats() if conversion_type == 'resize_image' else [
+                name for name in available_formats() if name in LOSSY_FORMATS
+            ]
+            if output_format not in formats:
+                raise ValueError(f"Output format must be one of {', '.join(formats)}.")
+            options['output_format'] = output_format
+        
+        preset = data.get('preset', '').strip().lower()
+        if preset:
+            if preset not in PRESETS:
+                raise ValueError(f"Preset must be one of {', '.join(PRESETS)}.")
+            options['preset'] = preset
+    
+    if conversion_type == 'resize_image' and data.get('lossy', '').lower() in ('1', 'true', 'on', 'yes'):
+        # Only PNG output has a lossy mode (256-colour quantization)
+        if options.get('output_format', 'png') != 'png':
+            raise ValueError('Lossy mode is only available for PNG output.')
+        options['lossy'] = True
+    
+    if conversion_type == 'compress_image':
+        output_format = options.get('output_format') or getattr(settings, 'COMPRESS_DEFAULT_FORMAT', 'jpeg')
+        target_kb = data.get('target_kb')
+        if target_kb:
+            try:
+                target_kb = int(target_kb)
+            except (TypeError, ValueError):
+                raise ValueError('Target size must be a whole number of KB.')
+            max_kb = getattr(settings, 'MAX_UPLOAD_SIZE', 50 * 1024 * 1024) // 1024
+            if not 4 <= target_kb <= max_kb:
+                raise ValueError(f'Target size must be between 4 and {max_kb} KB.')
+            options['target_size'] = target_kb * 1024
+        else:
+            quality = data.get('quality')
+            if quality:
+                try:
+                    quality = int(quality)
+                except (TypeError, ValueError):
+                    raise ValueError('Quality must be a whole number.')
+                if not 1 <= quality <= 95:
+                    raise ValueError('Quality must be between 1 and 95.')
+                options['quality'] = quality
+        
+        subsampling = data.get('subsampling', '').strip()
+        if subsampling:
+            if subsampling not in SUBSAMPLING_CHOICES:
+                raise ValueError(f"Chroma subsampling must be one of {', '.join(SUBSAMPLING_CHOICES)}.")
+            if output_format not in SUBSAMPLING_FORMATS:
+                raise ValueError('Chroma subsampling can only be chosen for JPEG and AVIF output.')
+            options['subsampling'] = subsampling
+        
+        if data.get('progressive', '').lower() in ('1', 'true', 'on', 'yes'):
+            if output_format != 'jpeg':
+                raise ValueError('Progressive encoding is only available for JPEG output.')
+            options['progressive'] = True
+    
+    if conversion_type == 'pdf_to_jpg':
+        dpi = data.get('dpi') or getattr(settings, 'PDF_TO_JPG_DEFAULT_DPI', 150)
+        try:
+            dpi = int(dpi)
+        except (TypeError, ValueError):
+            raise ValueError('DPI must be a whole number.')
+        max_dpi = getattr(settings, 'PDF_TO_JPG_MAX_DPI', 300)
+        if not 36 <= dpi <= max_dpi:
+            raise ValueError(f'DPI must be between 36 and {max_dpi}.')
+        options['dpi'] = dpi
+        
+        pages = data.get('pages', '').strip()
+        if pages:
+            # Only the syntax can be checked before the PDF is opened
+            parse_page_range(pages)
+            options['pages'] = pages
+    
+    return options
+
+def create_cached_job(conversion_type, original_filename, file_size, cache_key, options=None):
+    """Create an already completed job when an identical conversion is cached, else None"""
+    # One transaction: the artifact stays locked until the job referring to it exists
+    with transaction.atomic():
+        artifact = result_cache.lookup_artifact(cache_key)
+        if artifact is None:
+            return None
+        
+        job = ConversionJob.objects.create(
+            conversion_type=conversion_type,
+            original_filename=original_filename,
+            file_size=file_size,
+            status='completed',
+            converted_filename=artifact.converted_filename,
+            completed_at=timezone.now(),
+            options=options or {},
+            conversion_details={'cache_hit': True},
+            cache_key=cache_key,
+            artifact=artifact
+        )
+    logger.info(f"Conversion cache hit for job {job.id} ({artifact.converted_filename})")
+    return job
+
+def cached_job_response(job, **extra):
+    """Response for a job answered from the conversion cache"""
+    return JsonResponse({
+        'success': True,
+        'job_id': str(job.id),
+        'status': job.status,
+        'cached': True,
+        'status_url': f'/status/{job.id}/',
+        'redirect_url': f'/download-page/{job.id}/',
+        'download_url': f'/download/{job.id}/',
+        'original_filename': job.original_filename,
+        'converted_filename': job.download_filename,
+        **extra
+    })
+
+def server_busy_response():
+    """503 telling the client when to retry because every converter is busy"""
+    response = JsonResponse({
+        'success': False,
+        'error': 'The server is busy converting other files. Please try again in a few seconds.'
+    }, status=503)
+    response['Retry-After'] = str(getattr(settings, 'CONVERSION_ENGINE_RETRY_AFTER', 5))
+    return response
+
 def validate_file_type(uploaded_file):
     """Validate file type based on extension and content"""
     # Get file extension
@@ -147,26 +596,14 @@ def validate_file_type(uploaded_file):
     if file_extension not in allowed_extensions:
         return False
     
-    # If python-magic is available, check MIME type
-    if HAS_MAGIC:
-        try:
-            uploaded_file.seek(0)
-            file_content = uploaded_file.read(1024)  # Read first 1KB
-            uploaded_file.seek(0)  # Reset file pointer
-            
-            mime_type = magic.from_buffer(file_content, mime=True)
-            allowed_mime_types = [
-                'image/jpeg', 'image/png', 'image/gif', 
-                'image/bmp', 'image/webp', 'application/pdf'
-            ]
-            
-            return mime_type in allowed_mime_types
-        except Exception as e:
-            logger.warning(f"MIME type detection failed: {str(e)}")
-            # Fall back to extension-based validation
-            pass
+    # The streaming upload handler already sniffed the content while spooling it
+    mime_type = getattr(uploaded_file, 'sniffed_type', None)
+    if mime_type is None:
+        uploaded_file.seek(0)
+        mime_type = sniff_mime_type(uploaded_file.read(1024))  # Read first 1KB
+        uploaded_file.seek(0)  # Reset file pointer
     
-    return True
+    return mime_type in ALLOWED_MIME_TYPES
 
 def download_page(request, job_id):
     """Display download page with file information - NEW FUNCTION"""
@@ -184,12 +621,14 @@ def download_page(request, job_id):
                 # Still processing
                 return render(request, 'converter/processing.html', {
                     'job': job,
-                    'page_title': 'Processing Your Conversion...'
+                    'page_title': 'Processing Your Conversion...',
+                    # WSGI buffers a streamed response until it ends, so only ASGI gets the push client
+                    'use_event_stream': isinstance(request, ASGIRequest),
                 })
         
         return render(request, 'converter/download.html', {
             'job': job,
-            'page_title': f'Download {job.converted_filename} - JPG to PDF Converter',
+            'page_title': f'Download {job.download_filename} - JPG to PDF Converter',
             'meta_description': 'Download your converted PDF file. High-quality JPG to PDF conversion completed successfully.',
         })
         
@@ -200,6 +639,7 @@ def download_page(request, job_id):
             'page_title': 'Error - JPG to PDF Converter'
         })
 
+@require_http_methods(["GET", "HEAD"])
 def download_file(request, job_id):
     """Download converted file"""
     try:
@@ -211,32 +651,57 @@ def download_file(request, job_id):
         if not job.converted_filename:
             raise Http404("Converted file not found")
         
-        file_path = os.path.join(settings.MEDIA_ROOT, 'converted', job.converted_filename)
+        # Set appropriate content type
+        if job.converted_filename.endswith('.pdf'):
+            content_type = 'application/pdf'
+        elif job.converted_filename.endswith(('.jpg', '.jpeg')):
+            content_type = 'image/jpeg'
+        elif job.converted_filename.endswith('.png'):
+            content_type = 'image/png'
+        elif job.converted_filename.endswith('.webp'):
+            content_type = 'image/webp'
+        elif job.converted_filename.endswith('.avif'):
+            content_type = 'image/avif'
+        elif job.converted_filename.endswith('.zip'):
+            content_type = 'application/zip'
+        else:
+            content_type = 'application/octet-stream'
+        
+        storage = get_output_storage()
+        name = output_name(job.converted_filename)
+        file_path = local_path(storage, name)
+        
+        if file_path is None:
+            # Remote storage: stream the object through
+            if not storage.exists(name):
+                logger.error(f"Converted file not found in storage: {name}")
+                raise Http404("File not found")
+            response = FileResponse(
+                storage.open(name, 'rb'),
+                as_attachment=True,
+                filename=job.download_filename,
+                content_type=content_type,
+            )
+            response['Content-Length'] = storage.size(name)
+            return response
+        
+        # Let nginx/Apache send the bytes when offloading is configured
+        if get_offload_mode():
+            return offload_file(
+                os.path.relpath(file_path, settings.MEDIA_ROOT),
+                job.download_filename,
+                content_type,
+            )
         
         if not os.path.exists(file_path):
             logger.error(f"Converted file not found: {file_path}")
             raise Http404("File not found")
         
         try:
-            with open(file_path, 'rb') as f:
-                file_content = f.read()
-                
-            response = HttpResponse(file_content)
-            
-            # Set appropriate content type
-            if job.converted_filename.endswith('.pdf'):
-                response['Content-Type'] = 'application/pdf'
-            elif job.converted_filename.endswith(('.jpg', '.jpeg')):
-                response['Content-Type'] = 'image/jpeg'
-            elif job.converted_filename.endswith('.png'):
-                response['Content-Type'] = 'image/png'
-            else:
-                response['Content-Type'] = 'application/octet-stream'
-            
-            response['Content-Disposition'] = f'attachment; filename="{job.converted_filename}"'
-            response['Content-Length'] = len(file_content)
+            response = serve_file(request, file_path, job.download_filename, content_type)
             
-            logger.info(f"File {job.converted_filename} downloaded successfully")
+            if request.method == 'GET' and response.status_code in (200, 206):
+                logger.info(f"File {job.converted_filename} downloaded successfully")
             return response
             
         except Exception as e:
@@ -256,7 +721,7 @@ def job_status(request, job_id):
         return JsonResponse({
             'status': job.status,
             'original_filename': job.original_filename,
-            'converted_filename': job.converted_filename,
+            'converted_filename': job.download_filename,
             'error_message': job.error_message,
             'created_at': job.created_at.isoformat(),
             'completed_at': job.completed_at.isoformat() if job.completed_at else None
@@ -265,159 +730,444 @@ def job_status(request, job_id):
         logger.error(f"Status check failed for job {job_id}: {str(e)}")
         return JsonResponse({'error': 'Job not found'}, status=404)
 
-def process_conversion(input_path, conversion_type, job_id):
-    """Process file conversion based on type"""
-    input_full_path = os.path.join(settings.MEDIA_ROOT, input_path)
-    output_dir = os.path.join(settings.MEDIA_ROOT, 'converted')
+@require_http_methods(["GET"])
+async def job_events(request, job_id):
+    """Push job progress as Server-Sent Events (serve through file_converter/asgi.py)"""
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI the stream would arrive all at once when it ends, holding a worker
+        # meanwhile; 204 tells EventSource not to reconnect, and the page polls instead
+        return HttpResponse(status=204)
     
-    # Create output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
+    initial = await sync_to_async(latest_event)(job_id)
+    if initial is None:
+        # Only a stream for a job with no published progress reads the database
+        job = await ConversionJob.objects.only('status', 'error_message').filter(id=job_id).afirst()
+        if job is None:
+            raise Http404("Job not found")
+        initial = event_from_job(job)
     
-    try:
-        if conversion_type in ['jpg_to_pdf', 'png_to_pdf']:
-            return convert_image_to_pdf(input_full_path, output_dir, job_id)
-        elif conversion_type == 'resize_image':
-            return resize_image(input_full_path, output_dir, job_id)
-        elif conversion_type == 'compress_image':
-            return compress_image(input_full_path, output_dir, job_id)
-        else:
-            raise ValueError(f"Unsupported conversion type: {conversion_type}")
-    except Exception as e:
-        logger.error(f"Conversion processing failed: {str(e)}")
-        raise
+    response = StreamingHttpResponse(stream_events(job_id, initial), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
-def convert_image_to_pdf(input_path, output_dir, job_id):
-    """Convert image to PDF"""
+@require_http_methods(["GET", "HEAD"])
+def preview(request, job_id):
+    """Serve a small preview image of a job's upload or converted file"""
+    source = request.GET.get('source', 'result')
+    if source not in PREVIEW_SOURCES:
+        return JsonResponse({'success': False, 'error': 'Invalid preview source'}, status=400)
+    
+    job = get_object_or_404(ConversionJob, id=job_id)
+    path = get_previews([job], source)[job.id]
+    if path is None or not os.path.exists(path):
+        raise Http404("Preview not available")
+    
+    preview_format = get_preview_format()
+    response = serve_file(
+        request, path, f"{job.id}_preview{os.path.splitext(path)[1]}",
+        PREVIEW_CONTENT_TYPES[preview_format], as_attachment=False
+    )
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+@require_http_methods(["GET"])
+def preview_batch(request):
+    """Build previews for many jobs in one call and return their URLs"""
+    source = request.GET.get('source', 'result')
+    if source not in PREVIEW_SOURCES:
+        return JsonResponse({'success': False, 'error': 'Invalid preview source'}, status=400)
+    
     try:
-        with Image.open(input_path) as img:
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Create white background for transparent images
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                if 'transparency' in img.info:
-                    background.paste(img, mask=img.split()[-1])
-                else:
-                    background.paste(img)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            output_filename = f"{job_id}_converted.pdf"
-            output_path = os.path.join(output_dir, output_filename)
-            
-            # Get image dimensions
-            img_width, img_height = img.size
-            
-            # Calculate appropriate page size (convert pixels to points, assuming 72 DPI)
-            max_width, max_height = A4  # A4 size in points
-            
-            # Calculate scaling factor to fit within A4
-            scale_w = max_width / img_width
-            scale_h = max_height / img_height
-            scale = min(scale_w, scale_h, 1.0)  # Don't upscale
+        job_ids = [uuid.UUID(job_id) for job_id in request.GET.get('jobs', '').split(',') if job_id]
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid job id'}, status=400)
+    
+    max_jobs = getattr(settings, 'MAX_PREVIEW_BATCH', 50)
+    if not job_ids or len(job_ids) > max_jobs:
+        return JsonResponse({
+            'success': False,
+            'error': f'Request previews for 1 to {max_jobs} jobs at a time.'
+        }, status=400)
+    
+    jobs = ConversionJob.objects.filter(id__in=job_ids)
+    previews = get_previews(jobs, source)
+    return JsonResponse({
+        'success': True,
+        'previews': {
+            str(job_id): f'/preview/{job_id}/?source={source}' if previews.get(job_id) else None
+            for job_id in job_ids
+        }
+    })
+
+def process_conversion(input_path, conversion_type, job_id, input_paths=None, stats=None, options=None):
+    """
+    Process file conversion based on type; details about the run are added to ``stats``.
+    
+    Inputs are storage names in the input storage; the result is stored in the
+    output storage and its storage name returned.
+    """
+    options = options or {}
+    output_dir = get_scratch_dir()
+    
+    with local_inputs(input_paths or [input_path]) as page_paths:
+        input_full_path = page_paths[0]
+        try:
+            if conversion_type == 'pdf_to_jpg':
+                # Pages are sized from their MediaBox; oversized ones are rendered at a lower DPI
+                peak_bytes, max_page_pixels = plan_pdf_to_jpg(input_full_path, **options)
+                options = {**options, 'max_page_pixels': max_page_pixels}
+            else:
+                # Header-only memory admission; oversized JPEGs get a decode pixel cap
+                peak_bytes, max_decode_pixels = plan_conversion(page_paths, conversion_type)
+                if max_decode_pixels:
+                    options = {**options, 'max_decode_pixels': max_decode_pixels}
+            if stats is not None:
+                stats['estimated_peak_bytes'] = peak_bytes
             
-            pdf_width = img_width * scale
-            pdf_height = img_height * scale
+            with reserve_memory(peak_bytes):
+                if conversion_type in ['jpg_to_pdf', 'png_to_pdf']:
+                    output_path = run_converter(convert_image_to_pdf, input_full_path, output_dir, job_id, stats=stats, **options)
+                elif conversion_type == 'images_to_pdf':
+                    output_path = run_converter(convert_images_to_pdf, page_paths, output_dir, job_id, stats=stats, **options)
+                elif conversion_type == 'resize_image':
+                    output_path = run_converter(resize_image, input_full_path, output_dir, job_id, stats=stats, **options)
+                elif conversion_type == 'compress_image':
+                    output_path = run_converter(compress_image, input_full_path, output_dir, job_id, stats=stats, **options)
+                elif conversion_type == 'pdf_to_jpg':
+                    # Fans pages out across the engine itself rather than running as one task
+                    output_path = convert_pdf_to_jpg(input_full_path, output_dir, job_id, stats=stats, **options)
+                else:
+                    raise ValueError(f"Unsupported conversion type: {conversion_type}")
+        except Exception as e:
+            logger.error(f"Conversion processing failed: {str(e)}")
+            raise
+    
+    return publish_output(output_path)
+
+def can_embed_jpeg(img, input_path):
+    """Check from the headers alone whether a JPEG can go into the PDF as-is"""
+    if img.format != 'JPEG' or img.mode not in ('RGB', 'L'):
+        return False
+    
+    # Baseline, extended or progressive 8-bit DCT only (no arithmetic/lossless coding)
+    try:
+        with open(input_path, 'rb') as f:
+            readJPEGInfo(f)
+    except Exception:
+        return False
+    
+    return True
+
+class EncodedJPEG(ImageReader):
+    """
+    JPEG bytes for ``Canvas.drawImage``, embedded as-is from memory.
+    
+    ReportLab names an ImageReader by hashing its decoded pixels; hashing the
+    encoded stream instead keeps the DCT data from ever being decoded.
+    """
+    
+    def __init__(self, buffer):
+        super().__init__(buffer)
+        with buffer.getbuffer() as view:
+            self._digest = hashlib.md5(view).digest()
+    
+    def getRGBData(self):
+        # Only used to name the image: the JPEG stream itself goes through jpeg_fh()
+        self._dataA = None
+        return self._digest
+
+def draw_image(c, placement, target_dpi=None, max_decode_pixels=None):
+    """Draw one image at its planned placement on the current page; returns the embed path used and the encoded size"""
+    # Pixels stay as stored; the page transform turns them upright
+    draw_size = displayed_size((placement.width, placement.height), placement.orientation)
+    with Image.open(placement.path) as img:
+        # Oversized JPEGs are decoded at 1/2, 1/4 or 1/8 scale when the page does not need
+        # every pixel or the full bitmap would not fit the memory budget
+        scale = 1
+        if img.format == 'JPEG':
+            if target_dpi:
+                scale = draft_scale(img.size, draw_size, target_dpi)
+            scale = decode_scale(img.size, max_decode_pixels, scale)
+        
+        # Fast path: embed the original DCT stream without decoding it
+        if scale == 1 and can_embed_jpeg(img, placement.path):
+            with open(placement.path, 'rb') as f:
+                encoded = BytesIO(f.read())
+            mode = 'passthrough'
+        else:
+            draft_decode(img, scale)
             
-            # Create PDF
-            c = canvas.Canvas(output_path, pagesize=(pdf_width, pdf_height))
+            # Convert to RGB if necessary
+            img = flatten_to_rgb(img)
             
-            # Use temporary file for image processing
-            with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-                temp_img_path = temp_file.name
-                
+            # Re-encode into memory; ReportLab copies the bytes into the page
+            encoded = BytesIO()
+            img.save(encoded, "JPEG", quality=95, optimize=True)
+            mode = 'draft' if scale > 1 else 'reencode'
+    
+    c.saveState()
+    if placement.clip:
+        # Fill mode: crop the overflow to the image's cell
+        clip = c.beginPath()
+        clip.rect(*placement.clip)
+        c.clipPath(clip, stroke=0, fill=0)
+    c.transform(*page_matrix(placement.orientation, placement.x, placement.y, placement.width, placement.height))
+    c.drawImage(EncodedJPEG(encoded), 0, 0, width=1, height=1)
+    c.restoreState()
+    with encoded.getbuffer() as view:
+        return mode, view.nbytes
+
+def convert_image_to_pdf(input_path, output_dir, job_id, stats=None, target_dpi=None, max_decode_pixels=None,
+                         page_size=None, orientation='auto', fit=None, margin_mm=None, per_page=1):
+    """Convert image to PDF"""
+    return convert_images_to_pdf(
+        [input_path], output_dir, job_id, stats=stats,
+        target_dpi=target_dpi, max_decode_pixels=max_decode_pixels,
+        page_size=page_size, orientation=orientation, fit=fit, margin_mm=margin_mm, per_page=per_page,
+    )
+
+def convert_images_to_pdf(input_paths, output_dir, job_id, stats=None, target_dpi=None, max_decode_pixels=None,
+                          page_size=None, orientation='auto', fit=None, margin_mm=None, per_page=1):
+    """Convert an ordered list of images into one multi-page PDF, one image in memory at a time"""
+    try:
+        output_filename = f"{job_id}_converted.pdf"
+        output_path = os.path.join(output_dir, output_filename)
+        
+        # Every page is laid out from the headers before any image is decoded
+        pages = plan_layout(
+            input_paths, page_size=page_size, orientation=orientation,
+            fit=fit, margin_mm=margin_mm, per_page=per_page,
+        )
+        
+        # Create PDF
+        c = canvas.Canvas(output_path)
+        embed_counts = {'passthrough': 0, 'reencode': 0, 'draft': 0}
+        image_number = 0
+        buffer_bytes = 0
+        
+        for page_number, page in enumerate(pages, start=1):
+            report_progress(job_id, 'page', page=page_number, pages=len(pages))
+            c.setPageSize(page.size)
+            for placement in page.placements:
+                image_number += 1
                 try:
-                    # Save image as JPEG for PDF embedding
-                    img.save(temp_img_path, "JPEG", quality=95, optimize=True)
-                    
-                    # Add image to PDF
-                    c.drawImage(temp_img_path, 0, 0, width=pdf_width, height=pdf_height)
-                    c.save()
-                    
-                finally:
-                    # Clean up temp file
-                    try:
-                        os.unlink(temp_img_path)
-                    except:
-                        pass
-            
-            logger.info(f"Successfully converted image to PDF: {output_path}")
-            return output_path
+                    mode, encoded_size = draw_image(c, placement, target_dpi=target_dpi, max_decode_pixels=max_decode_pixels)
+                    embed_counts[mode] += 1
+                    buffer_bytes += encoded_size
+                except Exception as e:
+                    if len(input_paths) > 1:
+                        raise Exception(f"image {image_number}: {str(e)}")
+                    raise
+            c.showPage()
+        
+        report_progress(job_id, 'encoding')
+        c.save()
+        
+        if stats is not None:
+            stats['pdf_pages'] = len(pages)
+            stats['passthrough_pages'] = embed_counts['passthrough']
+            stats['reencoded_pages'] = embed_counts['reencode'] + embed_counts['draft']
+            stats['draft_pages'] = embed_counts['draft']
+            # Bytes at the pipeline's own boundaries: every input is read once, pages
+            # are encoded into memory buffers and only the PDF is written
+            stats['io_read_bytes'] = sum(os.path.getsize(path) for path in input_paths)
+            stats['buffer_bytes'] = buffer_bytes
+            stats['io_write_bytes'] = os.path.getsize(output_path)
+        
+        logger.info(
+            f"Successfully converted {len(input_paths)} image(s) to a {len(pages)}-page PDF: {output_path} "
+            f"({embed_counts['passthrough']} passthrough, {embed_counts['reencode']} re-encoded, "
+            f"{embed_counts['draft']} draft-decoded)"
+        )
+        return output_path
             
     except Exception as e:
         logger.error(f"Image to PDF conversion failed: {str(e)}")
         raise Exception(f"Failed to convert image to PDF: {str(e)}")
 
-def resize_image(input_path, output_dir, job_id, max_size=(1920, 1080)):
+def encode_output(img, output_dir, job_id, suffix, output_format, preset=None, quality=None,
+                  subsampling=None, progressive=False, lossy=False, stats=None):
+    """Write ``img`` as ``output_format``; returns the path, the Pillow format, preset and encode seconds"""
+    image_format, extension = OUTPUT_FORMATS[output_format]
+    preset = preset or get_default_preset()
+    img = convert_for_alpha_format(img, image_format) if image_format in ALPHA_FORMATS else flatten_to_rgb(img)
+    
+    output_path = os.path.join(output_dir, f"{job_id}_{suffix}{extension}")
+    started = time.perf_counter()
+    if image_format == 'PNG' and preset != 'fast':
+        # Try palette and bit-depth reductions and several zlib settings, keep the smallest
+        optimize_png(img, output_path, preset, lossy=lossy, stats=stats)
+    else:
+        params = encoder_params(image_format, quality, preset, subsampling, progressive)
+        encode_image(img, output_path, image_format, params)
+    return output_path, image_format, preset, time.perf_counter() - started
+
+def resize_image(input_path, output_dir, job_id, max_size=(1920, 1080), output_format=None, preset=None,
+                 lossy=False, stats=None, max_decode_pixels=None):
     """Resize image while maintaining aspect ratio"""
     try:
         with Image.open(input_path) as img:
-            # Keep original format if possible
             original_format = img.format
             
-            # Create a copy and resize
-            img_copy = img.copy()
-            img_copy.thumbnail(max_size, Image.Resampling.LANCZOS)
+            if original_format == 'JPEG' and max_decode_pixels:
+                draft_decode(img, decode_scale(img.size, max_decode_pixels))
             
-            # Determine output format and filename
-            if original_format in ['JPEG', 'JPG']:
-                output_filename = f"{job_id}_resized.jpg"
-                save_format = "JPEG"
-                save_kwargs = {"quality": 90, "optimize": True}
-            elif original_format == 'PNG':
-                output_filename = f"{job_id}_resized.png"
-                save_format = "PNG"
-                save_kwargs = {"optimize": True}
-            else:
-                # Default to JPEG for other formats
-                output_filename = f"{job_id}_resized.jpg"
-                save_format = "JPEG"
-                if img_copy.mode in ('RGBA', 'LA', 'P'):
-                    img_copy = img_copy.convert('RGB')
-                save_kwargs = {"quality": 90, "optimize": True}
+            # Resize in place: thumbnail() drafts JPEGs to a reduced DCT scale before
+            # decoding, which a full copy() would defeat by loading every pixel first.
+            # EXIF orientation is applied to the reduced result only.
+            img = thumbnail_oriented(img, max_size, get_orientation(img), Image.Resampling.LANCZOS)
+            
+            # Keep original format if possible, JPEG for anything else
+            if not output_format:
+                output_format = 'png' if original_format == 'PNG' else 'jpeg'
             
-            output_path = os.path.join(output_dir, output_filename)
-            img_copy.save(output_path, save_format, **save_kwargs)
+            report_progress(job_id, 'encoding')
+            output_path, image_format, preset, seconds = encode_output(
+                img, output_dir, job_id, 'resized', output_format, preset,
+                quality=90 if output_format in LOSSY_FORMATS else None,
+                lossy=lossy, stats=stats,
+            )
+            record_encoding(stats, os.path.getsize(input_path), os.path.getsize(output_path), image_format, preset, seconds)
             
-            logger.info(f"Successfully resized image: {output_path}")
+            logger.info(f"Successfully resized image to {image_format} in {seconds:.2f}s: {output_path}")
             return output_path
             
     except Exception as e:
         logger.error(f"Image resize failed: {str(e)}")
         raise Exception(f"Failed to resize image: {str(e)}")
 
-def compress_image(input_path, output_dir, job_id, quality=75):
-    """Compress image to reduce file size"""
+def compress_image(input_path, output_dir, job_id, quality=None, target_size=None, subsampling=None,
+                   progressive=False, output_format=None, preset=None, stats=None, max_decode_pixels=None):
+    """
+    Compress image to reduce file size.
+    
+    With ``target_size`` (bytes) the highest quality that fits is searched
+    for in memory and only the chosen encoding is written.
+    """
     try:
         with Image.open(input_path) as img:
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                if 'transparency' in img.info:
-                    background.paste(img, mask=img.split()[-1])
-                else:
-                    background.paste(img)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
+            if img.format == 'JPEG' and max_decode_pixels:
+                draft_decode(img, decode_scale(img.size, max_decode_pixels))
             
-            output_filename = f"{job_id}_compressed.jpg"
-            output_path = os.path.join(output_dir, output_filename)
+            # No resize to fold it into, so a rotated photo costs one transpose
+            img = apply_orientation(img, get_orientation(img))
             
-            # Save with compression
-            img.save(output_path, "JPEG", quality=quality, optimize=True)
+            output_format = output_format or getattr(settings, 'COMPRESS_DEFAULT_FORMAT', 'jpeg')
+            report_progress(job_id, 'encoding')
             
-            logger.info(f"Successfully compressed image: {output_path}")
+            if target_size:
+                image_format, extension = OUTPUT_FORMATS[output_format]
+                preset = preset or get_default_preset()
+                if image_format in ALPHA_FORMATS:
+                    img = convert_for_alpha_format(img, image_format)
+                else:
+                    img = flatten_to_rgb(img)
+                img.load()
+                
+                started = time.perf_counter()
+                params = encoder_params(image_format, None, preset, subsampling, progressive)
+                quality, data, probes = probe_qualities(img, target_size, image_format, params)
+                seconds = time.perf_counter() - started
+                
+                output_path = os.path.join(output_dir, f"{job_id}_compressed{extension}")
+                with open(output_path, 'wb') as f:
+                    f.write(data)
+                if stats is not None:
+                    stats['target_size'] = target_size
+                    stats['target_met'] = len(data) <= target_size
+                    stats['quality_iterations'] = probes
+                if len(data) > target_size:
+                    logger.warning(f"Compressed image is {len(data)} bytes at the lowest quality, over the {target_size} byte target")
+            else:
+                quality = quality or getattr(settings, 'COMPRESS_DEFAULT_QUALITY', 75)
+                output_path, image_format, preset, seconds = encode_output(
+                    img, output_dir, job_id, 'compressed', output_format, preset,
+                    quality, subsampling, progressive,
+                )
+            
+            if stats is not None:
+                stats['quality'] = quality
+            record_encoding(stats, os.path.getsize(input_path), os.path.getsize(output_path), image_format, preset, seconds)
+            
+            logger.info(f"Successfully compressed image to {image_format} at quality {quality}: {output_path}")
             return output_path
             
     except Exception as e:
         logger.error(f"Image compression failed: {str(e)}")
         raise Exception(f"Failed to compress image: {str(e)}")
 
+def select_pages(input_path, pages=None):
+    """``(page_count, page_indexes)`` for a PDF and an optional page range"""
+    page_count = get_page_count(input_path)
+    page_indexes = parse_page_range(pages, page_count) if pages else list(range(page_count))
+    if not page_indexes:
+        raise ValueError("The PDF has no pages")
+    return page_count, page_indexes
+
+def plan_pdf_to_jpg(input_path, dpi=150, pages=None):
+    """Memory admission for rasterizing a PDF: ``(peak_bytes, max_page_pixels)`` from its page sizes"""
+    _, page_indexes = select_pages(input_path, pages)
+    engine = get_engine()
+    # Pages render on every engine worker at once
+    concurrency = min(len(page_indexes), engine.max_workers) if engine else 1
+    return plan_pdf_render(get_page_sizes(input_path, page_indexes), dpi, concurrency)
+
+def convert_pdf_to_jpg(input_path, output_dir, job_id, stats=None, dpi=150, pages=None, max_page_pixels=None):
+    """
+    Rasterize PDF pages to JPEG, one page per engine worker at a time.
+    
+    A single page is returned as a JPEG; several pages are streamed into a
+    ZIP in page order as they finish, so only the pages currently being
+    rendered are ever held as bitmaps. Pages over ``max_page_pixels`` at
+    ``dpi`` are rendered at the highest DPI that fits.
+    """
+    page_paths = []
+    output_path = None
+    try:
+        page_count, page_indexes = select_pages(input_path, pages)
+        
+        calls = []
+        for page_index in page_indexes:
+            page_path = os.path.join(output_dir, f"{job_id}_page{page_index + 1:04d}.jpg")
+            page_paths.append(page_path)
+            calls.append((input_path, page_index, page_path))
+        rendered = map_converter(render_page, calls, dpi=dpi, max_pixels=max_page_pixels)
+        
+        report_progress(job_id, 'page', page=1, pages=len(calls))
+        if len(calls) == 1:
+            output_path = os.path.join(output_dir, f"{job_id}_converted.jpg")
+            os.replace(next(rendered), output_path)
+        else:
+            output_path = os.path.join(output_dir, f"{job_id}_converted.zip")
+            # JPEG data does not deflate, so pages are stored as-is
+            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_STORED) as archive:
+                for position, (page_index, page_path) in enumerate(zip(page_indexes, rendered), start=1):
+                    archive.write(page_path, f"page-{page_index + 1:04d}.jpg")
+                    os.remove(page_path)
+                    if position < len(calls):
+                        report_progress(job_id, 'page', page=position + 1, pages=len(calls))
+        
+        if stats is not None:
+            stats['page_count'] = page_count
+            stats['rendered_pages'] = len(page_indexes)
+            stats['dpi'] = dpi
+        
+        logger.info(f"Successfully rendered {len(page_indexes)} of {page_count} PDF page(s) at {dpi} DPI: {output_path}")
+        return output_path
+    
+    except Exception as e:
+        logger.error(f"PDF to JPG conversion failed: {str(e)}")
+        if output_path and os.path.exists(output_path):
+            os.remove(output_path)
+        raise Exception(f"Failed to convert PDF to JPG: {str(e)}")
+    finally:
+        for page_path in page_paths:
+            if os.path.exists(page_path):
+                os.remove(page_path)
+
+@cached_page
 def privacy_policy(request):
     """Privacy Policy page"""
     return render(request, 'converter/privacy_policy.html', {
@@ -425,6 +1175,7 @@ def privacy_policy(request):
         'meta_description': 'Privacy Policy for jpg2pdf.link JPG to PDF converter. Learn how we protect your data during JPG to PDF conversion.',
     })
 
+@cached_page
 def terms_of_service(request):
     """Terms of Service page"""
     return render(request, 'converter/terms_of_service.html', {
@@ -575,117 +1326,30 @@ For support, contact us at support@jpg2pdf.link
             'error': 'An error occurred while sending your message. Please try again or contact us directly at support@jpg2pdf.link'
         }, status=500)
 
+@cached_page
 def robots_txt(request):
     """Serve robots.txt file"""
-    content = """# robots.txt for jpg2pdf.link
-# JPG to PDF Converter Website
-
-User-agent: *
-Allow: /
-
-# Allow all major search engines
-User-agent: Googlebot
-Allow: /
-
-User-agent: Bingbot
-Allow: /
-
-User-agent: Slurp
-Allow: /
-
-User-agent: DuckDuckBot
-Allow: /
-
-User-agent: Baiduspider
-Allow: /
-
-User-agent: YandexBot
-Allow: /
-
-User-agent: facebookexternalhit
-Allow: /
-
-# Disallow admin and sensitive areas
-Disallow: /admin/
-Disallow: /static/admin/
-Disallow: /media/uploads/
-Disallow: /media/converted/
-Disallow: /download/
-Disallow: /upload/
-Disallow: /status/
-
-# Disallow common technical files
-Disallow: /*.json$
-Disallow: /api/
-Disallow: /ajax/
-
-# Allow important pages and directories
-Allow: /static/css/
-Allow: /static/js/
-Allow: /static/images/
-Allow: /favicon.ico
-Allow: /apple-touch-icon.png
-Allow: /site.webmanifest
-
-# Security - Block sensitive file types
-Disallow: /*.sql$
-Disallow: /*.log$
-Disallow: /*.bak$
-Disallow: /*.conf$
-Disallow: /*.ini$
-
-# Block common attack vectors
-Disallow: /wp-admin/
-Disallow: /wp-login.php
-Disallow: /phpMyAdmin/
-Disallow: /.env
-Disallow: /.git/
-
-# Sitemap location
-Sitemap: {protocol}://{domain}/sitemap.xml
-
-# Crawl delay for polite crawling
-Crawl-delay: 1""".format(
+    content = ROBOTS_TXT.format(
         protocol='https' if request.is_secure() else 'http',
         domain=request.get_host()
     )
     
     return HttpResponse(content, content_type="text/plain")
 
-# Cleanup function to remove old files (can be called via management command)
-def cleanup_old_files():
-    """Remove files older than 24 hours"""
-    try:
-        from datetime import timedelta
-        cutoff_time = timezone.now() - timedelta(hours=24)
-        
-        old_jobs = ConversionJob.objects.filter(created_at__lt=cutoff_time)
-        
-        for job in old_jobs:
-            # Delete associated files
-            try:
-                if job.converted_filename:
-                    converted_path = os.path.join(settings.MEDIA_ROOT, 'converted', job.converted_filename)
-                    if os.path.exists(converted_path):
-                        os.remove(converted_path)
-                
-                # Delete uploaded file
-                upload_path = os.path.join(settings.MEDIA_ROOT, 'uploads', f"{job.id}_*")
-                import glob
-                for file_path in glob.glob(upload_path):
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        
-            except Exception as e:
-                logger.warning(f"Failed to delete files for job {job.id}: {str(e)}")
-            
-            # Delete job record
-            job.delete()
-        
-        logger.info(f"Cleaned up {old_jobs.count()} old conversion jobs")
-        
-    except Exception as e:
-        logger.error(f"Cleanup failed: {str(e)}")
+@require_http_methods(["GET", "HEAD"])
+def sitemap_xml(request):
+    """Serve the prebuilt sitemap, gzipped when the client accepts it"""
+    path, gz_path = get_sitemap(request.get_host())
+    accepts_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    
+    response = serve_file(request, gz_path if accepts_gzip else path, 'sitemap.xml', 'application/xml', as_attachment=False)
+    if accepts_gzip and response.status_code in (200, 206):
+        response['Content-Encoding'] = 'gzip'
+    if response.has_header('Content-Disposition'):
+        del response['Content-Disposition']
+    patch_vary_headers(response, ('Accept-Encoding',))
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'PAGE_CACHE_MAX_AGE', 3600))
+    return response
 
 # Error handler for development
 def handle_conversion_error(request, exception):
@@ -3,6 +3,9 @@ ASGI config for file_converter project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn file_converter.asgi:application``)
+so the /events/<job>/ progress streams hold no worker thread while idle.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -0,0 +1,17 @@
+"""
+Celery application for the file_converter project.
+
+Workers are started with ``celery -A file_converter worker`` and pick up
+conversion jobs queued by ``converter.tasks`` when
+``CONVERSION_QUEUE_BACKEND = 'celery'``.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'file_converter.settings')
+
+app = Celery('file_converter')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -147,10 +147,90 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 # File upload settings
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50MB per file, enforced while streaming
 FILE_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
-DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024   # 50MB
+DATA_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5MB of form fields; file data does not count
 FILE_UPLOAD_PERMISSIONS = 0o644
+MAX_BATCH_FILES = 100  # Images per merged PDF
+# Django's own file-count cap, kept above MAX_BATCH_FILES so the batch view can report the limit
+DATA_UPLOAD_MAX_NUMBER_FILES = MAX_BATCH_FILES + 10
+FILE_UPLOAD_HANDLERS = [
+    # Spools, hashes and sniffs uploads in one pass (see converter/uploadhandlers.py)
+    'converter.uploadhandlers.StreamingUploadHandler',
+]
 
+# Reuse converted files for identical uploads (see converter/result_cache.py)
+CONVERSION_CACHE_ENABLED = True
+
+# Default page resolution for image-to-PDF; oversized JPEGs are decoded at reduced
+# DCT scale down to this DPI. None keeps every source pixel. Uploads may pass target_dpi.
+PDF_DEFAULT_TARGET_DPI = None
+
+# Image-to-PDF page layout (see converter/page_layout.py). 'image' pages take each image's
+# size by its DPI; 'a4'/'letter' paper gets margins, a fit mode and optional N-up. Uploads
+# may pass page_size, orientation ('auto', 'portrait', 'landscape'), fit, margin_mm and per_page.
+PDF_DEFAULT_PAGE_SIZE = 'image'
+PDF_DEFAULT_FIT = 'fit'  # 'fit', 'fill' or 'original'
+PDF_DEFAULT_MARGIN_MM = 10
+PDF_DEFAULT_IMAGE_DPI = 72  # Assumed for images without DPI metadata
+
+# PDF to JPG rendering (needs pypdfium2 or PyMuPDF); uploads may pass dpi and pages
+PDF_TO_JPG_DEFAULT_DPI = 150
+PDF_TO_JPG_MAX_DPI = 300
+
+# Image compression (see converter/compression.py); uploads may pass quality or target_kb,
+# plus subsampling ('4:4:4', '4:2:2', '4:2:0') and progressive. Resize and compress uploads
+# may also pass output_format ('jpeg', 'png', 'webp', 'avif') and preset ('fast', 'balanced', 'max').
+COMPRESS_DEFAULT_QUALITY = 75
+COMPRESS_MIN_QUALITY = 10
+COMPRESS_MAX_QUALITY = 95
+COMPRESS_SEARCH_THREADS = min(3, os.cpu_count() or 1)
+COMPRESS_DEFAULT_FORMAT = 'jpeg'
+ENCODER_DEFAULT_PRESET = 'balanced'
+
+# PNG outputs at the balanced/max presets try palette and bit-depth reductions and several
+# zlib settings (see converter/png_optimize.py); resize uploads may pass lossy to quantize
+PNG_OPTIMIZE_TIME_BUDGET = 2.0
+PNG_OPTIMIZE_THREADS = min(2, os.cpu_count() or 1)
+
+# Upload/result previews (see converter/previews.py)
+PREVIEW_MAX_SIZE = (320, 320)
+PREVIEW_FORMAT = 'WEBP'
+PREVIEW_CACHE_MAX_BYTES = 100 * 1024 * 1024
+MAX_PREVIEW_BATCH = 50
+
+# Progress events pushed over /events/<job>/ (see converter/progress.py)
+PROGRESS_POLL_INTERVAL = 2  # Seconds between shared-cache checks and keep-alives
+PROGRESS_STREAM_TIMEOUT = 300  # Seconds before a stream closes and the browser reconnects
+
+# Rendered-page cache for robots.txt and the legal pages (see converter/page_cache.py)
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_ALIAS = 'default'
+PAGE_CACHE_TIMEOUT = 60 * 60
+PAGE_CACHE_MAX_AGE = 60 * 60
+
+# Memory admission (see converter/memory_guard.py)
+CONVERSION_MAX_IMAGE_PIXELS = 100_000_000  # Decompression-bomb limit
+CONVERSION_JOB_MEMORY_BUDGET = 512 * 1024 * 1024  # Peak bytes for one conversion
+CONVERSION_TOTAL_MEMORY_BUDGET = 1536 * 1024 * 1024  # Bytes across concurrent conversions
+CONVERSION_MEMORY_WAIT_TIMEOUT = 60  # Seconds a queued conversion waits for memory
+
+
+# Conversion storage (see converter/storage.py). Uploads use the 'default' storage; converted
+# files use the STORAGES alias below, e.g. an S3-compatible bucket via django-storages:
+#     STORAGES['conversions'] = {'BACKEND': 'storages.backends.s3.S3Storage',
+#                                'OPTIONS': {'bucket_name': 'conversions', 'endpoint_url': 'http://minio:9000'}}
+# Remote storages are read and written through CONVERSION_SCRATCH_DIR (a tmpfs such as
+# /dev/shm works well); left unset, local outputs are written in place.
+CONVERSION_STORAGE = os.environ.get('CONVERSION_STORAGE', 'default')
+CONVERSION_SCRATCH_DIR = os.environ.get('CONVERSION_SCRATCH_DIR') or None
+
+
+# Download offload: None (stream from Django), 'nginx' (X-Accel-Redirect) or 'sendfile' (X-Sendfile).
+# For nginx, map the prefix to MEDIA_ROOT with an internal location:
+#     location /protected-media/ { internal; alias /path/to/media/; }
+DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD') or None
+DOWNLOAD_OFFLOAD_URL_PREFIX = '/protected-media/'
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
@@ -166,6 +246,18 @@ CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+
+# Conversion queue: 'celery', 'thread' (in-process), 'db' (run_conversion_worker) or 'sync'
+CONVERSION_QUEUE_BACKEND = os.environ.get('CONVERSION_QUEUE_BACKEND', 'thread')
+CONVERSION_QUEUE_WORKERS = 2
+CONVERSION_STALE_JOB_AGE = 30 * 60  # Seconds before the thread backend reclaims jobs a stopped process left
+
+# Conversion engine: converters run in a pool of worker processes (0 = inline)
+CONVERSION_ENGINE_WORKERS = int(os.environ.get('CONVERSION_ENGINE_WORKERS', 2))
+CONVERSION_ENGINE_MAX_QUEUE = 8  # Jobs admitted to wait for a busy pool before uploads get 503
+CONVERSION_ENGINE_TASK_TIMEOUT = 120  # Seconds a task may run once a worker starts it
+CONVERSION_ENGINE_MAX_TASKS_PER_CHILD = 50  # Recycle workers to release Pillow memory
+CONVERSION_ENGINE_RETRY_AFTER = 5  # Seconds, sent with 503 responses
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -220,7 +312,8 @@ LOGGING = {
 
 # Add these sitemap settings
 SITEMAP_USE_HTTPS = True  # Set to False for development
-SITEMAP_PING_GOOGLE = True  # Automatically ping Google when sitemap changes
+# Prebuilt sitemap.xml(.gz) per host go to SITEMAP_ROOT (default MEDIA_ROOT/sitemap), see converter/sitemaps.py
+SITE_DOMAIN = 'jpg2pdf.link'  # Host update_sitemap builds the sitemap for
 
 # Cache settings for sitemap (optional but recommended)
 CACHES = {
@@ -3,15 +3,13 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from django.contrib.sitemaps.views import sitemap
-from converter.sitemaps import sitemaps
+from converter.views import sitemap_xml
 from django.conf.urls.i18n import i18n_patterns
 
 # Non-translated URLs (sitemap, language switcher)
 urlpatterns = [
     path('i18n/', include('django.conf.urls.i18n')),
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, 
-         name='django.contrib.sitemaps.views.sitemap'),
+    path('sitemap.xml', sitemap_xml, name='sitemap_xml'),
 ]
 
 # Translated URLs with language prefix